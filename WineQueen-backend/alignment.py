@@ -0,0 +1,366 @@
+"""ALIGNING 단계의 X축 정렬 제어기.
+
+오차(error_px) = 병 중심 - 카메라 중심. 음수면 'R', 양수면 'L' 방향으로 이동한다.
+아두이노는 'L'/'R' 한 글자당 3*16 마이크로스텝씩 목표 위치를 누적 이동한다.
+
+- BangBangController     : 기존 방식 (0.3s마다 1스텝, ±3px 데드존, 0.5s 유지 후 정렬 완료)
+- ProportionalController : 오차에 비례한 스텝 수 + 캡처→명령 지연 동안 아직 반영되지 않은
+                           (in-flight) 명령만큼 오차를 미리 빼서 과도 이동(overshoot)을 줄임
+
+    python alignment.py check   # 연속 명령의 in-flight 계산 + 가상 스테이지 폐루프 점검
+"""
+from collections import deque
+from typing import List, NamedTuple
+
+
+class Decision(NamedTuple):
+    commands: List[str]   # 이번에 보낼 시리얼 명령들 (예: ['L', 'L'])
+    aligned: bool         # 정렬 완료 (C 전송 시점)
+
+
+class AlignmentSession:
+    """정렬 1회 기록 (time-to-align, 명령 수, overshoot)."""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.finished = None
+        self.result = None       # 'aligned' | 'aborted'
+        self.commands = 0        # 전송한 시리얼 명령 수
+        self.steps = 0           # 총 스텝 수
+        self.overshoots = 0      # 데드존 밖의 오차가 반대 부호로 넘어간 횟수 (데드존 안으로 넘어간 경우 포함)
+        self.latency_ms = 0.0    # 평균 캡처→명령 지연
+        self._last_sign = 0
+        self._latency_n = 0
+
+    def to_dict(self):
+        return {
+            "started": self.started,
+            "result": self.result,
+            "time_to_align_s": None if self.finished is None else round(self.finished - self.started, 3),
+            "commands": self.commands,
+            "steps": self.steps,
+            "overshoots": self.overshoots,
+            "latency_ms": round(self.latency_ms, 1),
+        }
+
+
+class AlignmentController:
+    """정렬 제어기 공통 부분: 세션 기록/통계."""
+    name = "base"
+    time_params = ()   # 시간(s) 단위 파라미터 (make_controller의 speed로 나눔)
+
+    def __init__(self, deadzone_px: float = 3.0, history: int = 50):
+        self.deadzone_px = deadzone_px
+        self.session = None
+        self.sessions = deque(maxlen=history)
+
+    @property
+    def active(self):
+        return self.session is not None
+
+    def start(self, now: float):
+        self.session = AlignmentSession(now)
+
+    def finish(self, now: float, result: str):
+        if self.session is None:
+            return None
+        self.session.finished = now
+        self.session.result = result
+        done, self.session = self.session, None
+        self.sessions.append(done)
+        return done
+
+    def _record(self, error_px: float, steps: int, latency_s: float):
+        s = self.session
+        sign = (error_px > 0) - (error_px < 0)
+        outside = abs(error_px) > self.deadzone_px
+        if sign and s._last_sign and sign != s._last_sign:
+            s.overshoots += 1
+            # 데드존 안에서 넘어간 경우는 한 번만 (다음 기준은 데드존 밖 측정값)
+            s._last_sign = sign if outside else 0
+        elif outside:
+            s._last_sign = sign
+        if steps:
+            s.commands += 1
+            s.steps += abs(steps)
+            s._latency_n += 1
+            s.latency_ms += (latency_s * 1000 - s.latency_ms) / s._latency_n
+
+    def update(self, error_px: float, captured_ts: float, now: float) -> Decision:
+        """captured_ts 프레임의 실제 감지 오차로 이번에 보낼 명령을 정함."""
+        raise NotImplementedError
+
+    def stats(self):
+        done = [s for s in self.sessions if s.result == "aligned"]
+        times = sorted(s.finished - s.started for s in done)
+        return {
+            "controller": self.name,
+            "sessions": len(self.sessions),
+            "aligned": len(done),
+            "time_to_align_p50_s": round(times[len(times) // 2], 3) if times else None,
+            "commands_mean": round(sum(s.commands for s in done) / len(done), 1) if done else None,
+            "overshoots_mean": round(sum(s.overshoots for s in done) / len(done), 2) if done else None,
+            "recent": [s.to_dict() for s in list(self.sessions)[-10:]],
+        }
+
+    @staticmethod
+    def _commands(steps: int) -> List[str]:
+        return ['R' if steps < 0 else 'L'] * abs(steps)
+
+
+class BangBangController(AlignmentController):
+    """기존 정렬 로직: command_interval마다 1스텝, 데드존 안에서 settle_time 유지 시 완료."""
+    name = "bangbang"
+    time_params = ("command_interval", "settle_time")
+
+    def __init__(self, deadzone_px: float = 3.0, command_interval: float = 0.3, settle_time: float = 0.5):
+        super().__init__(deadzone_px)
+        self.command_interval = command_interval
+        self.settle_time = settle_time
+        self._last_cmd = 0.0
+        self._in_zone_since = 0.0
+
+    def start(self, now: float):
+        super().start(now)
+        self._last_cmd = 0.0
+        self._in_zone_since = 0.0
+
+    def update(self, error_px, captured_ts, now):
+        if self.session is None:
+            self.start(now)
+        if now - self._last_cmd < self.command_interval:
+            return Decision([], False)
+        self._last_cmd = now
+        if abs(error_px) <= self.deadzone_px:
+            self._record(error_px, 0, 0.0)
+            if not self._in_zone_since:
+                self._in_zone_since = now
+            elif now - self._in_zone_since >= self.settle_time:
+                return Decision([], True)
+            return Decision([], False)
+        self._in_zone_since = 0.0
+        steps = -1 if error_px < 0 else 1
+        self._record(error_px, steps, now - captured_ts)
+        return Decision(self._commands(steps), False)
+
+
+class ProportionalController(AlignmentController):
+    """오차 비례 스텝 + 지연 보상 제어기.
+
+    kp            : 비례 이득 (1.0이면 예측 오차를 한 번에 모두 보정)
+    px_per_step   : 1스텝당 화면상 이동 픽셀 (초기값, learn_rate > 0이면 온라인 추정)
+    step_time     : 1스텝 이동에 걸리는 시간(s). 이 시간 안에 캡처된 프레임에는 명령이 덜 반영됨
+    max_steps     : 한 번에 보낼 최대 스텝 수
+    min_interval  : 명령 사이 최소 간격(s)
+    settle_time   : 데드존 안에서 이 시간 동안 유지되면 정렬 완료
+
+    측정 오차가 데드존 안이면 명령을 보내지 않는다. in-flight 명령이 남아 있으면 끝날 때까지 기다린 뒤
+    settle_time을 센다 (남은 이동만큼 예측 오차가 데드존 밖으로 나가도 추가 명령 없음).
+    """
+    name = "proportional"
+    time_params = ("step_time", "min_interval", "settle_time")
+
+    def __init__(self, deadzone_px: float = 3.0, kp: float = 0.8, px_per_step: float = 6.0,
+                 step_time: float = 0.12, max_steps: int = 8, min_interval: float = 0.1,
+                 settle_time: float = 0.3, learn_rate: float = 0.2):
+        super().__init__(deadzone_px)
+        self.kp = kp
+        self.px_per_step = px_per_step
+        self.step_time = step_time
+        self.max_steps = max_steps
+        self.min_interval = min_interval
+        self.settle_time = settle_time
+        self.learn_rate = learn_rate
+        self._issued = deque()   # (start_at, steps, done_at) 앞선 명령이 끝난 뒤 start_at부터 이동
+        self._last_cmd = 0.0
+        self._in_zone_since = 0.0
+        self._anchor = None      # (error_px, steps_total) 명령이 모두 반영된 시점의 측정값
+        self._steps_total = 0
+        self.latency_ema = 0.0
+
+    def start(self, now: float):
+        super().start(now)
+        self._issued.clear()
+        self._last_cmd = 0.0
+        self._in_zone_since = 0.0
+        self._anchor = None
+        self._steps_total = 0
+
+    def _pending_px(self, captured_ts: float) -> float:
+        """captured_ts 프레임에 아직 반영되지 않은 이동량(px, 오차 부호 기준)."""
+        pending = 0.0
+        for start_at, steps, done_at in self._issued:
+            if done_at <= captured_ts:
+                continue
+            # 실제로 움직이는 구간 [start_at, done_at]에서만 보간 (앞 명령 뒤에 대기 중이면 전부 남음)
+            remaining = min(1.0, (done_at - captured_ts) / max(done_at - start_at, 1e-6))
+            pending += steps * self.px_per_step * remaining
+        return pending
+
+    def _learn(self, error_px: float, captured_ts: float):
+        """모든 명령이 반영된 프레임끼리 비교해 px_per_step를 추정."""
+        while self._issued and self._issued[0][2] <= captured_ts:
+            self._issued.popleft()
+        if self._issued:
+            return
+        if self._anchor is not None and self.learn_rate > 0:
+            prev_err, prev_steps = self._anchor
+            moved_steps = self._steps_total - prev_steps
+            if moved_steps:
+                observed = (prev_err - error_px) / moved_steps
+                if 0.5 * self.px_per_step < observed < 2.0 * self.px_per_step:
+                    self.px_per_step += self.learn_rate * (observed - self.px_per_step)
+        self._anchor = (error_px, self._steps_total)
+
+    def update(self, error_px, captured_ts, now):
+        if self.session is None:
+            self.start(now)
+        self._learn(error_px, captured_ts)
+
+        if abs(error_px) <= self.deadzone_px:
+            self._record(error_px, 0, 0.0)
+            if self._issued:
+                # 아직 움직이는 중: 이동이 끝날 때까지 대기
+                self._in_zone_since = 0.0
+                return Decision([], False)
+            if not self._in_zone_since:
+                self._in_zone_since = now
+            elif now - self._in_zone_since >= self.settle_time:
+                return Decision([], True)
+            return Decision([], False)
+        self._in_zone_since = 0.0
+
+        predicted = error_px - self._pending_px(captured_ts)
+        if abs(predicted) <= self.deadzone_px or now - self._last_cmd < self.min_interval:
+            self._record(error_px, 0, 0.0)
+            return Decision([], False)
+        steps = int(round(self.kp * predicted / self.px_per_step))
+        steps = max(-self.max_steps, min(self.max_steps, steps))
+        if steps == 0:
+            steps = 1 if predicted > 0 else -1
+        # 앞선 명령이 끝난 뒤 이어서 움직이므로 완료 시각은 누적
+        start_at = max(now, self._issued[-1][2] if self._issued else now)
+        self._issued.append((start_at, steps, start_at + abs(steps) * self.step_time))
+        self._steps_total += steps
+        self._last_cmd = now
+        latency = now - captured_ts
+        self.latency_ema = latency if not self.latency_ema else 0.8 * self.latency_ema + 0.2 * latency
+        self._record(error_px, steps, latency)
+        return Decision(self._commands(steps), False)
+
+    def stats(self):
+        out = super().stats()
+        out.update({"kp": self.kp, "px_per_step": round(self.px_per_step, 2),
+                    "latency_ema_ms": round(self.latency_ema * 1000, 1)})
+        return out
+
+
+CONTROLLERS = {"bangbang": BangBangController, "proportional": ProportionalController}
+
+
+def make_controller(name: str, speed: float = 1.0, **params) -> AlignmentController:
+    """speed: 플랜트 시간 배율 (시뮬레이션 배속). 스테이지가 speed배 빨리 움직이면 제어기의 시간 파라미터도
+    1/speed로 줄여야 같은 제어 루프가 된다 (안 줄이면 settle/간격이 상대적으로 길어져 limit cycle)."""
+    try:
+        controller = CONTROLLERS[name](**params)
+    except KeyError:
+        raise ValueError(f"unknown alignment controller '{name}' (choose from {list(CONTROLLERS)})")
+    if speed > 0 and speed != 1:
+        for attr in controller.time_params:
+            setattr(controller, attr, getattr(controller, attr) / speed)
+    return controller
+
+
+# =========================
+# 자체 점검 (python alignment.py check)
+# =========================
+class _VirtualStage:
+    """SimWorld와 같은 플랜트를 가상 시계로: 명령은 누적 목표가 되고 일정 속도로 따라감."""
+
+    def __init__(self, error_px: float, px_per_step: float, step_time: float):
+        self.error = self.target = error_px
+        self.speed = px_per_step / step_time
+        self.px_per_step = px_per_step
+
+    def advance(self, dt: float):
+        delta = self.target - self.error
+        self.error += max(-self.speed * dt, min(self.speed * dt, delta))
+
+    def move(self, commands: List[str]):
+        for c in commands:
+            self.target += -self.px_per_step if c == 'L' else self.px_per_step
+
+
+def _closed_loop(controller, error_px: float, px_per_step=6.0, step_time=0.12, fps=30.0, latency=0.05,
+                 timeout=10.0):
+    """가상 스테이지로 정렬 1회. (정렬 여부, 명령 목록 [(t, error, steps)], 끝 오차)."""
+    stage = _VirtualStage(error_px, px_per_step, step_time)
+    frames, log, t, dt = [], [], 0.0, 0.001
+    next_frame = 0.0
+    while t < timeout:
+        stage.advance(dt)
+        t += dt
+        if t >= next_frame:
+            frames.append((t, stage.error))
+            next_frame += 1.0 / fps
+        while frames and frames[0][0] + latency <= t:
+            captured_ts, measured = frames.pop(0)
+            decision = controller.update(measured, captured_ts, t)
+            if decision.commands:
+                stage.move(decision.commands)
+                steps = len(decision.commands) * (1 if decision.commands[0] == 'L' else -1)
+                log.append((round(t, 3), round(measured, 1), steps))
+            if decision.aligned:
+                controller.finish(t, "aligned")
+                return True, log, stage.error
+    return False, log, stage.error
+
+
+def check():
+    failures = []
+
+    # 1. 연달아 보낸 명령: 두 번째 명령은 첫 명령이 끝난 뒤부터 움직이므로 그 전까지는 전부 남아 있어야 함
+    c = ProportionalController(kp=1.0, px_per_step=6.0, step_time=0.1, max_steps=8, min_interval=0.0, learn_rate=0.0)
+    c.update(80.0, 0.0, 0.0)      # +8 steps: 0.0 ~ 0.8s
+    c.update(80.0, 0.0, 0.05)     # 아직 반영 전 프레임 → 예측 32px → +5 steps: 0.8 ~ 1.3s
+    expected = (0.8 - 0.4) / 0.8 * 48 + 30
+    got = c._pending_px(0.4)
+    print(f"[CHECK] back-to-back pending at t=0.4: {got:.1f}px (expected {expected:.1f}px)")
+    if abs(got - expected) > 1e-6:
+        failures.append("back-to-back pending")
+
+    # 2. 가상 스테이지 폐루프: 목표를 넘어 과도 이동하거나 반대 방향 명령을 보내지 않아야 함
+    #    (speed배 빠른 스테이지에는 make_controller(speed=...)로 시간 파라미터를 맞춘 제어기)
+    for speed in (1.0, 10.0):
+        for error_px in (-80.0, -40.0, -16.0, 16.0, 40.0, 80.0):
+            c = make_controller("proportional", speed=speed)
+            aligned, log, final = _closed_loop(c, error_px, step_time=0.12 / speed, fps=30.0 * speed,
+                                               latency=0.05 / speed, timeout=10.0 / speed)
+            failures += _check_loop(c, error_px, speed, aligned, log, final)
+    print("[CHECK] OK" if not failures else f"[CHECK] FAIL: {failures}")
+    return 0 if not failures else 1
+
+
+def _check_loop(c, error_px, speed, aligned, log, final):
+    failures = []
+    moved = sum(steps for _, _, steps in log) * 6.0
+    # 'L'(+)은 양의 오차를 줄임: 측정 오차와 부호가 반대인 명령은 반대 방향
+    wrong = [entry for entry in log if entry[2] * entry[1] < 0 and abs(entry[1]) > c.deadzone_px]
+    print(f"[CHECK] x{speed:g} error={error_px:+.0f}px aligned={aligned} final={final:+.1f}px moved={moved:.0f}px "
+          f"commands={log}")
+    name = f"closed loop x{speed:g} {error_px:+.0f}"
+    if not aligned or abs(final) > c.deadzone_px:
+        failures.append(f"{name}: not aligned")
+    # 스텝 양자화(6px) 때문에 데드존 안 반대편에 멈추는 것은 허용, 한 스텝 이상 더 가면 과도 이동
+    if abs(moved) > abs(error_px) + c.deadzone_px:
+        failures.append(f"{name}: overshoot {moved:.0f}px")
+    if wrong:
+        failures.append(f"{name}: wrong-direction commands {wrong}")
+    return failures
+
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] != ["check"]:
+        sys.exit("usage: python alignment.py check")
+    sys.exit(check())
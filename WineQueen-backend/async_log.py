@@ -0,0 +1,127 @@
+"""비동기 구조화 로그.
+
+detection_loop / 시리얼 리더 같은 핫패스에서 print()를 직접 부르면 stdout(journald, 느린 콘솔)이
+막힐 때 그 스레드도 같이 멈춘다. 여기서는 호출 스레드가 (시각, 레벨, 태그, 메시지, 필드)를
+제한 크기 큐에 넣기만 하고, 백그라운드 writer 스레드가 모아서 한 번에 쓴다.
+
+- 큐가 가득 차면 버리고 dropped로 센다 (호출 스레드는 절대 블록되지 않음)
+- 태그별 토큰 버킷(rate_per_s, burst)으로 반복 메시지를 제한, 버려진 수는 다음 통과 메시지에 suppressed=N으로 붙음
+  (level이 warning/error면 제한하지 않음)
+- 출력 형식: text → "[TAG][unit] 메시지 key=value", json → 한 줄에 JSON 1개 (WINEQUEEN_LOG_FORMAT)
+"""
+import json
+import sys
+import threading
+import time
+from queue import Empty, Full, Queue
+
+UNLIMITED_LEVELS = ("warning", "error")
+
+
+def print_log(tag: str, msg: str, level: str = "info", **fields) -> bool:
+    """log 콜러블을 받지 않은 컴포넌트(단독 실행/벤치)의 기본값: text 형식으로 바로 출력."""
+    extra = " ".join(f"{k}={v}" for k, v in fields.items())
+    print(f"[{tag}] {msg}{' ' + extra if extra else ''}")
+    return True
+
+
+class AsyncLogger:
+    def __init__(self, stream=None, fmt: str = "text", maxsize: int = 4096, rate_per_s: float = 20.0,
+                 burst: float = 40.0, metrics=None):
+        self.stream = stream
+        self.fmt = fmt
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self.metrics = metrics
+        self.dropped = 0
+        self.suppressed = 0
+        self.written = 0
+        self._queue = Queue(maxsize=maxsize)
+        self._buckets = {}  # tag -> [tokens, last_ts, suppressed]
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    # ---------- 호출 스레드 ----------
+    def log(self, tag: str, msg: str, level: str = "info", **fields) -> bool:
+        """큐에 넣기만 하고 바로 반환. 제한/드롭되면 False."""
+        if level not in UNLIMITED_LEVELS:
+            now = time.monotonic()
+            with self._lock:
+                bucket = self._buckets.get(tag)
+                if bucket is None:
+                    bucket = self._buckets[tag] = [self.burst, now, 0]
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate_per_s)
+                bucket[1] = now
+                if bucket[0] < 1.0:
+                    bucket[2] += 1
+                    self.suppressed += 1
+                    if self.metrics is not None:
+                        self.metrics.inc("log_suppressed")
+                    return False
+                bucket[0] -= 1.0
+                suppressed, bucket[2] = bucket[2], 0
+            if suppressed:
+                fields["suppressed"] = suppressed
+        try:
+            self._queue.put_nowait((time.time(), level, tag, msg, fields))
+        except Full:
+            self.dropped += 1
+            if self.metrics is not None:
+                self.metrics.inc("log_dropped")
+            return False
+        return True
+
+    # ---------- writer 스레드 ----------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0):
+        """남은 로그를 쓰고 writer를 멈춤."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def format(self, record) -> str:
+        ts, level, tag, msg, fields = record
+        if self.fmt == "json":
+            return json.dumps({"ts": round(ts, 3), "level": level, "tag": tag, "msg": msg, **fields},
+                              ensure_ascii=False, default=str)
+        unit = fields.get("unit")
+        extra = " ".join(f"{k}={v}" for k, v in fields.items() if k != "unit")
+        return f"[{tag}]{f'[{unit}]' if unit else ''} {msg}{' ' + extra if extra else ''}"
+
+    def _drain(self, first):
+        lines = [self.format(first)]
+        while len(lines) < 256:
+            try:
+                lines.append(self.format(self._queue.get_nowait()))
+            except Empty:
+                break
+        stream = self.stream or sys.stdout
+        try:
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+        self.written += len(lines)
+
+    def _loop(self):
+        while True:
+            try:
+                record = self._queue.get(timeout=0.2)
+            except Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            self._drain(record)
+
+    def stats(self):
+        return {"format": self.fmt, "queued": self._queue.qsize(), "written": self.written,
+                "dropped": self.dropped, "suppressed": self.suppressed,
+                "rate_per_s": self.rate_per_s, "burst": self.burst}
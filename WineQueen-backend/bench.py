@@ -0,0 +1,338 @@
+"""엔드투엔드 파이프라인 벤치마크.
+
+녹화 영상(또는 이미지 폴더/합성 장면)을 실제 백엔드 파이프라인(main.py)에 흘려 보내고
+/video_feed, /ws 클라이언트를 붙인 상태에서 단계별 지연과 처리량을 측정해 JSON 리포트로 저장한다.
+
+    python bench.py run --source video:clip.mp4 --duration 30 --streams 1 --ws 1 --out report.json
+    python bench.py compare old.json new.json
+
+추론 백엔드/모드는 평소처럼 WINEQUEEN_INFER_BACKEND, WINEQUEEN_INFER_INT8, WINEQUEEN_INFER_MODE로 지정.
+시리얼은 가상 아두이노(WINEQUEEN_SERIAL=sim)를 사용한다.
+--units N이면 같은 소스로 유닛 N개를 띄우고(공유 배치 추론) 클라이언트를 유닛별로 나눠 붙인다.
+유닛 수만 바꾼 리포트를 compare하면 유닛 추가당 CPU/RSS 증가분을 볼 수 있다.
+
+합성 장면(synthetic)은 그대로 두면 병이 멈춰 있어 '변화 없음' 재인코딩 생략에 모든 프레임이 걸리므로,
+측정 중에는 병을 위아래로 계속 움직인다 (--static-scene이면 정지 화면 그대로).
+스트림 클라이언트는 keepalive 재전송(직전과 같은 JPEG)을 실제 프레임과 따로 센다.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+from metrics import process_usage
+
+try:
+    from websockets.sync.client import connect as ws_connect
+except ImportError:
+    ws_connect = None
+
+
+# =========================
+# 부하 클라이언트
+# =========================
+class StreamClient(threading.Thread):
+    """/video_feed를 계속 읽으며 받은 프레임 수를 센다 (직전과 같은 JPEG = keepalive 재전송은 따로)."""
+
+    def __init__(self, url, stop):
+        super().__init__(daemon=True)
+        self.url = url
+        self.stop = stop
+        self.frames = 0
+        self.keepalives = 0
+        self.bytes = 0
+        self.error = None
+
+    def run(self):
+        buf = bytearray()
+        last = None
+        try:
+            with urllib.request.urlopen(self.url, timeout=5) as resp:
+                while not self.stop.is_set():
+                    chunk = resp.read1(65536)
+                    if not chunk:
+                        break
+                    self.bytes += len(chunk)
+                    buf += chunk
+                    # 조각: --frame / 헤더(Content-Length) / 빈 줄 / JPEG
+                    while True:
+                        head_end = buf.find(b"\r\n\r\n")
+                        if head_end < 0:
+                            break
+                        length = None
+                        for line in bytes(buf[:head_end]).split(b"\r\n"):
+                            if line.lower().startswith(b"content-length:"):
+                                length = int(line.split(b":", 1)[1])
+                        if length is None:
+                            raise ValueError("MJPEG part without Content-Length")
+                        end = head_end + 4 + length
+                        if len(buf) < end:
+                            break
+                        body = bytes(buf[head_end + 4:end])
+                        del buf[:end + 2]  # 본문 뒤 \r\n
+                        if body == last:
+                            self.keepalives += 1
+                        else:
+                            self.frames += 1
+                            last = body
+        except Exception as e:
+            if not self.stop.is_set():
+                self.error = str(e)
+
+
+class WSClient(threading.Thread):
+    """/ws에 붙어 받은 메시지 수를 센다."""
+
+    def __init__(self, url, stop):
+        super().__init__(daemon=True)
+        self.url = url
+        self.stop = stop
+        self.messages = 0
+        self.error = None
+
+    def run(self):
+        try:
+            with ws_connect(self.url) as ws:
+                while not self.stop.is_set():
+                    try:
+                        ws.recv(timeout=0.5)
+                    except TimeoutError:
+                        continue
+                    self.messages += 1
+        except Exception as e:
+            if not self.stop.is_set():
+                self.error = str(e)
+
+
+# =========================
+# 실행
+# =========================
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _rate(n, seconds):
+    return round(n / seconds, 2) if seconds > 0 else None
+
+
+def _totals(main):
+    """모든 유닛의 링/스트림/WS 누적값 합계 (+ 스트림 재인코딩 생략 카운터)."""
+    units = main.units.values()
+    counters = main.pipeline_metrics.counters
+    return {
+        "captured": sum(u.frame_ring.stats()["seq"] for u in units),
+        "ring_dropped": sum(u.frame_ring.stats()["dropped"] for u in units),
+        "published": sum(u.frame_hub.seq for u in units),
+        "stream_dropped": sum(u.frame_hub.dropped for u in units),
+        "ws_evicted": sum(u.ws_hub.evicted for u in units),
+        "stream_unchanged_skips": counters.get("stream_unchanged_skips", 0),
+        "stream_fps_skips": counters.get("stream_fps_skips", 0),
+    }
+
+
+class SceneMover(threading.Thread):
+    """합성 장면의 병을 ±max_offset 사이에서 계속 왕복시킴 (스테퍼 속도로 1스텝씩)."""
+
+    def __init__(self, worlds, stop):
+        super().__init__(daemon=True)
+        self.worlds = worlds
+        self.stop = stop
+
+    def run(self):
+        direction = {id(world): 1 for world in self.worlds}
+        while not self.stop.is_set():
+            for world in self.worlds:
+                if abs(world.error) >= world.max_offset:
+                    direction[id(world)] = -1 if world.error > 0 else 1
+                world.move_steps(direction[id(world)])
+            world = self.worlds[0]
+            time.sleep(world.step_time / world.speed)
+
+
+def run_benchmark(source, duration, warmup, streams, ws_clients, yolo, speed, port, label=None, units=1,
+                  static_scene=False):
+    os.environ["WINEQUEEN_CAMERA"] = source
+    os.environ.setdefault("WINEQUEEN_SERIAL", "sim")
+    os.environ["WINEQUEEN_SIM_SPEED"] = str(speed)
+    if units > 1:
+        os.environ["WINEQUEEN_UNITS"] = json.dumps(
+            [{"id": f"u{i}", "camera": source, "serial": "sim"} for i in range(units)])
+    from simulation import start_backend
+
+    main, server = start_backend(port)
+    unit_ids = list(main.units)
+    if yolo:
+        for unit in main.units.values():
+            unit.set_yolo_active(True)
+
+    def _url(scheme, path, i):
+        # 클라이언트 i를 유닛에 번갈아 배정
+        return f"{scheme}://127.0.0.1:{port}/units/{unit_ids[i % len(unit_ids)]}{path}"
+
+    stop = threading.Event()
+    worlds = [u.sim_world for u in main.units.values() if u.sim_world is not None]
+    moving = source == "synthetic" and not static_scene and bool(worlds)
+    if moving:
+        SceneMover(worlds, stop).start()
+    clients = [StreamClient(_url("http", "/video_feed", i), stop) for i in range(streams)]
+    if ws_clients and ws_connect is None:
+        print("[BENCH] websockets 패키지가 없어 WS 클라이언트 없이 측정합니다.")
+        ws_clients = 0
+    clients += [WSClient(_url("ws", "/ws", i), stop) for i in range(ws_clients)]
+    for c in clients:
+        c.start()
+
+    print(f"[BENCH] warmup {warmup}s ...")
+    time.sleep(warmup)
+
+    # 측정 구간 시작: 누적 카운터는 기준값을 빼서 사용
+    main.pipeline_metrics.reset()
+    totals0 = _totals(main)
+    counts0 = [(getattr(c, "frames", 0), getattr(c, "keepalives", 0), getattr(c, "messages", 0)) for c in clients]
+    usage0, t0 = process_usage(), time.monotonic()
+    print(f"[BENCH] measuring {duration}s ...")
+    rss_peak = usage0["rss_mb"] or 0.0
+    while time.monotonic() - t0 < duration:
+        time.sleep(min(1.0, duration))
+        rss_peak = max(rss_peak, process_usage()["rss_mb"] or 0.0)
+    usage1, elapsed = process_usage(), time.monotonic() - t0
+
+    stages = main.pipeline_metrics.snapshot()
+    totals1 = _totals(main)
+    stop.set()
+    server.should_exit = True
+
+    stream_counts = [c.frames - n0[0] for c, n0 in zip(clients, counts0) if isinstance(c, StreamClient)]
+    keepalive_counts = [c.keepalives - n0[1] for c, n0 in zip(clients, counts0) if isinstance(c, StreamClient)]
+    ws_counts = [c.messages - n0[2] for c, n0 in zip(clients, counts0) if isinstance(c, WSClient)]
+    report = {
+        "label": label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_rev": _git_rev(),
+        "host": {"machine": platform.machine(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {
+            "source": source, "moving_scene": moving, "duration_s": duration, "warmup_s": warmup, "speed": speed,
+            "streams": streams, "ws_clients": ws_clients, "yolo": yolo, "units": len(unit_ids),
+            "backend": main.INFER_BACKEND, "int8": main.INFER_INT8, "infer_mode": main.INFER_MODE,
+            "imgsz": main.INFER_IMGSZ, "roi_imgsz": main.ROI_IMGSZ, "conf": main.INFER_CONF,
+            "camera_raw_mjpeg": main.default_unit.camera_raw_active,
+        },
+        "throughput": {
+            "capture_fps": _rate(totals1["captured"] - totals0["captured"], elapsed),
+            "processed_fps": _rate(stages.get("queue_wait", {}).get("count", 0), elapsed),
+            "inference_per_s": _rate(stages.get("inference", {}).get("count", 0), elapsed),
+            "inference_batch_size": main.inference_stats().get("mean_batch_size"),
+            "stream_publish_fps": _rate(totals1["published"] - totals0["published"], elapsed),
+            "stream_client_fps": [_rate(n, elapsed) for n in stream_counts],
+            "stream_keepalive_per_s": [_rate(n, elapsed) for n in keepalive_counts],
+            "ws_msgs_per_s": [_rate(n, elapsed) for n in ws_counts],
+        },
+        "drops": {
+            "ring": totals1["ring_dropped"] - totals0["ring_dropped"],
+            "stream": totals1["stream_dropped"] - totals0["stream_dropped"],
+            "ws_evicted": totals1["ws_evicted"] - totals0["ws_evicted"],
+        },
+        "skips": {key: totals1[key] - totals0[key] for key in ("stream_unchanged_skips", "stream_fps_skips")},
+        "process": {
+            "cpu_percent": round((usage1["cpu_s"] - usage0["cpu_s"]) / elapsed * 100, 1),
+            "rss_mb": round(usage1["rss_mb"], 1) if usage1["rss_mb"] is not None else None,
+            "rss_peak_mb": round(rss_peak, 1),
+        },
+        "stages": stages,
+        "errors": [c.error for c in clients if c.error],
+    }
+    return report
+
+
+def print_report(report):
+    t = report["throughput"]
+    print(f"[BENCH] capture {t['capture_fps']} fps | processed {t['processed_fps']} fps | "
+          f"inference {t['inference_per_s']}/s | stream {t['stream_publish_fps']} fps "
+          f"(clients {t['stream_client_fps']}, keepalive {t['stream_keepalive_per_s']}/s)")
+    print(f"[BENCH] drops {report['drops']} | skips {report['skips']} | cpu {report['process']['cpu_percent']}% "
+          f"rss {report['process']['rss_mb']} MB")
+    print(f"{'stage':<12} {'count':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for name, s in report["stages"].items():
+        print(f"{name:<12} {s['count']:>7} {s['p50_ms']!s:>9} {s['p95_ms']!s:>9} {s['p99_ms']!s:>9} {s['max_ms']!s:>9}")
+
+
+# =========================
+# 리포트 비교
+# =========================
+def _delta(old, new):
+    if old is None or new is None:
+        return ""
+    if not old:
+        return f"{new - old:+.2f}"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare_reports(old, new):
+    """두 리포트의 처리량/단계별 p50·p95·p99를 나란히 출력."""
+    print(f"old: {old.get('label') or old.get('git_rev')} ({old['timestamp']})")
+    print(f"new: {new.get('label') or new.get('git_rev')} ({new['timestamp']})")
+    for key in ("capture_fps", "processed_fps", "inference_per_s", "stream_publish_fps"):
+        a, b = old["throughput"].get(key), new["throughput"].get(key)
+        print(f"{key:<20} {a!s:>9} -> {b!s:>9} {_delta(a, b):>8}")
+    a, b = old["process"]["cpu_percent"], new["process"]["cpu_percent"]
+    print(f"{'cpu_percent':<20} {a!s:>9} -> {b!s:>9} {_delta(a, b):>8}")
+    for name in sorted(set(old["stages"]) | set(new["stages"])):
+        so, sn = old["stages"].get(name, {}), new["stages"].get(name, {})
+        cols = []
+        for p in ("p50_ms", "p95_ms", "p99_ms"):
+            cols.append(f"{p[:3]} {so.get(p)!s}->{sn.get(p)!s} {_delta(so.get(p), sn.get(p))}")
+        print(f"{name:<12} " + " | ".join(cols))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WineQueen 파이프라인 벤치마크")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    run = sub.add_parser("run", help="영상을 재생하며 파이프라인 측정")
+    run.add_argument("--source", default="synthetic", help="video:PATH | images:DIR | synthetic")
+    run.add_argument("--duration", type=float, default=30.0)
+    run.add_argument("--warmup", type=float, default=5.0)
+    run.add_argument("--streams", type=int, default=1, help="/video_feed 클라이언트 수")
+    run.add_argument("--ws", type=int, default=1, help="/ws 클라이언트 수")
+    run.add_argument("--no-yolo", dest="yolo", action="store_false", help="YOLO 끈 상태로 측정")
+    run.add_argument("--speed", type=float, default=1.0, help="재생 속도 배율 (>0)")
+    run.add_argument("--units", type=int, default=1, help="같은 소스로 띄울 유닛(스테이션) 수")
+    run.add_argument("--static-scene", action="store_true", help="합성 장면의 병을 움직이지 않음 (정지 화면 측정)")
+    run.add_argument("--port", type=int, default=8766)
+    run.add_argument("--label", default=None, help="리포트에 남길 이름 (예: 릴리스 태그)")
+    run.add_argument("--out", default=None, help="JSON 리포트 저장 경로")
+    cmp_ = sub.add_parser("compare", help="두 리포트 비교")
+    cmp_.add_argument("old")
+    cmp_.add_argument("new")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "compare":
+        with open(args.old) as f_old, open(args.new) as f_new:
+            compare_reports(json.load(f_old), json.load(f_new))
+        return 0
+
+    if args.speed <= 0:
+        parser.error("--speed must be > 0")
+    if args.units < 1:
+        parser.error("--units must be >= 1")
+    report = run_benchmark(args.source, args.duration, args.warmup, args.streams, args.ws,
+                           args.yolo, args.speed, args.port, args.label, args.units, args.static_scene)
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"[BENCH] report saved: {args.out}")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
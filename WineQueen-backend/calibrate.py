@@ -0,0 +1,368 @@
+"""감지기 속도/정확도 캘리브레이션 (imgsz, ROI imgsz, conf, 백엔드).
+
+라벨이 있는 병 프레임으로 입력 크기 × 신뢰도 × 백엔드 조합을 돌려 추론 지연과
+중심점 오차(정렬 축 y, px) / 미검출률 / 오검출률을 재고, 파레토 표로 보여준다.
+조건(기본: p95 오차 ≤ 정렬 데드존 3px, 미검출 ≤ 2%)을 만족하는 가장 빠른 조합을
+운영점으로 detector_config.json에 쓰고, main.py가 시작할 때 읽어 DETECTOR_ARGS에 반영한다.
+
+추적 중에는 main.py가 마지막 박스 주변(ROI)만 잘라 roi_imgsz로 추론하므로, ROI 입력 크기도
+같은 백엔드/conf에서 따로 재서(input=roi, 병이 있는 프레임만) 조건을 만족하는 가장 빠른 크기를 함께 저장한다.
+
+    python calibrate.py sweep --samples ./samples --imgsz 96 128 160 224 320 --roi-imgsz 64 96 128 \\
+        --conf 0.25 0.4 0.5 0.6 --backend torch onnx openvino
+
+라벨 형식 (둘 중 하나):
+    --labels labels.json : {"img_001.jpg": [[x1, y1, x2, y2], ...], "empty_01.jpg": []}
+    YOLO txt             : 이미지 옆 또는 ../labels/ 의 <이름>.txt ("cls cx cy w h", 0~1 정규화),
+                           txt가 없으면 병이 없는 프레임
+
+- conf는 모델을 다시 돌리지 않고 가장 낮은 conf로 한 번 추론한 결과를 걸러서 잰다
+  (NMS는 높은 점수부터 남기므로 conf를 올려 다시 돌린 결과와 같다).
+- 정렬 제어는 첫 번째 박스만 쓰므로 max_det는 정확도에 영향이 없어 스윕하지 않고 설정값으로만 기록한다.
+- 기본으로 운영과 같은 입력을 만든다: MJPEG 패스스루면 추론 프레임은 DCT 축소 디코드 크기
+  (infer_decode_min_size)로 줄어든 프레임 (--no-passthrough면 원본 프레임).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from detector import BACKENDS, _iou, _load_samples, Box, create_detector
+
+DEFAULT_CONFIG = "detector_config.json"
+OPERATING_POINT_KEYS = ("backend", "int8", "imgsz", "conf", "max_det")
+OPTIONAL_KEYS = ("roi_imgsz",)   # 없으면 imgsz (이전 버전 설정 파일)
+SWEEP_BACKENDS = BACKENDS + ("sim",)
+IMGSZ_STRIDE = 32                # YOLO 최대 stride: export 입력 크기는 이 배수여야 함
+ROI_DECODE_MIN_SIZE = (320, 240)  # ROI 추론용 축소 디코드 최소 크기 (main.py와 공유, 1/2 스케일)
+ROI_SCALE, ROI_MIN = 2.0, 96      # ROI 크기 = 박스 * ROI_SCALE (한 변 최소 ROI_MIN px), BoxTracker 기본값과 같음
+
+
+# =========================
+# 운영점 설정 파일
+# =========================
+def load_operating_point(path: str):
+    """calibrate.py가 쓴 운영점을 읽음 (파일이 없으면 None)."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        config = json.load(f)
+    missing = [k for k in OPERATING_POINT_KEYS if k not in config]
+    if missing:
+        raise ValueError(f"{path}: missing keys {missing}")
+    if config["backend"] not in SWEEP_BACKENDS:
+        raise ValueError(f"{path}: unknown backend '{config['backend']}' (choose from {SWEEP_BACKENDS})")
+    point = {k: config[k] for k in OPERATING_POINT_KEYS}
+    point["roi_imgsz"] = config.get("roi_imgsz") or point["imgsz"]
+    for key in ("imgsz", "roi_imgsz"):
+        if not isinstance(point[key], int) or point[key] <= 0 or point[key] % IMGSZ_STRIDE:
+            raise ValueError(f"{path}: {key}={point[key]} must be a positive multiple of {IMGSZ_STRIDE}")
+    return point
+
+
+def infer_decode_min_size(imgsz: int):
+    """패스스루 모드 전체 프레임 추론용 축소 디코드 최소 크기 (w, h).
+
+    imgsz=128이면 640x480 → 1/4(160x120). imgsz가 그보다 크면 letterbox에서 다시 키우지 않도록 더 크게 디코드.
+    """
+    return max(160, imgsz), max(120, imgsz * 3 // 4)
+
+
+def passthrough_input(frame, imgsz: int = None, min_size=None):
+    """simplejpeg의 1/2^k 축소 디코드와 같은 크기로 줄인 프레임 (k ≤ 3).
+
+    min_size를 주지 않으면 전체 프레임 추론용 크기(infer_decode_min_size(imgsz)).
+    """
+    h, w = frame.shape[:2]
+    min_w, min_h = min_size or infer_decode_min_size(imgsz)
+    scale = 1
+    while scale < 8 and w // (scale * 2) >= min_w and h // (scale * 2) >= min_h:
+        scale *= 2
+    if scale == 1:
+        return frame
+    return cv2.resize(frame, (w // scale, h // scale), interpolation=cv2.INTER_AREA)
+
+
+# =========================
+# 라벨
+# =========================
+def _yolo_label(image_path: str, w: int, h: int):
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    folder = os.path.dirname(image_path)
+    for txt in (os.path.join(folder, stem + ".txt"),
+                os.path.join(os.path.dirname(folder), "labels", stem + ".txt")):
+        if os.path.exists(txt):
+            boxes = []
+            with open(txt) as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) >= 5:
+                        cx, cy, bw, bh = (float(v) for v in parts[1:5])
+                        boxes.append(((cx - bw / 2) * w, (cy - bh / 2) * h, (cx + bw / 2) * w, (cy + bh / 2) * h))
+            return boxes
+    return []
+
+
+def load_labeled_frames(samples_dir: str, labels_path: str = None, limit: int = 500):
+    """[(이름, BGR 프레임, [라벨 박스 xyxy, ...]), ...]"""
+    labels = None
+    if labels_path:
+        with open(labels_path) as f:
+            labels = json.load(f)
+    frames = []
+    for path in _load_samples(samples_dir, limit):
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        name = os.path.basename(path)
+        if labels is not None:
+            if name not in labels:
+                continue
+            boxes = [tuple(map(float, b)) for b in labels[name]]
+        else:
+            boxes = _yolo_label(path, img.shape[1], img.shape[0])
+        frames.append((name, img, boxes))
+    return frames
+
+
+# =========================
+# 측정
+# =========================
+def run_detector(detector, frames, imgsz: int, passthrough: bool):
+    """프레임마다 (원본 좌표 박스 목록, 지연 ms)."""
+    outputs, latencies = [], []
+    for _, img, _ in frames:
+        h, w = img.shape[:2]
+        inp = passthrough_input(img, imgsz) if passthrough else img
+        sx, sy = w / inp.shape[1], h / inp.shape[0]
+        t0 = time.perf_counter()
+        boxes = detector.predict(inp, imgsz)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        boxes = sorted((Box(b.x1 * sx, b.y1 * sy, b.x2 * sx, b.y2 * sy, b.conf, b.cls) for b in boxes),
+                       key=lambda b: -b.conf)
+        outputs.append(boxes)
+    return outputs, latencies
+
+
+def roi_input(img, truth, passthrough: bool):
+    """추적 중 main.py가 만드는 ROI 입력: 라벨 박스 주변을 ROI_DECODE_MIN_SIZE 디코드 프레임에서 잘라냄.
+
+    (잘라낸 프레임, 원본 좌표 변환 (sx, sy, ox, oy))를 반환.
+    """
+    h, w = img.shape[:2]
+    x1, y1, x2, y2 = truth
+    rw = min(max((x2 - x1) * ROI_SCALE, ROI_MIN), w)
+    rh = min(max((y2 - y1) * ROI_SCALE, ROI_MIN), h)
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    rx1 = int(min(max(cx - rw / 2, 0), w - rw))
+    ry1 = int(min(max(cy - rh / 2, 0), h - rh))
+    src = passthrough_input(img, min_size=ROI_DECODE_MIN_SIZE) if passthrough else img
+    sx, sy = w / src.shape[1], h / src.shape[0]
+    cx1, cy1 = int(rx1 / sx), int(ry1 / sy)
+    cx2, cy2 = int((rx1 + rw) / sx), int((ry1 + rh) / sy)
+    return np.ascontiguousarray(src[cy1:cy2, cx1:cx2]), (sx, sy, cx1 * sx, cy1 * sy)
+
+
+def run_roi(detector, frames, imgsz: int, passthrough: bool):
+    """병이 있는 프레임마다 첫 라벨 주변 ROI로 추론 → (원본 좌표 박스 목록, 지연 ms)."""
+    outputs, latencies = [], []
+    for _, img, truth in frames:
+        crop, (sx, sy, ox, oy) = roi_input(img, truth[0], passthrough)
+        t0 = time.perf_counter()
+        boxes = detector.predict(crop, imgsz)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        boxes = sorted((Box(ox + b.x1 * sx, oy + b.y1 * sy, ox + b.x2 * sx, oy + b.y2 * sy, b.conf, b.cls)
+                        for b in boxes), key=lambda b: -b.conf)
+        outputs.append(boxes)
+    return outputs, latencies
+
+
+def score(frames, outputs, conf: float, min_iou: float):
+    """conf 이상인 첫 박스 기준 중심 오차(y, px)/미검출률/오검출률."""
+    errors, misses, positives, false_pos, negatives = [], 0, 0, 0, 0
+    for (_, _, truth), boxes in zip(frames, outputs):
+        top = next((b for b in boxes if b.conf >= conf), None)
+        if not truth:
+            negatives += 1
+            false_pos += top is not None
+            continue
+        positives += 1
+        if top is None:
+            misses += 1
+            continue
+        best = max(truth, key=lambda t: _iou(top, Box(*t, 1.0, 0)))
+        if _iou(top, Box(*best, 1.0, 0)) < min_iou:
+            misses += 1  # 엉뚱한 곳을 잡은 것도 정렬에는 미검출과 같음
+            continue
+        errors.append(abs(top.center[1] - (best[1] + best[3]) / 2))
+    return {
+        "err_mean_px": round(float(np.mean(errors)), 2) if errors else None,
+        "err_p95_px": round(float(np.percentile(errors, 95)), 2) if errors else None,
+        "miss_rate": round(misses / positives, 4) if positives else 0.0,
+        "false_pos_rate": round(false_pos / negatives, 4) if negatives else 0.0,
+    }
+
+
+def pareto(rows):
+    """지연 p50 / 오차 p95 / 미검출률이 모두 낮은 쪽이 우세. 같은 input(full/roi) 안에서
+    다른 행에 지배되지 않으면 pareto=True."""
+    def key(r):
+        return (r["latency_p50_ms"], r["err_p95_px"] if r["err_p95_px"] is not None else float("inf"),
+                r["miss_rate"])
+    for r in rows:
+        k = key(r)
+        r["pareto"] = not any(all(a <= b for a, b in zip(key(o), k)) and key(o) != k
+                              for o in rows if o["input"] == r["input"])
+    return rows
+
+
+def sweep(frames, weights: str, backends, sizes, confs, max_det: int = 1, int8: bool = False,
+          samples_dir: str = None, passthrough: bool = True, min_iou: float = 0.3, roi_sizes=()):
+    """full(전체 프레임, sizes) + roi(라벨 주변 ROI, roi_sizes) 행을 지연 순으로 번호를 붙여 반환."""
+    rows = []
+    positives = [f for f in frames if f[2]]
+    for backend in backends:
+        for imgsz in sorted(set(sizes) | set(roi_sizes)):
+            runs = []
+            try:
+                detector = create_detector(weights=weights, backend=backend, imgsz=imgsz, conf=min(confs),
+                                           max_det=max_det, int8=int8 and backend != "torch",
+                                           samples_dir=samples_dir)
+                if imgsz in sizes:
+                    warm = passthrough_input(frames[0][1], imgsz) if passthrough else frames[0][1]
+                    detector.predict(warm, imgsz)  # 첫 추론의 초기화 비용은 측정에서 제외
+                    runs.append(("full", frames, *run_detector(detector, frames, imgsz, passthrough)))
+                if imgsz in roi_sizes and positives:
+                    detector.predict(roi_input(positives[0][1], positives[0][2][0], passthrough)[0], imgsz)
+                    runs.append(("roi", positives, *run_roi(detector, positives, imgsz, passthrough)))
+            except Exception as e:
+                print(f"[CALIB] {backend} imgsz={imgsz} FAIL: {e}")
+                continue
+            for kind, used, outputs, latencies in runs:
+                timing = {"latency_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                          "latency_p95_ms": round(float(np.percentile(latencies, 95)), 2)}
+                for conf in sorted(confs):
+                    rows.append({"row": None, "input": kind, "backend": backend, "int8": int8 and backend != "torch",
+                                 "imgsz": imgsz, "conf": conf, "max_det": max_det, **timing,
+                                 **score(used, outputs, conf, min_iou)})
+    rows.sort(key=lambda r: (r["input"] != "full", r["latency_p50_ms"]))
+    for i, r in enumerate(rows):
+        r["row"] = i
+    return pareto(rows)
+
+
+def choose(rows, max_center_err: float, max_miss: float, max_false_pos: float):
+    """조건을 만족하는 조합 중 가장 빠른 것 (같으면 오차가 작은 것)."""
+    ok = [r for r in rows if r["err_p95_px"] is not None and r["err_p95_px"] <= max_center_err
+          and r["miss_rate"] <= max_miss and r["false_pos_rate"] <= max_false_pos]
+    if not ok:
+        return None
+    return min(ok, key=lambda r: (r["latency_p50_ms"], r["err_p95_px"], r["miss_rate"]))
+
+
+def matching_roi(rows, chosen):
+    """선택한 전체 프레임 운영점과 같은 백엔드/INT8/conf로 잰 ROI 행들."""
+    return [r for r in rows if r["input"] == "roi" and r["backend"] == chosen["backend"]
+            and r["int8"] == chosen["int8"] and r["conf"] == chosen["conf"]]
+
+
+def print_table(rows, chosen=()):
+    cols = ("input", "backend", "int8", "imgsz", "conf", "latency_p50_ms", "latency_p95_ms", "err_mean_px",
+            "err_p95_px", "miss_rate", "false_pos_rate")
+    print(f"{'#':>3} {'P':1} " + " ".join(f"{c:>14}" for c in cols))
+    for r in rows:
+        mark = ">" if any(r is c for c in chosen) else ("*" if r["pareto"] else " ")
+        print(f"{r['row']:>3} {mark} " + " ".join(f"{str(r[c]):>14}" for c in cols))
+    print("    * = 파레토 최적 (input별), > = 선택된 운영점 (full/roi)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="감지기 imgsz/conf/백엔드 캘리브레이션")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sw = sub.add_parser("sweep")
+    sw.add_argument("--samples", required=True, help="라벨이 있는 병 프레임 폴더")
+    sw.add_argument("--labels", help="labels.json (없으면 YOLO txt 라벨)")
+    sw.add_argument("--weights", default="best_wCrop.pt")
+    sw.add_argument("--backend", nargs="+", default=["torch"], choices=SWEEP_BACKENDS)
+    sw.add_argument("--int8", action="store_true", help="onnx/openvino는 INT8 양자화 모델로")
+    sw.add_argument("--imgsz", nargs="+", type=int, default=[96, 128, 160, 224, 320])
+    sw.add_argument("--roi-imgsz", nargs="+", type=int, default=[64, 96, 128],
+                    help="추적 중 ROI 추론 입력 크기 후보")
+    sw.add_argument("--conf", nargs="+", type=float, default=[0.25, 0.4, 0.5, 0.6])
+    sw.add_argument("--max-det", type=int, default=1)
+    sw.add_argument("--limit", type=int, default=500, help="사용할 최대 프레임 수")
+    sw.add_argument("--min-iou", type=float, default=0.3, help="라벨과 이 IoU 미만이면 미검출로 셈")
+    sw.add_argument("--no-passthrough", action="store_true", help="축소 디코드 없이 원본 프레임으로 추론")
+    sw.add_argument("--max-center-err", type=float, default=3.0, help="허용 p95 중심 오차(px, 정렬 데드존)")
+    sw.add_argument("--max-miss", type=float, default=0.02, help="허용 미검출률")
+    sw.add_argument("--max-false-pos", type=float, default=0.05, help="허용 오검출률 (병 없는 프레임)")
+    sw.add_argument("--pick", type=int, help="자동 선택 대신 표의 # 번호로 운영점 지정 (input=full)")
+    sw.add_argument("--pick-roi", type=int, help="자동 선택 대신 표의 # 번호로 ROI 크기 지정 (input=roi)")
+    sw.add_argument("--out", default=DEFAULT_CONFIG, help="운영점 설정 파일 (main.py의 WINEQUEEN_DETECTOR_CONFIG)")
+    sw.add_argument("--dry-run", action="store_true", help="표만 출력하고 설정 파일은 쓰지 않음")
+    args = parser.parse_args(argv)
+    bad = [v for v in args.imgsz + args.roi_imgsz if v <= 0 or v % IMGSZ_STRIDE]
+    if bad:
+        parser.error(f"imgsz {bad}: must be positive multiples of {IMGSZ_STRIDE}")
+
+    frames = load_labeled_frames(args.samples, args.labels, args.limit)
+    positives = sum(1 for _, _, truth in frames if truth)
+    if not positives:
+        print(f"[CALIB] FAIL: 병 라벨이 있는 프레임이 없습니다 ({args.samples}).")
+        return 1
+    print(f"[CALIB] frames={len(frames)} positives={positives} negatives={len(frames) - positives}")
+
+    rows = sweep(frames, args.weights, args.backend, args.imgsz, args.conf, args.max_det, args.int8,
+                 args.samples, not args.no_passthrough, args.min_iou, args.roi_imgsz)
+    full = [r for r in rows if r["input"] == "full"]
+    if not full:
+        print("[CALIB] FAIL: 실행된 조합이 없습니다.")
+        return 1
+    if args.pick is not None:
+        chosen = next((r for r in full if r["row"] == args.pick), None)
+    else:
+        chosen = choose(full, args.max_center_err, args.max_miss, args.max_false_pos)
+    roi = None
+    if chosen is not None:
+        candidates = matching_roi(rows, chosen)
+        if args.pick_roi is not None:
+            roi = next((r for r in candidates if r["row"] == args.pick_roi), None)
+        else:
+            roi = choose(candidates, args.max_center_err, args.max_miss, 1.0)  # ROI는 병이 있는 프레임만
+    print_table(rows, [r for r in (chosen, roi) if r is not None])
+    if chosen is None:
+        print("[CALIB] FAIL: 조건을 만족하는 조합이 없습니다. 조건을 완화하거나 --pick으로 지정하세요.")
+        return 1
+    print(f"[CALIB] operating point #{chosen['row']}: backend={chosen['backend']} imgsz={chosen['imgsz']} "
+          f"conf={chosen['conf']} p50={chosen['latency_p50_ms']}ms err_p95={chosen['err_p95_px']}px "
+          f"miss={chosen['miss_rate']}")
+    if roi is not None:
+        print(f"[CALIB] ROI #{roi['row']}: roi_imgsz={roi['imgsz']} p50={roi['latency_p50_ms']}ms "
+              f"err_p95={roi['err_p95_px']}px miss={roi['miss_rate']}")
+    else:
+        # 같은 조건을 만족하는 ROI 크기가 없으면 전체 프레임과 같은 크기 (검증된 조합)
+        print(f"[CALIB] ROI: 조건을 만족하는 크기가 없어 roi_imgsz={chosen['imgsz']} (전체 프레임과 같음)")
+    if args.dry_run:
+        return 0
+    config = {k: chosen[k] for k in OPERATING_POINT_KEYS}
+    config["roi_imgsz"] = roi["imgsz"] if roi is not None else chosen["imgsz"]
+    config["measured"] = {k: chosen[k] for k in ("latency_p50_ms", "latency_p95_ms", "err_mean_px", "err_p95_px",
+                                                 "miss_rate", "false_pos_rate")}
+    if roi is not None:
+        config["measured_roi"] = {k: roi[k] for k in ("latency_p50_ms", "latency_p95_ms", "err_mean_px",
+                                                      "err_p95_px", "miss_rate")}
+    config["calibration"] = {"samples": os.path.abspath(args.samples), "frames": len(frames),
+                             "positives": positives, "passthrough": not args.no_passthrough,
+                             "weights": args.weights, "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    with open(args.out, "w") as f:
+        json.dump(config, f, indent=2)
+    print(f"[CALIB] wrote {args.out} (재시작하면 적용)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+"""YOLO 추론 백엔드 추상화.
+
+- torch    : best_wCrop.pt 를 PyTorch(CPU)로 실행 (기존 동작)
+- onnx     : ONNX Runtime
+- openvino : OpenVINO
+각 백엔드는 최초 1회 export 후 캐시 디렉터리(WINEQUEEN_MODEL_CACHE, 기본 ./.model_cache)에 저장해 재사용하며,
+int8=True면 양자화 모델을 사용한다. 캐시 키는 가중치 파일 해시 + imgsz + ultralytics 버전이므로
+가중치를 바꾸거나 라이브러리를 올리면 자동으로 다시 export 한다.
+
+export + 정확도 검증:
+    python detector.py export --backend openvino --int8 --samples ./samples
+"""
+import argparse
+import glob
+import hashlib
+import os
+import shutil
+import sys
+from typing import List, NamedTuple
+
+import cv2
+import numpy as np
+
+from async_log import print_log
+
+BACKENDS = ("torch", "onnx", "openvino")
+MODEL_CACHE_DIR = os.getenv("WINEQUEEN_MODEL_CACHE", ".model_cache")
+
+
+class Box(NamedTuple):
+    """감지 결과 1개 (입력 프레임 좌표, float)."""
+    x1: float
+    y1: float
+    x2: float
+    y2: float
+    conf: float
+    cls: int
+
+    @property
+    def center(self):
+        return (self.x1 + self.x2) / 2, (self.y1 + self.y2) / 2
+
+
+def _cache_key(weights: str, imgsz: int) -> str:
+    """가중치 내용 + 입력 크기 + ultralytics 버전 해시 (앞 12자리)."""
+    h = hashlib.sha1()
+    with open(weights, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    try:
+        from importlib.metadata import version
+        h.update(version("ultralytics").encode())
+    except Exception:
+        pass
+    h.update(str(imgsz).encode())
+    return h.hexdigest()[:12]
+
+
+def artifact_path(weights: str, backend: str, int8: bool = False, imgsz: int = 128) -> str:
+    """백엔드별 export 결과의 캐시 경로. torch는 원본 가중치를 그대로 사용."""
+    if backend == "torch":
+        return weights
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend '{backend}' (choose from {BACKENDS})")
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    name = f"{stem}-{_cache_key(weights, imgsz)}{'_int8' if int8 else ''}"
+    name += ".onnx" if backend == "onnx" else "_openvino_model"
+    return os.path.join(MODEL_CACHE_DIR, name)
+
+
+def _store(exported: str, target: str) -> str:
+    """export 결과를 캐시 경로로 옮김 (완성된 파일만 캐시에 보이도록 마지막에 rename)."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    shutil.move(exported, target)
+    return target
+
+
+def _load_samples(samples_dir: str, limit: int = 200):
+    paths = sorted(glob.glob(os.path.join(samples_dir, "*.jpg")) + glob.glob(os.path.join(samples_dir, "*.png")))
+    return paths[:limit]
+
+
+def _letterbox(img, imgsz: int):
+    """ultralytics 전처리와 같은 letterbox → NCHW float32 (RGB, 0~1)."""
+    h, w = img.shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    resized = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    canvas[top:top + nh, left:left + nw] = resized
+    blob = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+    return np.ascontiguousarray(blob[None])
+
+
+def export_backend(weights: str, backend: str, imgsz: int, int8: bool = False, samples_dir: str = None,
+                   log=print_log) -> str:
+    """PyTorch 가중치를 지정 백엔드로 export하고 결과(캐시) 경로를 반환. 캐시에 있으면 바로 반환."""
+    target = artifact_path(weights, backend, int8, imgsz)
+    if backend == "torch" or os.path.exists(target):
+        return target
+    if int8 and not samples_dir:
+        # 런타임(main.py)에는 캘리브레이션 이미지가 없으므로 INT8 artifact는 미리 export해 두어야 한다
+        raise FileNotFoundError(
+            f"{backend} INT8 artifact 없음: {target} (imgsz={imgsz}). INT8 양자화에는 캘리브레이션 이미지가 "
+            f"필요하므로 먼저 `python detector.py export --backend {backend} --int8 --imgsz {imgsz} "
+            f"--samples <병 이미지 폴더>`로 만드세요")
+
+    log("YOLO", f"exporting {weights} -> {target} (최초 1회)")
+    from ultralytics import YOLO
+    model = YOLO(weights)
+    if backend == "onnx":
+        if not int8:
+            exported = model.export(format="onnx", imgsz=imgsz, simplify=True, dynamic=False, verbose=False)
+            return _store(exported, target)
+        fp32 = export_backend(weights, "onnx", imgsz, log=log)
+        from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+        import onnxruntime as ort
+
+        input_name = ort.InferenceSession(fp32, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+        class _Reader(CalibrationDataReader):
+            def __init__(self):
+                self._it = iter(_load_samples(samples_dir))
+
+            def get_next(self):
+                for path in self._it:
+                    img = cv2.imread(path)
+                    if img is not None:
+                        return {input_name: _letterbox(img, imgsz)}
+                return None
+
+        tmp = target + ".tmp"
+        quantize_static(fp32, tmp, _Reader(), quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+        return _store(tmp, target)
+
+    if backend == "openvino":
+        kwargs = {}
+        if int8:
+            # NNCF 캘리브레이션용 임시 데이터셋 yaml (라벨 불필요)
+            data_yaml = os.path.join(samples_dir, "_calib.yaml")
+            with open(data_yaml, "w") as f:
+                f.write(f"path: {os.path.abspath(samples_dir)}\ntrain: .\nval: .\n")
+                f.write("names:\n" + "".join(f"  {k}: {v}\n" for k, v in model.names.items()))
+            kwargs = {"int8": True, "data": data_yaml}
+        exported = model.export(format="openvino", imgsz=imgsz, verbose=False, **kwargs)
+        return _store(exported, target)
+
+    raise ValueError(f"unknown backend '{backend}' (choose from {BACKENDS})")
+
+
+class Detector:
+    """백엔드와 무관하게 같은 형태(List[Box])의 결과를 돌려주는 감지기.
+
+    onnx/openvino export는 입력 크기가 고정(dynamic=False)이므로 imgsz마다 artifact를 따로 만들어 캐시하고
+    (전체 프레임 imgsz, ROI_IMGSZ 등), 처음 쓰는 imgsz의 모델은 그때 로드한다. 워밍업에서 실제로 쓰는
+    imgsz를 모두 한 번씩 돌리므로 export/로드는 모델 로드 단계에서 끝난다.
+    """
+
+    def __init__(self, weights: str, backend: str = "torch", imgsz: int = 128, conf: float = 0.5,
+                 max_det: int = 1, classes=0, int8: bool = False, samples_dir: str = None, log=print_log):
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown backend '{backend}' (choose from {BACKENDS})")
+        self.backend = backend
+        self.imgsz = imgsz
+        self.conf = conf
+        self.max_det = max_det
+        self.classes = classes
+        self.weights = weights
+        self.int8 = int8
+        self.samples_dir = samples_dir
+        self.log = log
+        self._models = {}  # imgsz → YOLO (torch는 모든 imgsz가 같은 모델)
+        self.paths = {}    # imgsz → artifact 경로
+        self.model = self._model_for(imgsz)
+        self.path = self.paths[imgsz]
+        self.names = self.model.names
+
+    def _model_for(self, imgsz: int = None):
+        key = imgsz or self.imgsz
+        if self.backend == "torch":
+            key = self.imgsz
+        model = self._models.get(key)
+        if model is None:
+            from ultralytics import YOLO  # 무거운 import는 실제로 모델을 만들 때만
+            self.paths[key] = export_backend(self.weights, self.backend, key, self.int8, self.samples_dir, self.log)
+            model = YOLO(self.paths[key], task="detect")
+            if self.backend == "torch":
+                model.fuse()
+            self._models[key] = model
+        return model
+
+    def _to_boxes(self, result) -> List[Box]:
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return []
+        xyxy = boxes.xyxy.tolist()
+        confs = boxes.conf.tolist()
+        clss = boxes.cls.tolist()
+        return [Box(*b, float(c), int(k)) for b, c, k in zip(xyxy, confs, clss)]
+
+    def predict(self, frame, imgsz: int = None) -> List[Box]:
+        """imgsz를 주면 이번 호출만 입력 크기를 바꿈 (ROI 추론 등)."""
+        model = self._model_for(imgsz)  # export 모델은 imgsz별 artifact
+        result = model(frame,
+                       classes=self.classes,
+                       conf=self.conf,
+                       verbose=False,
+                       imgsz=imgsz or self.imgsz,
+                       device='cpu',
+                       max_det=self.max_det)[0]
+        return self._to_boxes(result)
+
+    def predict_batch(self, frames, imgsz: int = None) -> List[List[Box]]:
+        """여러 프레임(여러 유닛)을 한 번의 forward로 추론해 프레임별 List[Box]를 반환.
+
+        export 모델(onnx/openvino)은 batch=1 고정 입력으로 export하므로 프레임별로 실행한다.
+        """
+        if self.backend != "torch" or len(frames) == 1:
+            return [self.predict(frame, imgsz) for frame in frames]
+        model = self._model_for(imgsz)
+        results = model(list(frames),
+                        classes=self.classes,
+                        conf=self.conf,
+                        verbose=False,
+                        imgsz=imgsz or self.imgsz,
+                        device='cpu',
+                        max_det=self.max_det)
+        return [self._to_boxes(result) for result in results]
+
+    def warmup(self, shape=(480, 640, 3), imgsz: int = None):
+        """실제 추론과 같은 입력 크기(imgsz)로 1회 실행해 첫 추론의 초기화 비용을 미리 치름."""
+        self.predict(np.zeros(shape, dtype=np.uint8), imgsz)
+
+
+def create_detector(**args):
+    """backend='sim'이면 시뮬레이션용 가짜 감지기, 그 외에는 Detector."""
+    if args.get("backend") == "sim":
+        from simulation import SimDetector
+        return SimDetector(**args)
+    return Detector(**args)
+
+
+# =========================
+# 정확도 검증
+# =========================
+def _iou(a: Box, b: Box) -> float:
+    ix1, iy1 = max(a.x1, b.x1), max(a.y1, b.y1)
+    ix2, iy2 = min(a.x2, b.x2), min(a.y2, b.y2)
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a.x2 - a.x1) * (a.y2 - a.y1) + (b.x2 - b.x1) * (b.y2 - b.y1) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare_detectors(reference: Detector, candidate: Detector, samples_dir: str, imgsz: int = None):
+    """샘플 이미지에서 PyTorch 기준 결과와 후보 백엔드 결과를 비교 (imgsz를 주면 그 입력 크기로)."""
+    center_errors, ious = [], []
+    mismatched = 0
+    paths = _load_samples(samples_dir)
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        ref = reference.predict(img, imgsz)
+        cand = candidate.predict(img, imgsz)
+        if bool(ref) != bool(cand):
+            mismatched += 1
+            continue
+        if ref:
+            (rx, ry), (cx, cy) = ref[0].center, cand[0].center
+            center_errors.append(max(abs(rx - cx), abs(ry - cy)))
+            ious.append(_iou(ref[0], cand[0]))
+    return {
+        "samples": len(paths),
+        "presence_mismatch": mismatched,
+        "center_err_mean_px": float(np.mean(center_errors)) if center_errors else 0.0,
+        "center_err_max_px": float(np.max(center_errors)) if center_errors else 0.0,
+        "iou_mean": float(np.mean(ious)) if ious else 1.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="YOLO 백엔드 export 및 정확도 검증")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    exp = sub.add_parser("export")
+    exp.add_argument("--weights", default="best_wCrop.pt")
+    exp.add_argument("--backend", choices=BACKENDS[1:], required=True)
+    exp.add_argument("--int8", action="store_true")
+    exp.add_argument("--imgsz", type=int, nargs="+",
+                     help="export할 입력 크기들 (기본: 운영점 설정의 imgsz와 roi_imgsz, 없으면 128 96)")
+    exp.add_argument("--config", default=os.getenv("WINEQUEEN_DETECTOR_CONFIG", "detector_config.json"),
+                     help="기본 imgsz를 읽을 운영점 설정 파일 (main.py와 같은 WINEQUEEN_DETECTOR_CONFIG)")
+    exp.add_argument("--samples", required=True, help="검증/캘리브레이션용 병 이미지 폴더")
+    exp.add_argument("--max-center-err", type=float, default=3.0, help="허용 평균 중심 오차(px)")
+    exp.add_argument("--max-mismatch", type=float, default=0.02, help="허용 감지 불일치 비율")
+    args = parser.parse_args(argv)
+
+    sizes = args.imgsz
+    if not sizes:
+        # main.py가 쓰는 입력 크기 전부 (전체 프레임 + ROI): 런타임에는 INT8 캘리브레이션 이미지가 없다
+        from calibrate import load_operating_point
+        point = load_operating_point(args.config) or {}
+        sizes = [point.get("imgsz", 128), point.get("roi_imgsz", 96)]
+    sizes = list(dict.fromkeys(sizes))
+
+    reference = Detector(args.weights, "torch", imgsz=sizes[0])
+    candidate = Detector(args.weights, args.backend, imgsz=sizes[0], int8=args.int8, samples_dir=args.samples)
+    failed = False
+    for imgsz in sizes:
+        report = compare_detectors(reference, candidate, args.samples, imgsz)
+        print(f"[EXPORT] imgsz={imgsz} {candidate.paths[imgsz]}")
+        for k, v in report.items():
+            print(f"  {k}: {v}")
+        mismatch_ratio = report["presence_mismatch"] / max(report["samples"], 1)
+        if report["center_err_mean_px"] > args.max_center_err or mismatch_ratio > args.max_mismatch:
+            print(f"[EXPORT] FAIL imgsz={imgsz}: PyTorch 결과와 차이가 허용치를 넘습니다.")
+            failed = True
+
+    if failed:
+        print("[EXPORT] FAIL: 이 백엔드로 전환하지 마세요.")
+        return 1
+    print(f"[EXPORT] OK: imgsz {sizes} 모두 준비됐습니다. 이 백엔드로 전환해도 됩니다.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
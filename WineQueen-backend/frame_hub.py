@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+from typing import NamedTuple
+
+
+class StreamVariant(NamedTuple):
+    """서버가 정해 둔 스트림 화질 1종 (클라이언트 요청은 가장 가까운 variant로 맞춤)."""
+    width: int      # 가로 해상도(px), 세로는 카메라 비율 유지
+    quality: int    # JPEG 품질
+    fps: float      # 최대 FPS
+
+
+def pick_variant(variants: dict, w: int = None, q: int = None, fps: float = None) -> str:
+    """요청한 w/q/fps와 상대 차이 합이 가장 작은 variant 이름 (주지 않은 항목은 비교하지 않음)."""
+    def distance(v: StreamVariant):
+        d = 0.0
+        for want, have in ((w, v.width), (q, v.quality), (fps, v.fps)):
+            if want:
+                d += abs(have - want) / want
+        return d
+    return min(variants, key=lambda name: distance(variants[name]))
+
+
+class FrameHub:
+    """인코딩된 JPEG 프레임을 한 번만 publish하고 모든 스트림 구독자가 공유하는 허브.
+
+    - publish()는 detection_loop 등 임의의 스레드에서 호출 가능 (이벤트 루프로 넘김)
+    - 프레임마다 seq(증가하는 번호)가 붙고, 구독자는 새 seq가 올 때까지 await
+    - 느린 구독자는 중간 프레임을 건너뛰고 항상 최신 프레임만 받음 (중복 전송 없음)
+    - metrics(PipelineMetrics)를 주면 publish→전송, 캡처→전송 지연을 기록
+    - keepalive초 동안 새 프레임이 없으면 마지막 프레임을 다시 보냄 (정지 화면에서 프록시/브라우저가
+      연결을 끊거나 마지막 조각을 붙잡고 있지 않도록)
+    """
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self._loop = None
+        self._event = None
+        self._lock = threading.Lock()
+        self.seq = 0
+        self.frame = None
+        self.frame_ts = (0.0, None)  # (publish 시각, 캡처 시각) time.monotonic 기준
+        self.subscribers = 0
+        self.dropped = 0
+        self.keepalives = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """lifespan에서 실행 중인 이벤트 루프를 연결."""
+        self._loop = loop
+        self._event = asyncio.Event()
+
+    def publish(self, frame_bytes: bytes, captured_ts: float = None):
+        """새 프레임 등록 (스레드 안전). captured_ts는 원본 프레임 캡처 시각. seq를 반환."""
+        with self._lock:
+            self.seq += 1
+            seq = self.seq
+            self.frame = frame_bytes
+            self.frame_ts = (time.monotonic(), captured_ts)
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake)
+        return seq
+
+    def _wake(self):
+        # 대기 중인 구독자를 모두 깨우고 다음 프레임용 이벤트로 교체
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    def latest(self):
+        with self._lock:
+            return self.seq, self.frame
+
+    async def frames(self, keepalive: float = None):
+        """새 프레임을 (seq, bytes, (publish 시각, 캡처 시각))으로 yield하는 비동기 제너레이터.
+
+        keepalive를 주면 그 시간 동안 새 프레임이 없을 때 마지막 프레임을 같은 seq로 다시 yield.
+        """
+        last_seq = 0
+        self.subscribers += 1
+        try:
+            while True:
+                event = self._event
+                with self._lock:
+                    seq, frame, frame_ts = self.seq, self.frame, self.frame_ts
+                if frame is None or seq == last_seq:
+                    if keepalive is None or frame is None:
+                        await event.wait()
+                        continue
+                    try:
+                        await asyncio.wait_for(event.wait(), keepalive)
+                    except asyncio.TimeoutError:
+                        self.keepalives += 1
+                        yield seq, frame, frame_ts
+                    continue
+                if last_seq and seq - last_seq > 1:
+                    self.dropped += seq - last_seq - 1
+                last_seq = seq
+                yield seq, frame, frame_ts
+        finally:
+            self.subscribers -= 1
+
+
+async def mjpeg_stream(hub: FrameHub, keepalive: float = 1.0):
+    """FrameHub 구독 → multipart/x-mixed-replace 조각으로 변환.
+
+    조각마다 Content-Length를 붙여 클라이언트가 경계 검색 없이 JPEG을 잘라 읽을 수 있게 하고,
+    keepalive초 동안 새 프레임이 없으면 마지막 프레임을 다시 보낸다.
+    """
+    metrics = hub.metrics
+    last_seq = 0
+    async for seq, frame_bytes, (published, captured) in hub.frames(keepalive):
+        yield (b"--frame\r\n"
+               b"Content-Type: image/jpeg\r\n"
+               b"Content-Length: " + str(len(frame_bytes)).encode() + b"\r\n\r\n" + frame_bytes + b"\r\n")
+        repeated, last_seq = seq == last_seq, seq
+        # 다음 프레임을 요청받았다 = 방금 조각의 전송이 끝남 (keepalive 재전송은 지연 기록 안 함)
+        if metrics is not None and not repeated:
+            now = time.monotonic()
+            metrics.observe("stream_send", (now - published) * 1000)
+            if captured is not None:
+                metrics.observe("end_to_end", (now - captured) * 1000)
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import numpy as np
+
+
+class FrameRef:
+    """링 버퍼 슬롯에 담긴 프레임 1장 (data는 BGR ndarray 또는 MJPEG bytes)."""
+    __slots__ = ("slot", "seq", "ts", "data")
+
+    def __init__(self, slot, seq, ts, data):
+        self.slot = slot
+        self.seq = seq
+        self.ts = ts
+        self.data = data
+
+
+class FrameRing:
+    """최신 프레임만 유지하는 미리 할당된 링 버퍼 (생산자 1 : 소비자 1).
+
+    - 생산자(camera_reader_loop): acquire() 로 빈 슬롯 버퍼를 받아 cap.read(buf)로 바로 디코드 → publish()
+    - 소비자(detection_loop): get(last_seq) 로 새 프레임이 올 때까지 Condition으로 대기
+    - 소비자가 들고 있는 슬롯과 최신 슬롯은 덮어쓰지 않으므로 복사 없이 그대로 사용 가능
+    - 소비자가 가져가기 전에 새 프레임으로 교체되면 dropped 증가
+    """
+
+    def __init__(self, shape=(480, 640, 3), slots: int = 3):
+        if slots < 3:
+            raise ValueError("FrameRing needs at least 3 slots (writing/latest/held)")
+        self.buffers = [np.empty(shape, dtype=np.uint8) for _ in range(slots)]
+        self._slots = [FrameRef(i, 0, 0.0, None) for i in range(slots)]
+        self._cond = threading.Condition()
+        self._latest = None  # 가장 최근 publish된 FrameRef
+        self._held = None    # 소비자가 사용 중인 슬롯 번호
+        self._next = 0
+        self.seq = 0
+        self.dropped = 0
+        self.consumed = 0
+
+    def acquire(self):
+        """생산자가 쓸 슬롯 번호와 버퍼를 반환 (최신/사용 중 슬롯 제외)."""
+        with self._cond:
+            busy = {self._held, self._latest.slot if self._latest else None}
+            n = len(self.buffers)
+            for i in range(n):
+                slot = (self._next + i) % n
+                if slot not in busy:
+                    self._next = (slot + 1) % n
+                    return slot, self.buffers[slot]
+        raise RuntimeError("no free frame slot")  # slots >= 3 이면 발생하지 않음
+
+    def publish(self, slot: int, data=None, ts: float = None):
+        """슬롯을 최신 프레임으로 등록하고 대기 중인 소비자를 깨움.
+
+        data를 주지 않으면 미리 할당된 버퍼를 그대로 사용. 해상도가 달라 cap.read가 새 배열을
+        돌려준 경우나 MJPEG bytes는 data로 넘긴다.
+        """
+        with self._cond:
+            if self._latest is not None and self._latest.seq > self.consumed:
+                self.dropped += 1
+            self.seq += 1
+            ref = self._slots[slot]
+            ref.seq = self.seq
+            ref.ts = time.monotonic() if ts is None else ts
+            ref.data = self.buffers[slot] if data is None else data
+            self._latest = ref
+            self._cond.notify_all()
+
+    def get(self, last_seq: int = 0, timeout: float = None):
+        """last_seq 이후의 최신 프레임을 반환 (없으면 timeout까지 대기, 시간 초과 시 None).
+
+        이전에 get한 슬롯은 이 호출로 반환된다.
+        """
+        with self._cond:
+            self._held = None
+            if not self._cond.wait_for(lambda: self._latest is not None and self._latest.seq > last_seq, timeout):
+                return None
+            ref = self._latest
+            self._held = ref.slot
+            self.consumed = ref.seq
+            return ref
+
+    def stats(self):
+        return {"seq": self.seq, "dropped": self.dropped, "consumed": self.consumed}
@@ -0,0 +1,169 @@
+"""CPU/발열 기반 부하 조절기.
+
+키오스크 UI와 같은 보드에서 돌기 때문에 CPU 사용률과 SoC 온도를 주기적으로 읽어 단계(level)를 올리고 내린다.
+단계가 오를수록 스트림 FPS, JPEG 품질, 스트림 해상도, 비핵심 추론(ALIGNING이 아닐 때의 monitor/stable)을
+줄인다. ALIGNING 제어 경로(search/align/fine 추론, 캡처, 시리얼)는 어떤 단계에서도 건드리지 않는다.
+
+- 올림: CPU > cpu_high 또는 온도 > temp_high 가 up_samples번 연속 (temp_critical 이상이면 즉시 최고 단계)
+- 내림: CPU < cpu_low 이고 온도 < temp_low 가 hold_down초 유지
+- 모든 결정은 metrics 카운터(governor_step_up/down)와 decisions 기록으로 남김
+"""
+import glob
+import threading
+import time
+from collections import deque
+from typing import NamedTuple
+
+from async_log import print_log
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class GovernorLevel(NamedTuple):
+    stream_fps: float       # /video_feed 최대 FPS
+    jpeg_quality: int       # 스트림 JPEG 품질
+    stream_scale: float     # 스트림 해상도 배율
+    infer_scale: float      # 비핵심 추론(monitor/stable) Hz 배율 (0이면 끔)
+
+
+LEVELS = (
+    GovernorLevel(30.0, 60, 1.0, 1.0),    # 0: 정상
+    GovernorLevel(20.0, 50, 1.0, 0.7),
+    GovernorLevel(15.0, 45, 0.75, 0.5),
+    GovernorLevel(10.0, 40, 0.5, 0.25),
+    GovernorLevel(5.0, 35, 0.5, 0.0),     # 4: 최저 (비핵심 추론 중단)
+)
+
+THERMAL_ZONES = "/sys/class/thermal/thermal_zone*/temp"
+
+
+def read_soc_temp():
+    """thermal zone 중 가장 높은 온도(°C). 읽을 수 없으면 None."""
+    temps = []
+    for path in glob.glob(THERMAL_ZONES):
+        try:
+            with open(path) as f:
+                temps.append(int(f.read().strip()) / 1000.0)
+        except (OSError, ValueError):
+            continue
+    if not temps and psutil is not None and hasattr(psutil, "sensors_temperatures"):
+        try:
+            temps = [t.current for entries in psutil.sensors_temperatures().values() for t in entries]
+        except Exception:
+            pass
+    return max(temps) if temps else None
+
+
+class _ProcStatCPU:
+    """psutil이 없을 때 /proc/stat 차이로 전체 CPU 사용률 계산."""
+
+    def __init__(self):
+        self._prev = self._read()
+
+    @staticmethod
+    def _read():
+        try:
+            with open("/proc/stat") as f:
+                fields = [int(v) for v in f.readline().split()[1:]]
+        except (OSError, ValueError):
+            return None
+        idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+        return sum(fields), idle
+
+    def percent(self):
+        cur = self._read()
+        prev, self._prev = self._prev, cur
+        if cur is None or prev is None or cur[0] == prev[0]:
+            return None
+        total, idle = cur[0] - prev[0], cur[1] - prev[1]
+        return 100.0 * (1 - idle / total)
+
+
+class LoadGovernor:
+    def __init__(self, levels=LEVELS, interval: float = 1.0, cpu_high: float = 85.0, cpu_low: float = 60.0,
+                 temp_high: float = 75.0, temp_low: float = 68.0, temp_critical: float = 85.0,
+                 up_samples: int = 3, hold_down: float = 10.0, metrics=None, log=print_log):
+        self.levels = levels
+        self.interval = interval
+        self.cpu_high, self.cpu_low = cpu_high, cpu_low
+        self.temp_high, self.temp_low, self.temp_critical = temp_high, temp_low, temp_critical
+        self.up_samples = up_samples
+        self.hold_down = hold_down
+        self.metrics = metrics
+        self.log = log
+        self.index = 0
+        self.cpu = None
+        self.temp = None
+        self.decisions = deque(maxlen=50)
+        self._hot = 0
+        self._cool_since = None
+        self._proc_cpu = None if psutil is not None else _ProcStatCPU()
+        self._stop = threading.Event()
+
+    @property
+    def level(self) -> GovernorLevel:
+        return self.levels[self.index]
+
+    def start(self):
+        if psutil is not None:
+            psutil.cpu_percent(interval=None)  # 첫 호출은 기준값만 잡음
+        threading.Thread(target=self._loop, name="load-governor", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            cpu = psutil.cpu_percent(interval=None) if psutil is not None else self._proc_cpu.percent()
+            self.update(cpu, read_soc_temp(), time.monotonic())
+
+    def update(self, cpu, temp, now: float):
+        """측정값 1개를 반영해 단계를 조정 (테스트/리플레이용으로 직접 호출 가능)."""
+        self.cpu, self.temp = cpu, temp
+        cpu_v = cpu if cpu is not None else 0.0
+        temp_v = temp if temp is not None else 0.0
+        top = len(self.levels) - 1
+
+        if temp_v >= self.temp_critical and self.index < top:
+            self._set(top, now, f"temp {temp_v:.1f}C >= critical {self.temp_critical}C")
+            return
+        if cpu_v > self.cpu_high or temp_v > self.temp_high:
+            self._cool_since = None
+            self._hot += 1
+            if self._hot >= self.up_samples and self.index < top:
+                self._set(self.index + 1, now, f"cpu {cpu_v:.0f}% temp {temp_v:.1f}C over limit")
+                self._hot = 0
+            return
+        self._hot = 0
+        if cpu_v < self.cpu_low and temp_v < self.temp_low and self.index > 0:
+            if self._cool_since is None:
+                self._cool_since = now
+            elif now - self._cool_since >= self.hold_down:
+                self._set(self.index - 1, now, f"cpu {cpu_v:.0f}% temp {temp_v:.1f}C below limit")
+                self._cool_since = now
+        else:
+            self._cool_since = None
+
+    def _set(self, index, now, reason):
+        old, self.index = self.index, index
+        direction = "up" if index > old else "down"
+        self.decisions.append({"ts": time.time(), "from": old, "to": index, "reason": reason,
+                               "cpu": self.cpu, "temp": self.temp})
+        if self.metrics is not None:
+            self.metrics.inc(f"governor_step_{direction}")
+        self.log("GOV", f"level {old} -> {index} ({reason})", "warning" if direction == "up" else "info",
+                 **self.level._asdict())
+
+    def stats(self):
+        return {
+            "level": self.index,
+            "settings": self.level._asdict(),
+            "cpu_percent": None if self.cpu is None else round(self.cpu, 1),
+            "soc_temp_c": None if self.temp is None else round(self.temp, 1),
+            "limits": {"cpu_high": self.cpu_high, "cpu_low": self.cpu_low, "temp_high": self.temp_high,
+                       "temp_low": self.temp_low, "temp_critical": self.temp_critical},
+            "decisions": list(self.decisions),
+        }
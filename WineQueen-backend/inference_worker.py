@@ -0,0 +1,349 @@
+"""YOLO 추론 실행기.
+
+- LocalInference  : 현재 스레드에서 바로 추론 (기존 동작)
+- InferenceWorker : 별도 프로세스에서 추론. 프레임은 미리 할당한 공유 메모리 링 버퍼로
+                    넘기고(numpy 배열 pickling 없음), 결과는 작은 튜플로 돌려받음.
+
+- BatchedInference: 여러 유닛(카메라)이 모델 1개를 공유. 유닛마다 client() 핸들을 받아 제출하고,
+                    배치 스레드가 짧은 창(batch_window) 안에 모인 요청을 한 번의 forward로 추론.
+
+세 실행기(BatchedInference는 client 핸들)는 같은 인터페이스를 가진다:
+    idle            → 새 프레임을 받을 수 있는지
+    submit(frame, tag, imgsz) → 추론 요청 (바쁘면 False)
+    poll()          → 완료된 [(tag, List[Box], infer_ms), ...]
+"""
+import multiprocessing as mp
+import threading
+import time
+from multiprocessing import shared_memory
+from queue import Empty
+
+import numpy as np
+
+from async_log import print_log
+from detector import Box, Detector, create_detector
+
+MAX_FRAME_SHAPE = (480, 640, 3)
+
+
+class LocalInference:
+    """같은 스레드에서 동기 추론 (submit 즉시 결과가 poll에 쌓임)."""
+
+    def __init__(self, detector: Detector):
+        self.detector = detector
+        self.names = detector.names
+        self._done = []
+
+    @property
+    def idle(self):
+        return True
+
+    def submit(self, frame, tag=None, imgsz=None):
+        t0 = time.perf_counter()
+        boxes = self.detector.predict(frame, imgsz)
+        self._done.append((tag, boxes, (time.perf_counter() - t0) * 1000))
+        return True
+
+    def poll(self):
+        done, self._done = self._done, []
+        return done
+
+    def warmup(self, shape, imgsz=None):
+        self.detector.warmup(shape, imgsz)
+
+    def close(self):
+        pass
+
+
+class _BatchClient:
+    """BatchedInference를 쓰는 유닛 1개의 핸들 (유닛당 동시에 1건만 대기)."""
+
+    def __init__(self, runner, name):
+        self.runner = runner
+        self.name = name
+        self.names = runner.names
+        self.last_submit = 0.0
+        self._pending = False
+        self._done = []
+        self._lock = threading.Lock()
+
+    @property
+    def idle(self):
+        return not self._pending
+
+    def submit(self, frame, tag=None, imgsz=None):
+        if self._pending:
+            return False
+        self._pending = True
+        self.last_submit = time.monotonic()
+        # 프레임은 링 버퍼 슬롯일 수 있으므로 복사본을 넘김 (배치 스레드에서 나중에 읽음)
+        self.runner._enqueue(self, np.array(frame, copy=True), tag, imgsz)
+        return True
+
+    def _finish(self, tag, boxes, infer_ms):
+        with self._lock:
+            self._done.append((tag, boxes, infer_ms))
+        self._pending = False
+
+    def poll(self):
+        with self._lock:
+            done, self._done = self._done, []
+        return done
+
+    def warmup(self, shape, imgsz=None):
+        self.runner.warmup(shape, imgsz)
+
+    def close(self):
+        pass  # 공유 모델은 BatchedInference.close()에서 정리
+
+
+class BatchedInference:
+    """여러 유닛이 공유하는 배치 추론기.
+
+    첫 요청이 들어오면 최대 batch_window초 동안(최근 제출한 유닛이 모두 제출하면 바로) 더 모은 뒤
+    imgsz가 같은 요청끼리 detector.predict_batch()로 한 번에 추론한다.
+    infer_ms는 배치 전체 시간 (스케줄러 상한 계산에 그대로 쓰임).
+    """
+
+    def __init__(self, detector: Detector, batch_window: float = 0.01, max_batch: int = 8,
+                 active_window: float = 1.0, metrics=None, log=print_log):
+        self.detector = detector
+        self.names = detector.names
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.active_window = active_window  # 이 시간 안에 제출한 유닛만 배치를 기다려 줌
+        self.metrics = metrics
+        self.log = log
+        self.clients = []
+        self.batches = 0
+        self.batched_frames = 0
+        self._queue = []  # (client, frame, tag, imgsz)
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+
+    def client(self, name: str) -> _BatchClient:
+        c = _BatchClient(self, name)
+        self.clients.append(c)
+        return c
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="yolo-batch", daemon=True)
+        self._thread.start()
+
+    def _enqueue(self, client, frame, tag, imgsz):
+        with self._cond:
+            self._queue.append((client, frame, tag, imgsz))
+            self._cond.notify()
+
+    def _expected(self, now):
+        return sum(1 for c in self.clients if now - c.last_submit <= self.active_window)
+
+    def _collect(self):
+        with self._cond:
+            while not self._queue and not self._stop:
+                self._cond.wait()
+            if self._stop:
+                return None
+            deadline = time.monotonic() + self.batch_window
+            while len(self._queue) < min(self._expected(time.monotonic()), self.max_batch):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            jobs, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+        return jobs
+
+    def _loop(self):
+        while True:
+            jobs = self._collect()
+            if jobs is None:
+                return
+            groups = {}
+            for job in jobs:
+                groups.setdefault(job[3], []).append(job)
+            for imgsz, group in groups.items():
+                t0 = time.perf_counter()
+                try:
+                    results = self.detector.predict_batch([job[1] for job in group], imgsz)
+                except Exception as e:
+                    self.log("YOLO", f"batch inference error: {e}", "error")
+                    results = [[] for _ in group]
+                infer_ms = (time.perf_counter() - t0) * 1000
+                self.batches += 1
+                self.batched_frames += len(group)
+                if self.metrics is not None:
+                    self.metrics.observe("inference_batch", infer_ms)
+                    self.metrics.inc("inference_batches")
+                for (client, _, tag, _), boxes in zip(group, results):
+                    client._finish(tag, boxes, infer_ms)
+
+    @property
+    def mean_batch_size(self):
+        return self.batched_frames / self.batches if self.batches else 0.0
+
+    def warmup(self, shape, imgsz=None):
+        self.detector.warmup(shape, imgsz)
+        if len(self.clients) > 1:
+            frames = [np.zeros(shape, dtype=np.uint8)] * len(self.clients)
+            self.detector.predict_batch(frames, imgsz)  # 유닛 수만큼의 배치 크기도 미리 한 번
+
+    def close(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+
+
+def _worker_main(shm_name, slots, slot_shape, detector_args, requests, results):
+    """추론 프로세스 본체: 공유 메모리 슬롯에서 프레임을 읽어 추론."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slot_bytes = int(np.prod(slot_shape))
+    try:
+        detector = create_detector(**detector_args)  # 로그는 기본 print_log (부모의 로거는 프로세스를 못 넘음)
+        results.put(("ready", detector.names))
+        while True:
+            req = requests.get()
+            if req is None:
+                break
+            job_id, slot, shape, imgsz = req
+            if job_id == "warmup":
+                try:
+                    detector.warmup(shape, imgsz)
+                    results.put(("warm", None))
+                except Exception as e:  # 없는 artifact 등: 프로세스는 살려 두고 부모에게 원인을 전달
+                    results.put(("warm", f"{type(e).__name__}: {e}"))
+                continue
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+            t0 = time.perf_counter()
+            boxes = detector.predict(frame, imgsz)
+            infer_ms = (time.perf_counter() - t0) * 1000
+            results.put((job_id, slot, [tuple(b) for b in boxes], infer_ms))
+    finally:
+        shm.close()
+
+
+class InferenceWorker:
+    """별도 프로세스 추론기. 슬롯이 모두 사용 중이면 새 프레임은 받지 않음(큐 적체 없음).
+
+    프로세스가 죽으면 poll()이 백그라운드 스레드로 재시작한다 (실패하면 restart_backoff 간격을 늘려 가며
+    재시도). 재시작 중에는 idle=False, poll()=[] 이므로 감지 스레드는 막히지 않고 스트림 발행을 계속한다.
+    """
+
+    def __init__(self, detector_args: dict, slots: int = 2, max_inflight: int = 1, slot_shape=MAX_FRAME_SHAPE,
+                 restart_timeout: float = 60.0, restart_backoff=(1.0, 30.0), warmup_timeout: float = 60.0,
+                 log=print_log):
+        self.detector_args = detector_args
+        self.log = log  # 워커 프로세스로 넘기지 않음 (부모 프로세스에서만 사용)
+        self.slots = slots
+        self.max_inflight = max_inflight
+        self.slot_shape = slot_shape
+        self.restart_timeout = restart_timeout  # 재시작 시 모델 로드 대기 상한(s)
+        self.restart_backoff = restart_backoff  # 재시도 간격 (최소, 최대) s
+        self.warmup_timeout = warmup_timeout
+        self.restarts = 0
+        self.names = {}
+        self._slot_bytes = int(np.prod(slot_shape))
+        self._shm = None
+        self._proc = None
+        self._free = []
+        self._pending = {}  # job_id -> (slot, tag)
+        self._job_id = 0
+        self._warm_shapes = []    # 재시작 후 다시 워밍업할 (shape, imgsz)
+        self._restarting = False
+
+    def start(self, timeout: float = 120.0):
+        ctx = mp.get_context("spawn")
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * self._slot_bytes)
+        self._requests = ctx.Queue()
+        self._results = ctx.Queue()
+        self._proc = ctx.Process(target=_worker_main, name="yolo-worker", daemon=True,
+                                 args=(self._shm.name, self.slots, self.slot_shape, self.detector_args,
+                                       self._requests, self._results))
+        self._proc.start()
+        self._free = list(range(self.slots))
+        self._pending.clear()
+        _, self.names = self._results.get(timeout=timeout)
+        self.log("YOLO", f"inference worker ready (pid={self._proc.pid})")
+
+    def _slot_view(self, slot, shape):
+        return np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf, offset=slot * self._slot_bytes)
+
+    @property
+    def idle(self):
+        return not self._restarting and len(self._pending) < self.max_inflight and bool(self._free)
+
+    def submit(self, frame, tag=None, imgsz=None):
+        if not self.idle:
+            return False
+        if frame.nbytes > self._slot_bytes:
+            raise ValueError(f"frame {frame.shape} exceeds slot shape {self.slot_shape}")
+        slot = self._free.pop()
+        np.copyto(self._slot_view(slot, frame.shape), frame)
+        self._job_id += 1
+        self._pending[self._job_id] = (slot, tag)
+        self._requests.put((self._job_id, slot, frame.shape, imgsz))
+        return True
+
+    def poll(self):
+        if self._restarting:
+            return []
+        done = []
+        while True:
+            try:
+                job_id, slot, boxes, infer_ms = self._results.get_nowait()
+            except Empty:
+                break
+            _, tag = self._pending.pop(job_id, (slot, None))
+            self._free.append(slot)
+            done.append((tag, [Box(*b) for b in boxes], infer_ms))
+        if not done and self._proc is not None and not self._proc.is_alive():
+            self.log("YOLO", f"inference worker died (exit={self._proc.exitcode}), restarting", "error")
+            self._restarting = True
+            threading.Thread(target=self._restart_loop, name="yolo-worker-restart", daemon=True).start()
+        return done
+
+    def _restart_loop(self):
+        """죽은 프로세스를 정리하고 성공할 때까지 재시작 (재시작 중에는 감지 스레드가 이 객체를 건드리지 않음)."""
+        delay, max_delay = self.restart_backoff
+        while True:
+            self.close()
+            try:
+                self.start(timeout=self.restart_timeout)
+                for shape, imgsz in self._warm_shapes:
+                    self._warmup(shape, imgsz)
+                break
+            except Exception as e:
+                self.log("YOLO", f"inference worker restart failed: {e!r}, retry in {delay:.0f}s", "error")
+                time.sleep(delay)
+                delay = min(delay * 2, max_delay)
+        self.restarts += 1
+        self._restarting = False
+
+    def warmup(self, shape, imgsz=None):
+        self._warmup(shape, imgsz)
+        self._warm_shapes.append((tuple(shape), imgsz))
+
+    def _warmup(self, shape, imgsz):
+        self._requests.put(("warmup", None, tuple(shape), imgsz))
+        try:
+            _, error = self._results.get(timeout=self.warmup_timeout)
+        except Empty:
+            raise TimeoutError(f"inference worker warmup {tuple(shape)} imgsz={imgsz} timed out "
+                               f"after {self.warmup_timeout:.0f}s")
+        if error:
+            raise RuntimeError(f"inference worker warmup imgsz={imgsz} failed: {error}")
+
+    def close(self):
+        if self._proc is not None:
+            try:
+                self._requests.put(None)
+                self._proc.join(timeout=2)
+                if self._proc.is_alive():
+                    self._proc.terminate()
+            except Exception:
+                pass
+            self._proc = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
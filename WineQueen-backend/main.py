@@ -1,233 +1,634 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.requests import HTTPConnection, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
-from ultralytics import YOLO
 import cv2
 import threading
-import json
 import time
 import os
 import asyncio
-from queue import Queue, Empty
-import serial  # 시리얼 통신 라이브러리
 import numpy as np # 처음에 바로 yolo키기 위한 임포트
+from frame_hub import FrameHub, StreamVariant, mjpeg_stream, pick_variant
+from frame_ring import FrameRing
+from detector import create_detector
+from inference_worker import BatchedInference, InferenceWorker, LocalInference
+from tracker import BoxTracker
+from alignment import make_controller
+from scheduler import InferenceScheduler
+from governor import LoadGovernor
+from serial_transport import SerialTransport
+from ws_hub import WSBroadcaster
+from metrics import PipelineMetrics, StateClock, elapsed_ms, render_prometheus
+from async_log import AsyncLogger
+from calibrate import ROI_DECODE_MIN_SIZE, infer_decode_min_size, load_operating_point
+from session_store import SessionStore, SessionTracker
+from static_assets import AssetTable
+from state_machine import (ALIGNING, OPENING, OPEN_REDIRECT, PROCESS_FINISHED, SEALING, SEAL_REDIRECT, STAY,
+                           StationMachine, TimerService)
+from simulation import SimWorld, VirtualArduino, open_frame_source
+from units import UnitConfig, load_unit_configs
+try:
+    import simplejpeg  # MJPEG 패스스루/축소 디코드용 (없으면 일반 BGR 캡처로 동작)
+except ImportError:
+    simplejpeg = None
 
 # =========================
 # 전역 설정/상수
 # ========================
-model = YOLO("best_wCrop.pt")
-model.fuse()
+# 추론 설정 (백엔드: torch | onnx | openvino | sim, 사전 export는 `python detector.py export ...`)
+MODEL_WEIGHTS = "best_wCrop.pt"
+# 운영점(백엔드/imgsz/ROI imgsz/conf/max_det)은 `python calibrate.py sweep ...`이 쓴 설정 파일이 있으면 그 값을 사용
+# (백엔드/INT8은 환경 변수가 우선, 파일이 없으면 아래 기본값)
+DETECTOR_CONFIG = os.getenv("WINEQUEEN_DETECTOR_CONFIG", "detector_config.json")
+OPERATING_POINT = load_operating_point(DETECTOR_CONFIG) or {}
+INFER_BACKEND = os.getenv("WINEQUEEN_INFER_BACKEND", OPERATING_POINT.get("backend", "torch"))
+INFER_INT8 = os.getenv("WINEQUEEN_INFER_INT8", "1" if OPERATING_POINT.get("int8") else "0") == "1"
+INFER_IMGSZ = OPERATING_POINT.get("imgsz", 128)
+INFER_CONF = OPERATING_POINT.get("conf", 0.5)
+INFER_MAX_DET = OPERATING_POINT.get("max_det", 1)
+# 추적 중 ROI 추론 입력 크기 (전체 프레임보다 작고 해상도는 더 높음), 축소 디코드 크기는 calibrate.ROI_DECODE_MIN_SIZE
+ROI_IMGSZ = OPERATING_POINT.get("roi_imgsz", 96)
+# thread: detection_loop 안에서 추론 / process: 별도 프로세스(공유 메모리 프레임 전달)
+# 유닛이 여러 개면 항상 공유 배치 추론기(BatchedInference) 사용
+INFER_MODE = os.getenv("WINEQUEEN_INFER_MODE", "thread")
+INFER_BATCH_WINDOW = 0.01  # 다른 유닛의 요청을 기다려 함께 배치하는 최대 시간(s)
 
-# 카메라/시리얼 전역 핸들
-cap = None
+DETECTOR_ARGS = dict(weights=MODEL_WEIGHTS, backend=INFER_BACKEND, imgsz=INFER_IMGSZ,
+                     conf=INFER_CONF, max_det=INFER_MAX_DET, int8=INFER_INT8)
+
+# 모델은 lifespan에서 백그라운드 스레드(load_model)로 로드 → API/스트림은 바로 시작하고 준비되면 WS로 알림
+# (process 모드의 워커도 여기서 만들지 않음: spawn 시 이 모듈이 재import되므로)
+# 모든 유닛이 모델 1개를 공유하고, 유닛별 추론 핸들은 Unit.infer
+model = None
+roi_inference = True  # ROI imgsz 워밍업(artifact 준비)에 실패하면 False → 전체 프레임으로만 추론
+MODEL_STATUS = {"type": "model", "status": "loading", "backend": INFER_BACKEND, "int8": INFER_INT8,
+                "mode": INFER_MODE, "imgsz": INFER_IMGSZ, "roi_imgsz": ROI_IMGSZ, "conf": INFER_CONF,
+                "detector_config": DETECTOR_CONFIG if OPERATING_POINT else None, "load_s": None, "error": None}
+
+# 카메라/시리얼 기본 설정 (WINEQUEEN_UNITS가 없을 때의 단일 유닛)
+CAMERA_DEVICE = "/dev/winecam"
+CAMERA_WIDTH, CAMERA_HEIGHT = 640, 480
+# True면 카메라의 MJPEG 압축 프레임을 그대로 받아 필요할 때만 디코드
+CAMERA_RAW_MJPEG = True
 SERIAL_PORT = '/dev/arduino'
 BAUD_RATE = 9600
-ser = None
-
-# YOLO 토글
-YOLO_ON = False
-def set_yolo_active(active: bool):
-    """YOLO 추론 사용 토글 (카메라는 그대로 유지)."""
-    global YOLO_ON
-    with state_lock:
-        YOLO_ON = active
-        print(f"[YOLO] {'ON' if active else 'OFF'}")
-
-# 버튼 이벤트 큐
-button_queue = Queue()
-
-# 상태 머신
-STAY = "STAY"
-ALIGNING = "ALIGNING"
-SEALING = "SEALING"
-OPENING = "OPENING"
-
-SYSTEM_STATE = STAY
-TARGET_ACTION = None  # 'S' or 'O' 
-
-state_lock = threading.Lock()
-serial_lock = threading.Lock()
-
-# 클라이언트 및 프레임 공유
-clients = []
-latest_annotated_frame = None
-latest_detections_json = "{}"
-frame_lock = threading.Lock()
-detections_lock = threading.Lock()
-
-# ✅ 프레임 공유를 위한 큐
-frame_queue = Queue(maxsize=2)
+
+# 하드웨어 없이 돌리기 위한 시뮬레이션 설정 (simulation.py 참고)
+# WINEQUEEN_CAMERA: "" (실제 카메라) | video:PATH | images:DIR | synthetic
+# WINEQUEEN_SERIAL: "" (실제 아두이노) | sim (pty 가상 아두이노)
+CAMERA_SOURCE = os.getenv("WINEQUEEN_CAMERA", "")
+SERIAL_SOURCE = os.getenv("WINEQUEEN_SERIAL", "")
+SIM_SPEED = float(os.getenv("WINEQUEEN_SIM_SPEED", "1"))
+
+# 유닛(스테이션) 등록부: WINEQUEEN_UNITS (JSON 파일 경로 또는 JSON 문자열, units.py 참고)
+# 첫 번째 유닛이 접두사 없는 기존 경로(/ws, /video_feed, /control/...)를 맡고,
+# 모든 유닛은 /units/{id}/ws, /units/{id}/video_feed, /units/{id}/control/... 로 접근
+DEFAULT_UNIT_CONFIG = UnitConfig("main", CAMERA_SOURCE or CAMERA_DEVICE,
+                                 "sim" if SERIAL_SOURCE == "sim" else SERIAL_PORT)
+UNIT_CONFIGS = load_unit_configs(os.getenv("WINEQUEEN_UNITS", ""), DEFAULT_UNIT_CONFIG)
+
+# 정렬 제어기 (proportional | bangbang), 이득 등은 ALIGN_PARAMS로 조정
+ALIGN_CONTROLLER = os.getenv("WINEQUEEN_ALIGN_CONTROLLER", "proportional")
+ALIGN_PARAMS = {"deadzone_px": 3.0}
+
+# 추론 스케줄러: 상태/병 위치에 따라 목표 Hz를 정함 (off/search/align/fine/monitor/stable, scheduler.py)
+INFER_RATES_HZ = {}  # 예: {"fine": 20.0, "stable": 0.5}
+
+# 상태 머신 (state_machine.py): 시리얼/감지/HTTP/타이머 이벤트로만 전이
+# 'C' 전송 후 목표 동작(S/O)을 보내기까지의 지연 (감지 스레드를 재우지 않고 타이머로 처리)
+STATE_CONFIRM_DELAY = 0.2
+# 유닛들의 상태 머신 타이머를 처리하는 스레드 1개
+state_timers = TimerService()
+
+# ✅ 단계별 지연/카운터 측정 (캡처 → 추론 → 인코딩 → 스트림/WS 전송, /metrics·/debug/pipeline·bench.py)
+# 모든 유닛이 함께 기록 (유닛별 값은 pipeline_counters/pipeline_gauges에서 unit 라벨로)
+pipeline_metrics = PipelineMetrics()
+
+# ✅ 비동기 로그: 핫패스(정렬/시리얼/WS)는 큐에 넣기만 하고 writer 스레드가 출력, 태그별 반복 메시지 제한
+# WINEQUEEN_LOG_FORMAT: text ("[TAG] 메시지", 기존 형식) | json (한 줄에 JSON 1개, journald/수집기용)
+LOG_FORMAT = os.getenv("WINEQUEEN_LOG_FORMAT", "text")
+logger = AsyncLogger(fmt=LOG_FORMAT, metrics=pipeline_metrics)
+log = logger.log
+
+# ✅ 밀봉/개봉 세션 기록 (SQLite, writer 스레드가 배치로 씀, /sessions로 조회)
+SESSION_DB = os.getenv("WINEQUEEN_SESSION_DB", "sessions.db")
+session_store = SessionStore(SESSION_DB, metrics=pipeline_metrics, log=log)
+
+# ✅ CPU/발열 부하 조절기: 스트림 FPS/품질/해상도와 비핵심 추론을 단계적으로 낮춤 (ALIGNING 제어 경로는 제외)
+governor = LoadGovernor(metrics=pipeline_metrics, log=log)
+
+# ✅ 스트림 화질 variant별 공유 허브 (/video_feed?w=&q=&fps= 는 가장 가까운 variant로 맞춤)
+# variant마다 프레임당 1회만 인코딩해 같은 variant 구독자가 공유, 구독자가 없는 variant는 인코딩하지 않음
+STREAM_VARIANTS = {
+    "full":   StreamVariant(640, 60, 30.0),   # 키오스크 (기존 화질)
+    "medium": StreamVariant(480, 50, 15.0),
+    "small":  StreamVariant(320, 40, 10.0),   # 원격 휴대폰
+    "thumb":  StreamVariant(160, 35, 5.0),
+}
+DEFAULT_STREAM_VARIANT = "full"
+
+# =========================
+# 유닛 (스테이션 1대의 장치/상태)
+# =========================
+class Unit:
+    """카메라 1대 + 아두이노 1개 + 상태 머신 + WS/스트림 허브. 추론 모델만 모든 유닛이 공유."""
+
+    def __init__(self, config: UnitConfig):
+        self.id = config.id
+        self.config = config
+        self.tag = "" if len(UNIT_CONFIGS) == 1 else f"[{config.id}]"  # 로그 구분용
+
+        # 카메라/시리얼 핸들
+        self.cap = None
+        self.camera_raw_active = False  # 현재 열린 카메라가 실제로 압축 프레임을 주는지 여부
+        self.sim_world = None
+        if config.camera == "synthetic" or config.sim_serial:
+            self.sim_world = SimWorld(CAMERA_WIDTH, CAMERA_HEIGHT, speed=SIM_SPEED)
+        self.virtual_arduino = None
+        # 읽기/쓰기 스레드가 분리된 시리얼 전송 계층 (E는 우선 전송, 끊기면 자동 재연결)
+        self.serial_transport = SerialTransport(config.serial, BAUD_RATE,
+                                                on_line=lambda line: handle_serial_line(self, line),
+                                                metrics=pipeline_metrics, log=self.log)
+
+        # 상태 머신 (SYSTEM_STATE / 목표 동작 / YOLO 토글), 바뀌면 on_transition이 바로 알림을 받음
+        self.machine = StationMachine(lambda command: send_serial_command(self, command),
+                                      confirm_delay=STATE_CONFIRM_DELAY, timers=state_timers)
+        self.machine.subscribe(lambda transition: on_transition(self, transition))
+        self.state_clock = StateClock(STAY)  # 상태별 체류 시간
+        self.sessions = SessionTracker(config.id, idle_state=STAY, process_states=(SEALING, OPENING))
+        self.serial_commands = 0      # 보낸 시리얼 명령 수 (세션별 명령 수 계산용)
+
+        self.infer = None  # 모델 로드 후 채워지는 이 유닛의 추론 핸들
+        # 시뮬레이션 배속이면 스테이지가 그만큼 빨리 움직이므로 제어기 시간 파라미터도 같은 배율로
+        self.aligner = make_controller(ALIGN_CONTROLLER, speed=SIM_SPEED if self.sim_world else 1.0, **ALIGN_PARAMS)
+        self.scheduler = InferenceScheduler(INFER_RATES_HZ)
+
+        # ✅ WS 클라이언트 관리 + 변경 시에만 push하는 단일 브로드캐스터
+        self.ws_hub = WSBroadcaster(metrics=pipeline_metrics, log=self.log)
+        self.stream_hubs = {name: FrameHub(metrics=pipeline_metrics) for name in STREAM_VARIANTS}
+        # ✅ 프레임 공유를 위한 최신 프레임 링 버퍼 (미리 할당된 640x480x3 버퍼 재사용)
+        self.frame_ring = FrameRing((CAMERA_HEIGHT, CAMERA_WIDTH, 3), slots=3)
+
+    @property
+    def frame_hub(self):
+        return self.stream_hubs[DEFAULT_STREAM_VARIANT]  # 파라미터 없는 /video_feed
+
+    def log(self, tag: str, msg: str, level: str = "info", **fields):
+        """비동기 로그 (유닛이 여러 개면 unit 필드를 붙임)."""
+        if self.tag:
+            fields["unit"] = self.id
+        return log(tag, msg, level, **fields)
+
+    @property
+    def state(self):
+        return self.machine.state
+
+    @property
+    def target_action(self):
+        return self.machine.target_action  # 'S\n' or 'O\n'
+
+    @property
+    def yolo_on(self):
+        return self.machine.yolo_on
+
+    def set_yolo_active(self, active: bool):
+        """YOLO 추론 사용 토글 (카메라는 그대로 유지)."""
+        self.machine.dispatch("command", "yolo_on" if active else "yolo_off")
+
+units = {config.id: Unit(config) for config in UNIT_CONFIGS}
+default_unit = units[UNIT_CONFIGS[0].id]
 
 # =========================
 # 하드웨어 보조 함수
 # =========================
-def ensure_serial_open():
-    global ser
-    if ser is None or not ser.is_open:
-        try:
-            ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
-            print(f"[SER] open OK {SERIAL_PORT} {BAUD_RATE}")
-            time.sleep(2)  # 아두이노 리셋 대기
-            return True
-        except Exception as e:
-            print(f"[SER] open FAIL: {e}")
-            ser = None
-            return False
-    return True
+def is_jpeg(buf) -> bool:
+    return len(buf) > 4 and buf[0] == 0xFF and buf[1] == 0xD8
 
-def ensure_camera_open():
-    global cap
-    if cap is not None and cap.isOpened():
+def ensure_camera_open(unit: Unit):
+    if unit.cap is not None and unit.cap.isOpened():
         return True
+
+    if unit.config.sim_camera:
+        unit.cap = open_frame_source(unit.config.camera, CAMERA_WIDTH, CAMERA_HEIGHT,
+                                     world=unit.sim_world, speed=SIM_SPEED)
+        unit.camera_raw_active = False
+        unit.log("CAM", f"open {'OK' if unit.cap.isOpened() else 'FAIL'} {unit.config.camera} (simulated, x{SIM_SPEED})")
+        return unit.cap.isOpened()
     
     try:
-        device = "/dev/winecam"
-        cap = cv2.VideoCapture(device, cv2.CAP_V4L2)
+        device = unit.config.camera
+        unit.cap = cap = cv2.VideoCapture(device, cv2.CAP_V4L2)
         
         cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
         cap.set(cv2.CAP_PROP_FPS, 30) # FPS는 높게 유지하여 최신 프레임을 받도록 함
         cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
+        want_raw = CAMERA_RAW_MJPEG and simplejpeg is not None
+        if want_raw:
+            cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)  # 디코드하지 않고 MJPEG 원본 바이트 수신
         
         if cap.isOpened():
             for _ in range(5):
-                cap.read()
-            print(f"[CAM] open OK {device}")
+                ret, frame = cap.read()
+            # 드라이버가 CONVERT_RGB=0을 무시하면 BGR 프레임이 오므로 일반 모드로 되돌림
+            unit.camera_raw_active = want_raw and ret and frame.ndim <= 2 and is_jpeg(frame.reshape(-1))
+            if want_raw and not unit.camera_raw_active:
+                cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+            unit.log("CAM", f"open OK {device} ({'MJPEG passthrough' if unit.camera_raw_active else 'BGR'})")
             return True
         else:
-            print(f"[CAM] open FAIL {device}")
-            cap = None
+            unit.log("CAM", f"open FAIL {device}", "warning")
+            unit.cap = None
             return False
     except Exception as e:
-        print(f"[CAM] exception: {e}")
-        cap = None
+        unit.log("CAM", f"exception: {e}", "error")
+        unit.cap = None
         return False
 
 # =========================
 # 카메라 리더 루프 (신규 스레드)
 # =========================
-def camera_reader_loop():
-    """카메라에서 프레임을 계속 읽어 큐에 넣는 스레드."""
-    global cap
+def camera_reader_loop(unit: Unit):
+    """유닛의 카메라에서 프레임을 계속 읽어 링 버퍼에 넣는 스레드."""
+    frame_ring = unit.frame_ring
     while True:
-        if not ensure_camera_open():
+        if not ensure_camera_open(unit):
             time.sleep(1.0)
             continue
 
-        ret, frame = cap.read()
+        cap = unit.cap
+        if unit.camera_raw_active:
+            # MJPEG 원본은 크기가 매번 달라 bytes로 전달 (압축 프레임이라 작음)
+            slot, _ = frame_ring.acquire()
+            t0 = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                time.sleep(0.05)
+                continue
+            pipeline_metrics.observe("capture", elapsed_ms(t0))
+            frame = frame.tobytes()
+            if not is_jpeg(frame):
+                continue
+            frame_ring.publish(slot, frame)
+            continue
+
+        # 미리 할당된 버퍼에 바로 디코드 (해상도가 다르면 OpenCV가 새 배열을 돌려줌)
+        slot, buf = frame_ring.acquire()
+        t0 = time.perf_counter()
+        ret, frame = cap.read(buf)
         if not ret:
             time.sleep(0.05)
             continue
+        pipeline_metrics.observe("capture", elapsed_ms(t0))
+        frame_ring.publish(slot, None if frame is buf else frame)
+        # cap.read()가 다음 프레임까지 블록하므로 별도 sleep 없음
 
-        # 큐가 꽉 찼으면, 가장 오래된 프레임을 버리고 새 프레임을 넣음
-        if frame_queue.full():
-            try:
-                frame_queue.get_nowait()
-            except Empty:
-                pass
-        frame_queue.put(frame)
-        time.sleep(1/60) # CPU 사용량을 줄이기 위해 약간의 대기 (60fps 목표)
+# =========================
+# 스트림 오버레이/인코딩 보조 함수
+# =========================
+# True면 /video_feed 구독자가 있을 때만 오버레이 그리기 + JPEG 인코딩 수행
+STREAM_ON_DEMAND = True
+# 썸네일(40x30)을 FRAME_CHANGE_CELL px 칸으로 나눠 칸별 평균 밝기 차이를 보고, 가장 큰 칸도 이 값 이하이면
+# '변화 없음'으로 보고 재인코딩 생략 (전체 평균은 화면 일부의 작은 움직임이 묻혀 버림)
+FRAME_CHANGE_CELL = 5
+FRAME_CHANGE_THRESHOLD = 4.0
+# 이 시간(s) 동안 새 프레임이 없으면 마지막 프레임을 다시 보냄 (정지 화면 keepalive)
+STREAM_KEEPALIVE = 1.0
+# MJPEG 패스스루 모드에서 YOLO가 꺼져 있으면 오버레이 없이 카메라 JPEG를 그대로 스트림
+STREAM_RAW_WHEN_YOLO_OFF = True
+# 추론용 축소 디코드 최소 크기 (w, h) → imgsz=128, 640x480 입력이면 1/4 스케일(160x120)로 디코드
+# (캘리브레이션으로 imgsz가 커지면 letterbox에서 다시 키우지 않도록 더 크게 디코드)
+INFER_DECODE_MIN_SIZE = infer_decode_min_size(INFER_IMGSZ)
+
+# 감지 후 추적: YOLO 실행 사이에는 추적기가 병 중심을 추정하고, 다음 YOLO는 마지막 박스 주변만 잘라서 실행
+TRACKER_ENABLED = True
+
+def decode_jpeg(jpeg, min_size=None):
+    """MJPEG 프레임을 BGR로 디코드. min_size를 주면 DCT 단계에서 축소 디코드."""
+    if min_size is None:
+        return simplejpeg.decode_jpeg(jpeg, colorspace='BGR')
+    return simplejpeg.decode_jpeg(jpeg, colorspace='BGR',
+                                  min_width=min_size[0], min_height=min_size[1])
+
+def jpeg_thumbnail(jpeg):
+    """1/8 축소 디코드로 만든 변화 감지용 썸네일 (전체 디코드 없이)."""
+    return frame_thumbnail(decode_jpeg(jpeg, min_size=(40, 30)))
+
+def drop_corrupt_frame(unit, ref, err, last_log):
+    """디코드할 수 없는 MJPEG 프레임(잘림/깨짐)은 버리고 계속. 로그는 1초에 1번만. 새 last_log를 반환."""
+    pipeline_metrics.inc("frames_corrupt")
+    now = time.monotonic()
+    if now - last_log < 1.0:
+        return last_log
+    unit.log("CAM", f"corrupt frame seq={ref.seq} dropped: {err}", "warning")
+    return now
+
+def box_xyxy(box, xform=(1.0, 1.0, 0, 0)):
+    """감지 박스 좌표를 원본 프레임 좌표(int)로 변환. xform = (sx, sy, ox, oy)."""
+    sx, sy, ox, oy = xform
+    return (int(ox + box.x1 * sx), int(oy + box.y1 * sy),
+            int(ox + box.x2 * sx), int(oy + box.y2 * sy))
+
+def prepare_inference(frame, jpeg, w, h, roi=None):
+    """추론 입력 프레임, 원본 좌표 변환(xform), imgsz를 만든다.
+
+    roi가 없으면 전체 프레임(패스스루면 1/4 축소 디코드), 있으면 해당 영역만 잘라냄.
+    """
+    if roi is None:
+        infer_frame = frame if jpeg is None else decode_jpeg(jpeg, INFER_DECODE_MIN_SIZE)
+        return infer_frame, (w / infer_frame.shape[1], h / infer_frame.shape[0], 0, 0), None
+    src = frame if jpeg is None else decode_jpeg(jpeg, ROI_DECODE_MIN_SIZE)
+    sx, sy = w / src.shape[1], h / src.shape[0]
+    x1, y1 = int(roi[0] / sx), int(roi[1] / sy)
+    x2, y2 = int(roi[2] / sx), int(roi[3] / sy)
+    crop = np.ascontiguousarray(src[y1:y2, x1:x2])
+    return crop, (sx, sy, x1 * sx, y1 * sy), ROI_IMGSZ
+
+def frame_thumbnail(frame):
+    """변화 감지용 저해상도 그레이 썸네일 (40x30)."""
+    small = cv2.resize(frame, (40, 30), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+def frame_changed(prev_thumb, thumb):
+    """칸(FRAME_CHANGE_CELL x FRAME_CHANGE_CELL)별 평균 차이 중 최대값으로 판정 (국소 변화 감지, 잡음은 칸 평균으로 억제)."""
+    diff = cv2.absdiff(prev_thumb, thumb)
+    c = FRAME_CHANGE_CELL
+    rows, cols = diff.shape[0] // c, diff.shape[1] // c
+    cells = diff[:rows * c, :cols * c].reshape(rows, c, cols, c).mean(axis=(1, 3))
+    return float(cells.max()) > FRAME_CHANGE_THRESHOLD
+
+def draw_overlay(frame, current_state, target_action, yolo_active, detections):
+    """십자선/감지 박스/상태 텍스트를 프레임에 그림 (스트림 전용)."""
+    h, w, _ = frame.shape
+    cam_center_x, cam_center_y = w // 2, h //2
+    cv2.line(frame, (0, cam_center_y), (w, cam_center_y), (0, 255, 255), 1)
+    cv2.circle(frame, (cam_center_x, cam_center_y), 5, (255, 0, 0), -1)
+    cv2.putText(frame, f"(X:{cam_center_x}, Y:{cam_center_y})", (cam_center_x + 10, cam_center_y + 10),cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
+
+    if yolo_active:
+        for det in detections:
+            x1, y1 = det["x"], det["y"]
+            x2, y2 = x1 + det["w"], y1 + det["h"]
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            label_text = f"{det['class_name']} {det['conf']:.2f}"
+            cv2.putText(frame, label_text, (x1, y1 - 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+            coord_text = f"({det['relative_center']['x']}, {det['relative_center']['y']})"
+            cv2.putText(frame, coord_text, (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+    else:
+        cv2.putText(frame, "YOLO: OFF", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+
+    status_text = f"State: {current_state}"
+    if target_action:
+        target_display = "SEAL" if target_action == 'S\n' else "OPEN"
+        status_text += f" | Target: {target_display}"
+
+    cv2.putText(frame, status_text, (10, h - 20),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+def publish_stream_variants(unit, ref, frame, jpeg, w, current_state, target_action, yolo_active,
+                            detections, gov, stream_state):
+    """구독자가 있고 FPS 주기가 된 variant만 오버레이 1회 + variant별 리사이즈/인코딩 후 publish.
+
+    - 부하 조절 단계(gov)의 FPS/품질/해상도 상한이 variant 설정보다 우선
+    - MJPEG 패스스루이고 YOLO가 꺼져 있으면 원본 해상도 variant는 카메라 JPEG를 그대로 전달
+    - 프레임 내용과 오버레이 상태가 그 variant의 직전 인코딩과 같으면 재인코딩 생략
+    """
+    stream_hubs = unit.stream_hubs
+    last_ts, encoded = stream_state["last_ts"], stream_state["encoded"]
+    active = [name for name, hub in stream_hubs.items() if hub.subscribers or not STREAM_ON_DEMAND]
+    for name in list(encoded):
+        if name not in active:
+            del encoded[name]
+    if not active:
+        return
+
+    # variant FPS와 부하 조절 FPS 중 낮은 쪽 (프레임 간격 흔들림으로 정상 프레임을 버리지 않도록 10% 여유)
+    now = time.monotonic()
+    due = [name for name in active
+           if now - last_ts.get(name, 0.0) >= 0.9 / min(STREAM_VARIANTS[name].fps, gov.stream_fps)]
+    if len(due) < len(active):
+        pipeline_metrics.inc("stream_fps_skips", len(active) - len(due))
+
+    passthrough = jpeg is not None and STREAM_RAW_WHEN_YOLO_OFF and not yolo_active
+    pending = []
+    for name in due:
+        if passthrough and STREAM_VARIANTS[name].width >= w and gov.stream_scale >= 1.0:
+            stream_hubs[name].publish(jpeg, ref.ts)
+            last_ts[name] = now
+            encoded.pop(name, None)
+        else:
+            pending.append(name)
+    if not pending:
+        return
+
+    overlay_key = (current_state, target_action, yolo_active, gov,
+                   tuple((d["x"], d["y"], d["w"], d["h"]) for d in detections))
+    thumb = frame_thumbnail(frame) if jpeg is None else jpeg_thumbnail(jpeg)
+    changed = [name for name in pending
+               if name not in encoded or encoded[name][0] != overlay_key or frame_changed(encoded[name][1], thumb)]
+    if len(changed) < len(pending):
+        pipeline_metrics.inc("stream_unchanged_skips", len(pending) - len(changed))
+    if not changed:
+        return
+
+    t0 = time.perf_counter()
+    if frame is None:
+        frame = decode_jpeg(jpeg)
+    draw_overlay(frame, current_state, target_action, yolo_active, detections)
+    pipeline_metrics.observe("overlay", elapsed_ms(t0))
+
+    for name in changed:
+        variant = STREAM_VARIANTS[name]
+        scale = min(variant.width / w, 1.0) * gov.stream_scale
+        t0 = time.perf_counter()
+        out = frame if scale >= 1.0 else cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        quality = min(variant.quality, gov.jpeg_quality)
+        ok, buffer = cv2.imencode('.jpg', out, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        pipeline_metrics.observe("encode", elapsed_ms(t0))
+        if ok:
+            stream_hubs[name].publish(buffer.tobytes(), ref.ts)
+            last_ts[name] = now
+            encoded[name] = (overlay_key, thumb)
+
+# =========================
+# 세션 기록
+# =========================
+def record_session(unit: Unit, session: dict):
+    """끝난 밀봉/개봉 세션에 그 사이의 정렬 결과를 붙여 SQLite 쓰기 대기열에 넣음."""
+    started_mono = session.pop("started_mono")
+    aligned = [s for s in list(unit.aligner.sessions) if s.started >= started_mono]
+    if aligned:
+        a = aligned[-1].to_dict()
+        session.update(align_s=a["time_to_align_s"], align_result=a["result"], align_commands=a["commands"],
+                       align_steps=a["steps"], overshoots=a["overshoots"])
+    session_store.record(session)
+    unit.log("SESSION", f"{session['action']} {session['result']} in {session['duration_s']}s",
+             align_s=session.get("align_s"), commands=session["serial_commands"])
+
+# =========================
+# 상태 전이 알림 (상태 머신 observer)
+# =========================
+NOTICE_EVENTS = {
+    SEAL_REDIRECT: lambda: {"type": "redirect", "page": "/seal"},
+    OPEN_REDIRECT: lambda: {"type": "redirect", "page": "/open"},
+    PROCESS_FINISHED: lambda: {"type": "process_status", "status": "finished", "ts": time.time()},
+}
+
+def on_transition(unit: Unit, transition):
+    """상태/목표/YOLO가 바뀐 직후 호출 (머신 락 안, 블록하지 않는 작업만)."""
+    event = transition.event
+    if transition.new != transition.old:
+        unit.log("STATE", f"SystemState Change: {transition.old} -> {transition.new}",
+                 event=f"{event.kind}:{event.value}" if event.value else event.kind)
+        unit.state_clock.update(transition.new)
+        unit.ws_hub.publish_event({"type": "state", "state": transition.new,
+                                   "target": transition.target_action, "ts": time.time()})
+    if transition.yolo_changed:
+        unit.log("YOLO", "ON" if transition.yolo_on else "OFF")
+    finished = unit.sessions.observe(transition.new, transition.target_action, unit.serial_commands)
+    if finished is not None:
+        record_session(unit, finished)
+    # 버튼/완료 알림은 바로 WS로 (예전 button_queue + executor 대기 대신)
+    for notice in transition.notices:
+        unit.ws_hub.publish_event(NOTICE_EVENTS[notice]())
+        unit.log("WS", f"{notice} → {len(unit.ws_hub)} clients")
 
 # =========================
 # 감지 루프(스레드)
 # =========================
-def detection_loop():
-    global latest_annotated_frame, latest_detections_json, ser, SYSTEM_STATE, TARGET_ACTION
-    global YOLO_ON
-    
-    last_serial_send_time = 0
-    last_alignment_check = 0
-    frame_skip_counter = 0
+def detection_loop(unit: Unit):
+    frame_ring, scheduler, aligner = unit.frame_ring, unit.scheduler, unit.aligner
+
+    last_no_bottle_log = 0
+    last_detections = []       # 마지막 추론 결과 (다음 결과가 올 때까지 유지)
+    last_snapshot_key = None   # 마지막으로 WS에 발행한 스냅샷 내용
+    stream_state = {"last_ts": {}, "encoded": {}}  # variant별 마지막 publish 시각 / (overlay_key, thumbnail)
+    last_seq = 0
+    last_corrupt_log = 0.0
+    tracker = BoxTracker()
     
     while True:
-        try:
-            frame = frame_queue.get(timeout=1)
-        except Empty:
-            print("[YOLO] No frame from camera queue for 1s.")
+        ref = frame_ring.get(last_seq, timeout=1)
+        if ref is None:
+            unit.log("YOLO", "No frame from camera ring for 1s.", "warning")
             continue
+        last_seq = ref.seq
+        pipeline_metrics.observe("queue_wait", (time.monotonic() - ref.ts) * 1000)
+        frame = ref.data
+        # MJPEG 패스스루면 bytes, 아니면 BGR ndarray
+        jpeg = None
+        if isinstance(frame, bytes):
+            jpeg, frame = frame, None
         
-        with state_lock:
-            current_state = SYSTEM_STATE
-            yolo_active = YOLO_ON
-            target_action = TARGET_ACTION
+        current_state, target_action, yolo_active = unit.machine.snapshot()
+        gov = governor.level
         
-        h, w, _ = frame.shape
+        if jpeg is not None:
+            try:
+                h, w = simplejpeg.decode_jpeg_header(jpeg)[:2]
+            except ValueError as e:
+                last_corrupt_log = drop_corrupt_frame(unit, ref, e, last_corrupt_log)
+                continue
+        else:
+            h, w, _ = frame.shape
         cam_center_x, cam_center_y = w // 2, h //2
-        cv2.line(frame, (0, cam_center_y), (w, cam_center_y), (0, 255, 255), 1)
-        cv2.circle(frame, (cam_center_x, cam_center_y), 5, (255, 0, 0), -1)
-        cv2.putText(frame, f"(X:{cam_center_x}, Y:{cam_center_y})", (cam_center_x + 10, cam_center_y + 10),cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
         
-        detections = []
-        results = None
+        infer = unit.infer  # 로드가 끝나기 전에는 None (스트림만 동작)
+        detections = last_detections if yolo_active else []
+        results = None  # List[Box] (이번 프레임에 추론 결과가 도착했을 때만)
+        xform = (1.0, 1.0, 0, 0)
         
+        if infer is not None:
+            # 상태와 병 위치로 목표 Hz를 정하고, 주기가 됐고 추론기가 비어 있을 때만 실행
+            mono_now = time.monotonic()
+            if TRACKER_ENABLED:
+                center = tracker.estimate(ref.ts)
+            elif last_detections:
+                d = last_detections[0]
+                center = (d["x"] + d["w"] / 2, d["y"] + d["h"] / 2)
+            else:
+                center = None
+            scheduler.plan(mono_now, aligning=current_state == ALIGNING,
+                           active=yolo_active and current_state not in (SEALING, OPENING),
+                           center=center, error_px=None if center is None else center[1] - cam_center_y,
+                           noncritical_scale=gov.infer_scale)
+            if scheduler.should_run(mono_now, infer.idle):
+                # 추적 중이면 마지막 박스 주변 ROI만, 추적을 잃었으면 전체 프레임
+                roi = tracker.roi(mono_now, w, h) if TRACKER_ENABLED and roi_inference else None
+                t0 = time.perf_counter()
+                try:
+                    infer_frame, infer_xform, imgsz = prepare_inference(frame, jpeg, w, h, roi)
+                except ValueError as e:
+                    # 헤더는 멀쩡하고 본문이 깨진 프레임: 이번 추론만 건너뜀 (결과 수거/발행은 계속)
+                    last_corrupt_log = drop_corrupt_frame(unit, ref, e, last_corrupt_log)
+                    infer_frame = None
+                if infer_frame is not None:
+                    pipeline_metrics.observe("preprocess", elapsed_ms(t0))
+                    infer.submit(infer_frame, tag=(infer_xform, ref.ts), imgsz=imgsz)
+                    scheduler.submitted(mono_now)
+                    pipeline_metrics.inc("inference_submitted")
+
+        # 완료된 추론 결과 수거 (YOLO가 꺼진 뒤 도착한 결과는 버림)
+        for (infer_xform, captured_ts), boxes, infer_ms in (infer.poll() if infer is not None else ()):
+            pipeline_metrics.observe("inference", infer_ms)
+            scheduler.record_latency(infer_ms)
+            if not yolo_active:
+                continue
+            results, xform = boxes, infer_xform
+            if boxes:
+                tracker.update(box_xyxy(boxes[0], xform), captured_ts)
+            else:
+                tracker.miss()
+        if not yolo_active:
+            tracker.reset()
+        if current_state != ALIGNING and aligner.active:
+            aligner.finish(time.monotonic(), "aborted")
+
         if yolo_active:
-            frame_skip_counter += 1
-            should_run_yolo = (frame_skip_counter % 5 == 0)  # ✅ 5프레임당 1번으로 변경
-            
-            if should_run_yolo:
-                results = model(frame, 
-                              classes=0, 
-                              conf=0.5, 
-                              verbose=False,
-                              imgsz=128,
-                              device='cpu',
-                              max_det=1)[0]
-            
             now = time.time()
-            if current_state == ALIGNING and results is not None:
-                if now - last_serial_send_time >= 0.3:
-                    if results.boxes and len(results.boxes) > 0:
-                        first_box = results.boxes[0]
-                        x1, y1, x2, y2 = map(int, first_box.xyxy[0])
-                        obj_center_y = (y1 + y2) // 2
-                        relative_x = obj_center_y - cam_center_y
-                        
-                        print(f"[ALIGN] Camera center: {cam_center_y}, Wine center: {obj_center_y}, Relative: {relative_x}")
-                        
-                        deadzone_pixels = 3
-                        
-                        if abs(relative_x) <= deadzone_pixels:
-                            if last_alignment_check == 0:
-                                last_alignment_check = now
-                            elif now - last_alignment_check >= 0.5:
-                                send_serial_command('C\n', show_log=True)
-                                print("[ALIGN] Alignment confirmed! Sending target action...")
-                                
-                                time.sleep(0.2)
-                                if target_action:
-                                    send_serial_command(target_action, show_log=True)
-                                    with state_lock:
-                                        SYSTEM_STATE = SEALING if target_action == 'S\n' else OPENING
-                                else:
-                                    print("[ERROR] No target action set!")
-                                    with state_lock:
-                                        SYSTEM_STATE = STAY
-                                
-                                set_yolo_active(False)
-                                last_alignment_check = 0
-                        else:
-                            last_alignment_check = 0
-                            
-                            if relative_x < -deadzone_pixels:
-                                send_serial_command('R\n', show_log=True)
-                            else:
-                                send_serial_command('L\n', show_log=True)
-                        
-                        last_serial_send_time = now
-                    else:
-                        print("[ALIGN] No wine bottle detected")
-                        if now - last_serial_send_time >= 1.0:
-                            last_serial_send_time = now
-
-            if results and results.boxes and len(results.boxes) > 0:
-                first_box = results.boxes[0]
-                x1, y1, x2, y2 = map(int, first_box.xyxy[0])
-                conf = float(first_box.conf[0])
-                class_id = int(first_box.cls[0])
-                class_name = model.names[class_id]
+            # 정렬 제어는 실제 감지 결과로만 (캡처 시각이 정확해야 in-flight 이동을 맞게 뺄 수 있음).
+            # 추적기 추정값은 이미 이동 일부를 외삽하고 있어 지연 보상과 겹치므로 ROI 선택에만 사용
+            obj_center_y = None
+            if results:
+                x1, y1, x2, y2 = box_xyxy(results[0], xform)
+                obj_center_y = (y1 + y2) // 2
+                obj_captured_ts = captured_ts
+
+            if current_state == ALIGNING and obj_center_y is not None:
+                relative_x = obj_center_y - cam_center_y
+                mono_now = time.monotonic()
+                decision = aligner.update(relative_x, obj_captured_ts, mono_now)
+
+                if decision.commands:
+                    unit.log("ALIGN", f"Camera center: {cam_center_y}, Wine center: {obj_center_y}, Relative: {relative_x}",
+                             commands=''.join(decision.commands))
+                    send_serial_command(unit, ''.join(decision.commands) + '\n', show_log=True)
+
+                if decision.aligned:
+                    session = aligner.finish(mono_now, "aligned")
+                    unit.log("ALIGN", f"Alignment confirmed! {session.to_dict()} Sending target action...")
+                    # 'C' 전송, SEALING/OPENING 전이, 목표 동작은 STATE_CONFIRM_DELAY 뒤 타이머가 보냄
+                    outcome = unit.machine.dispatch("aligned")
+                    if not outcome.accepted:
+                        unit.log("ERROR", outcome.reason, "error")
+            elif current_state == ALIGNING and results is not None:
+                if now - last_no_bottle_log >= 1.0:
+                    unit.log("ALIGN", "No wine bottle detected")
+                    last_no_bottle_log = now
+
+            if results is not None:
+                detections = []
+            if results:
+                first_box = results[0]
+                x1, y1, x2, y2 = box_xyxy(first_box, xform)
+                conf = first_box.conf
+                class_id = first_box.cls
+                class_name = infer.names[class_id]
                 obj_center_x = (x1 + x2) // 2
                 obj_center_y = (y1 + y2) // 2
                 relative_x = obj_center_x - cam_center_x
@@ -238,96 +639,148 @@ def detection_loop():
                     "conf": conf, "class_id": class_id, "class_name": class_name,
                     "relative_center": {"x": relative_x, "y": relative_y}
                 })
-                
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                label_text = f"{class_name} {conf:.2f}"
-                cv2.putText(frame, label_text, (x1, y1 - 30), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-                coord_text = f"({relative_x}, {relative_y})"
-                cv2.putText(frame, coord_text, (x1, y1 - 10), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-                
-        else:
-            cv2.putText(frame, "YOLO: OFF", (10, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-
-        status_text = f"State: {current_state}"
-        if target_action:
-            target_display = "SEAL" if target_action == 'S\n' else "OPEN"
-            status_text += f" | Target: {target_display}"
 
-        cv2.putText(frame, status_text, (10, h - 20),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        last_detections = detections
 
-        with detections_lock:
-            latest_detections_json = json.dumps({
+        # 감지/상태가 바뀌었을 때만 WS 스냅샷 발행 (seq는 브로드캐스터가 붙임)
+        snapshot_key = (current_state, target_action,
+                        tuple((d["x"], d["y"], d["w"], d["h"], d["class_id"]) for d in detections))
+        if snapshot_key != last_snapshot_key:
+            unit.ws_hub.publish_snapshot({
                 "timestamp": time.time(), 
                 "detections": detections,
                 "state": current_state,
                 "target": target_action
             })
+            last_snapshot_key = snapshot_key
 
-        with frame_lock:
-            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 60]) # 품질 조정
-            latest_annotated_frame = buffer.tobytes()
+        # ✅ 구독자가 있는 스트림 variant만 인코딩 (모두 없으면 오버레이도 생략)
+        try:
+            publish_stream_variants(unit, ref, frame, jpeg, w, current_state, target_action, yolo_active,
+                                    detections, gov, stream_state)
+        except ValueError as e:
+            last_corrupt_log = drop_corrupt_frame(unit, ref, e, last_corrupt_log)
         
         # 이 루프에서는 FPS 제어를 위한 sleep이 필요 없음. 큐에서 프레임을 기다리는 것이 그 역할을 대신함.
 
 
 # =========================
-# WS 브로드캐스터
+# 모델 로드 (백그라운드 스레드)
 # =========================
-async def broadcast_detections():
-    while True:
-        with detections_lock:
-            data = latest_detections_json
-        dead = []
-        for ws in list(clients):
-            try:
-                await ws.send_text(data)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
+def warmup_shapes():
+    """실제 추론 입력과 같은 (프레임 shape, imgsz) 조합: 전체 프레임 + ROI.
+
+    패스스루 모드의 1/4 축소 디코드도 비율이 같아 letterbox 후에는 같은 입력 텐서가 된다.
+    """
+    shapes = [((CAMERA_HEIGHT, CAMERA_WIDTH, 3), INFER_IMGSZ)]
+    if TRACKER_ENABLED:
+        shapes.append(((ROI_IMGSZ * 2, ROI_IMGSZ * 2, 3), ROI_IMGSZ))
+    return shapes
+
+def publish_model_status():
+    for unit in units.values():
+        unit.ws_hub.publish_event(dict(MODEL_STATUS))
+
+def load_model():
+    """무거운 import + 모델 로드(캐시된 export 사용) + 워밍업. 끝나면 model 전역과 유닛별 추론 핸들을 채우고 WS로 알림.
+
+    유닛이 1개면 기존 실행기(LocalInference/InferenceWorker), 여러 개면 모델 1개를 공유하는 BatchedInference.
+    """
+    global model, roi_inference
+    t0 = time.monotonic()
+    log("YOLO", f"loading backend={INFER_BACKEND}{' (INT8)' if INFER_INT8 else ''} mode={INFER_MODE} units={len(units)} ...")
+    try:
+        if len(units) == 1 and INFER_MODE == "process":
+            loaded = InferenceWorker(DETECTOR_ARGS, log=log)
+            loaded.start()
+            handles = {default_unit.id: loaded}
+        elif len(units) == 1:
+            loaded = LocalInference(create_detector(**DETECTOR_ARGS, log=log))
+            handles = {default_unit.id: loaded}
+            log("YOLO", f"path={loaded.detector.path}")
+        else:
+            if INFER_MODE == "process":
+                log("YOLO", "process mode is single-unit only; using shared batched inference in this process", "warning")
+            loaded = BatchedInference(create_detector(**DETECTOR_ARGS, log=log), batch_window=INFER_BATCH_WINDOW,
+                                      metrics=pipeline_metrics, log=log)
+            handles = {unit_id: loaded.client(unit_id) for unit_id in units}
+            loaded.start()
+            log("YOLO", f"path={loaded.detector.path} (shared by {len(units)} units)")
+        # export 백엔드는 여기서 imgsz별(전체/ROI) artifact까지 준비
+        (full_shape, full_imgsz), *roi_shapes = warmup_shapes()
+        loaded.warmup(full_shape, full_imgsz)
+        for shape, imgsz in roi_shapes:
             try:
-                clients.remove(ws)
-            except:
-                pass
-        await asyncio.sleep(0.1)
+                loaded.warmup(shape, imgsz)
+            except Exception as e:
+                # ROI 크기 artifact만 없을 때(예: INT8인데 그 크기를 export하지 않음) 모델 전체를 잃지 않고
+                # 전체 프레임 추론으로 계속한다
+                roi_inference = False
+                MODEL_STATUS.update(roi_imgsz=None, roi_error=str(e))
+                log("YOLO", f"ROI imgsz={imgsz} unavailable, falling back to full-frame inference: {e}", "warning")
+        paths = getattr(getattr(loaded, "detector", None), "paths", None)
+        if paths:
+            log("YOLO", f"artifacts by imgsz: {paths}")
+    except Exception as e:
+        log("YOLO", f"model load FAIL: {e}", "error")
+        MODEL_STATUS.update(status="error", error=str(e), load_s=round(time.monotonic() - t0, 2))
+        publish_model_status()
+        return
+    model = loaded
+    for unit_id, handle in handles.items():
+        units[unit_id].infer = handle
+    MODEL_STATUS.update(status="ready", load_s=round(time.monotonic() - t0, 2))
+    log("YOLO", f"model is ready ({MODEL_STATUS['load_s']}s)")
+    publish_model_status()
 
 # =========================
 # FastAPI 앱/라이프사이클
 # =========================
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("YOLO model warming up...")
-    dummy_image = np.zeros((480, 640, 3), dtype=np.uint8) 
-    model(dummy_image, verbose=False) 
-    print("YOLO model is ready.")
+    logger.start()
+    log("SYSTEM", f"서버 시작: 스레드 및 브로드캐스터 시작... (units: {', '.join(units)})")
+    session_store.start()
+    if static_assets is not None:
+        static_assets.load()  # 파일 읽기는 바로, 압축은 백그라운드
+    loop = asyncio.get_running_loop()
+    for unit in units.values():
+        for hub in unit.stream_hubs.values():
+            hub.bind(loop)
+        unit.ws_hub.bind(loop)
 
-    print("서버 시작: 스레드 및 브로드캐스터 시작...")
-    
-    # 1. 카메라 리더 스레드 시작
-    camera_thread = threading.Thread(target=camera_reader_loop, daemon=True)
-    camera_thread.start()
+    governor.start()
+    state_timers.start()
 
-    # 2. YOLO 처리 스레드 시작
-    detection_thread = threading.Thread(target=detection_loop, daemon=True)
-    detection_thread.start()
+    # 0. 모델 로드는 기다리지 않음 (준비되면 {"type": "model", "status": "ready"} WS 이벤트)
+    threading.Thread(target=load_model, name="model-loader", daemon=True).start()
 
-    # 3. 시리얼 리더 스레드 시작
-    serial_thread = threading.Thread(target=serial_reader_loop, daemon=True)
-    serial_thread.start()
+    for unit in units.values():
+        # 1. 카메라 리더 스레드 시작
+        threading.Thread(target=camera_reader_loop, args=(unit,), name=f"camera-{unit.id}", daemon=True).start()
 
-    broadcast_task = asyncio.create_task(broadcast_detections())
-    broadcast_btn_task = asyncio.create_task(broadcast_buttons())
+        # 2. YOLO 처리 스레드 시작
+        threading.Thread(target=detection_loop, args=(unit,), name=f"detection-{unit.id}", daemon=True).start()
+
+        # 3. 시리얼 리더/라이터 스레드 시작 (sim이면 가상 아두이노의 pty에 연결)
+        if unit.config.sim_serial:
+            unit.virtual_arduino = VirtualArduino(unit.sim_world, speed=SIM_SPEED, log=unit.log)
+            unit.serial_transport.port = unit.virtual_arduino.start()
+            unit.serial_transport.reset_wait = 0
+        unit.serial_transport.start()
     try:
         yield
     finally:
-        print("서버 종료...")
-        broadcast_task.cancel()
-        broadcast_btn_task.cancel()
-        if cap and cap.isOpened():
-            cap.release()
+        log("SYSTEM", "서버 종료...")
+        governor.stop()
+        for unit in units.values():
+            if unit.cap and unit.cap.isOpened():
+                unit.cap.release()
+            unit.serial_transport.close()
+        if model is not None:
+            model.close()
+        session_store.close()
+        logger.stop()
 
 app = FastAPI(lifespan=lifespan)
 app.add_middleware(
@@ -336,227 +789,309 @@ app.add_middleware(
     allow_methods=["*"], allow_headers=["*"],
 )
 
+# 유닛별 API: 접두사 없이(첫 번째 유닛, 기존 프론트엔드) + /units/{unit_id} 아래에 한 번 더 등록
+unit_router = APIRouter()
+
+def get_unit(conn: HTTPConnection) -> Unit:
+    """경로의 unit_id로 유닛을 찾음 (접두사 없는 기존 경로면 첫 번째 유닛)."""
+    unit_id = conn.path_params.get("unit_id", default_unit.id)
+    unit = units.get(unit_id)
+    if unit is None:
+        raise HTTPException(status_code=404, detail=f"Unknown unit '{unit_id}'")
+    return unit
+
 # =========================
 # 시리얼 전송/컨트롤 API
 # =========================
-def send_serial_command(command: str, show_log: bool = True):
-    if not ensure_serial_open():
-        if show_log: print("Serial port not open")
+def send_serial_command(unit: Unit, command: str, show_log: bool = True):
+    """명령을 유닛의 라이터 큐에 넣고 바로 반환 (리더와 락을 공유하지 않아 블록되지 않음)."""
+    if not unit.serial_transport.connected:
+        pipeline_metrics.inc("serial_not_open")
+        if show_log: unit.log("SERIAL", "Serial port not open", "warning")
         return False, "Serial port not open"
-    try:
-        with serial_lock:
-            ser.write(command.encode('utf-8'))
-            ser.flush()
-        if show_log: print(f"Serial command sent: '{command.strip()}'")
-        return True, f"Command '{command.strip()}' sent"
-    except Exception as e:
-        if show_log: print(f"Serial command send fail: {e}")
-        return False, str(e)
+    unit.serial_transport.send(command)
+    unit.serial_commands += 1
+    pipeline_metrics.inc("serial_commands")
+    if show_log: unit.log("SERIAL", f"Serial command queued: '{command.strip()}'")
+    return True, f"Command '{command.strip()}' sent"
 
-@app.post("/control/seal", tags=["Arduino Control"])
-async def start_sealing():
+def start_alignment(unit: Unit, command: str):
+    """STAY → ALIGNING 전환 (모델 준비 전이면 503, 다른 동작 중이면 409)."""
+    if unit.infer is None:
+        return JSONResponse(status_code=503, content={"status": "error", "message": f"Model is {MODEL_STATUS['status']}"})
+    outcome = unit.machine.dispatch("command", command)
+    if not outcome.accepted:
+        return JSONResponse(status_code=409, content={"status": "error", "message": outcome.reason})
+    return None
+
+def command_response(outcome, suffix: str = ""):
+    """시리얼 전송이 따르는 명령(home/stop)의 결과를 응답으로."""
+    _, success, message = outcome.sent[0]
+    if success:
+        return {"status": "ok", "message": message + suffix}
+    return JSONResponse(status_code=500, content={"status": "error", "message": message})
+
+@unit_router.post("/control/seal", tags=["Arduino Control"])
+async def start_sealing(unit: Unit = Depends(get_unit)):
     """밀봉을 위한 정렬 프로세스를 시작합니다."""
-    global SYSTEM_STATE, TARGET_ACTION
-    with state_lock:
-        if SYSTEM_STATE != STAY:
-            return JSONResponse(status_code=409, content={"status": "error", "message": f"System is busy with '{SYSTEM_STATE}'"})
-        SYSTEM_STATE = ALIGNING
-        TARGET_ACTION = 'S\n'
-    print(f"SystemState Change: {STAY} -> {ALIGNING} (목표: 밀봉)")
+    error = start_alignment(unit, "seal")
+    if error is not None:
+        return error
     return {"status": "ok", "message": "Alignment process for sealing has been started."}
 
-@app.post("/control/open", tags=["Arduino Control"])
-async def start_opening():
+@unit_router.post("/control/open", tags=["Arduino Control"])
+async def start_opening(unit: Unit = Depends(get_unit)):
     """개봉을 위한 정렬 프로세스를 시작합니다."""
-    global SYSTEM_STATE, TARGET_ACTION
-    with state_lock:
-        if SYSTEM_STATE != STAY:
-            return JSONResponse(status_code=409, content={"status": "error", "message": f"System is busy with '{SYSTEM_STATE}'"})
-        SYSTEM_STATE = ALIGNING
-        TARGET_ACTION = 'O\n'
-    print(f"SystemState Change: {STAY} -> {ALIGNING} (목표: 개봉)")
+    error = start_alignment(unit, "open")
+    if error is not None:
+        return error
     return {"status": "ok", "message": "Alignment process for opening has been started."}
 
-@app.post("/control/home", tags=["Arduino Control"])
-async def return_to_home():
-    success, message = send_serial_command('H\n')
-    if success:
-        return {"status": "ok", "message": message}
-    return JSONResponse(status_code=500, content={"status": "error", "message": message})
+@unit_router.post("/control/home", tags=["Arduino Control"])
+async def return_to_home(unit: Unit = Depends(get_unit)):
+    return command_response(unit.machine.dispatch("command", "home"))
 
-@app.post("/control/stop", tags=["Arduino Control"])
-async def emergency_stop():
-    global SYSTEM_STATE, TARGET_ACTION
-    with state_lock:
-        SYSTEM_STATE = STAY
-        TARGET_ACTION = None
-    set_yolo_active(False)
-    success, message = send_serial_command('E\n')
-    if success:
-        return {"status": "ok", "message": f"{message}. System state has been reset to '{STAY}'."}
-    return JSONResponse(status_code=500, content={"status": "error", "message": message})
+@unit_router.post("/control/stop", tags=["Arduino Control"])
+async def emergency_stop(unit: Unit = Depends(get_unit)):
+    # 상태 초기화 + 예약된 목표 동작 타이머 취소 + E 우선 전송
+    outcome = unit.machine.dispatch("command", "stop")
+    return command_response(outcome, f". System state has been reset to '{STAY}'.")
+
+@unit_router.get("/debug/serial", tags=["Debug"])
+async def serial_stats(unit: Unit = Depends(get_unit)):
+    """시리얼 연결 상태, 전송/수신 카운트, 마지막 전송 지연/왕복 시간."""
+    transport = unit.serial_transport
+    return {"port": transport.port, "connected": transport.connected, **transport.stats}
+
+@unit_router.get("/debug/ws", tags=["Debug"])
+async def ws_stats(unit: Unit = Depends(get_unit)):
+    """WS 클라이언트 수, 스냅샷 seq, 합쳐진(coalesced) 스냅샷 수, 퇴출된 느린 클라이언트 수."""
+    return unit.ws_hub.stats()
+
+@unit_router.get("/debug/alignment", tags=["Debug"])
+async def alignment_stats(unit: Unit = Depends(get_unit)):
+    """정렬 제어기 설정과 세션별 time-to-align / 명령 수 / overshoot 기록."""
+    return unit.aligner.stats()
+
+@app.get("/debug/governor", tags=["Debug"])
+async def governor_stats():
+    """부하 조절 단계, 현재 CPU/온도, 단계별 설정과 최근 결정 기록."""
+    return governor.stats()
+
+@unit_router.get("/debug/scheduler", tags=["Debug"])
+async def scheduler_stats(unit: Unit = Depends(get_unit)):
+    """추론 스케줄러의 현재 구간(regime), 목표/달성 Hz, 추론 시간 기반 상한."""
+    return unit.scheduler.stats()
+
+@unit_router.get("/debug/events", tags=["Debug"])
+async def state_events(unit: Unit = Depends(get_unit)):
+    """상태 머신 현재 상태/전이 수와 기록된 외부 이벤트 (`python state_machine.py replay` 입력)."""
+    return {**unit.machine.stats(), "events": unit.machine.recorded()}
+
+@app.get("/units", tags=["Units"])
+async def list_units():
+    """등록된 유닛(스테이션) 목록과 현재 상태."""
+    return [{"id": unit.id, "camera": unit.config.camera, "serial": unit.config.serial,
+             "state": unit.state, "yolo_active": unit.yolo_on, "model_ready": unit.infer is not None,
+             "serial_connected": unit.serial_transport.connected, "ws_clients": len(unit.ws_hub),
+             "stream_clients": sum(hub.subscribers for hub in unit.stream_hubs.values())}
+            for unit in units.values()]
+
+@app.get("/sessions", tags=["Sessions"])
+def list_sessions(unit: str = None, action: str = None, since: float = None, limit: int = 50):
+    """기록된 밀봉/개봉 세션 (최근 순). since는 unix time, 읽기 전용 연결이라 제어 경로와 무관."""
+    return session_store.query(unit=unit, action=action, since=since, limit=min(limit, 1000))
+
+@app.get("/sessions/summary", tags=["Sessions"])
+def sessions_summary(since: float = None):
+    """유닛/동작별 세션 수, 완료 수, 평균·최대 정렬 시간."""
+    return {"store": session_store.stats(), "summary": session_store.summary(since=since)}
+
+@app.get("/debug/logging", tags=["Debug"])
+async def logging_stats():
+    """비동기 로그 큐 길이, 출력/드롭/제한(suppressed) 수."""
+    return logger.stats()
+
+def inference_stats():
+    """공유 모델의 배치 통계 (유닛이 1개면 배치 없이 기존 실행기)."""
+    if isinstance(model, BatchedInference):
+        return {"runner": "batched", "units": len(model.clients), "batches": model.batches,
+                "batched_frames": model.batched_frames, "mean_batch_size": round(model.mean_batch_size, 2)}
+    return {"runner": type(model).__name__ if model is not None else None, "units": len(units)}
+
+def unit_counters(unit: Unit):
+    """유닛의 각 컴포넌트가 이미 세고 있는 누적 카운터 (조회 시점에 수집, 핫패스 비용 없음)."""
+    ring = unit.frame_ring.stats()
+    ser = unit.serial_transport.stats
+    return {
+        "frames_captured": ring["seq"],
+        "ring_dropped": ring["dropped"],
+        "stream_frames_published": sum(hub.seq for hub in unit.stream_hubs.values()),
+        "stream_dropped": sum(hub.dropped for hub in unit.stream_hubs.values()),
+        "ws_snapshots": unit.ws_hub.seq,
+        "ws_evicted": unit.ws_hub.evicted,
+        "serial_sent": ser["sent"],
+        "serial_dropped": ser["dropped"],
+        "serial_lines": ser["lines"],
+        "serial_reconnects": ser["reconnects"],
+        "inference_busy_skips": unit.scheduler.busy_skips,
+    }
+
+def unit_gauges(unit: Unit):
+    return {
+        "inference_target_hz": round(unit.scheduler.target_hz, 2),
+        "inference_achieved_hz": round(unit.scheduler.achieved_hz, 2),
+        "stream_clients": sum(hub.subscribers for hub in unit.stream_hubs.values()),
+        **{f"stream_clients_{name}": hub.subscribers for name, hub in unit.stream_hubs.items()},
+        "ws_clients": len(unit.ws_hub),
+        "serial_connected": int(unit.serial_transport.connected),
+        "yolo_active": int(unit.yolo_on),
+    }
+
+def by_unit(per_unit: dict):
+    """{unit_id: {key: value}} → {key: {unit_id: value}} (Prometheus unit 라벨용)."""
+    keys = next(iter(per_unit.values())).keys()
+    return {key: {unit_id: values[key] for unit_id, values in per_unit.items()} for key in keys}
+
+def pipeline_counters():
+    return by_unit({unit.id: unit_counters(unit) for unit in units.values()})
+
+def pipeline_gauges():
+    """전체(모든 유닛 합산) 처리율 + 공유 자원 상태 + 유닛별 값({unit_id: value})."""
+    return {
+        "capture_fps": round(pipeline_metrics.rate("capture"), 2),
+        "processed_fps": round(pipeline_metrics.rate("queue_wait"), 2),
+        "inference_per_s": round(pipeline_metrics.rate("inference"), 2),
+        "inference_batch_size": inference_stats().get("mean_batch_size"),
+        "stream_encode_fps": round(pipeline_metrics.rate("encode"), 2),
+        "units": len(units),
+        "governor_level": governor.index,
+        "cpu_percent": governor.cpu,
+        "soc_temp_c": governor.temp,
+        "stream_jpeg_quality": governor.level.jpeg_quality,
+        **by_unit({unit.id: unit_gauges(unit) for unit in units.values()}),
+    }
+
+def state_clocks():
+    for unit in units.values():
+        unit.state_clock.update(unit.state)
+    return {unit.id: unit.state_clock for unit in units.values()}
+
+@app.get("/metrics", tags=["Debug"])
+async def prometheus_metrics():
+    """Prometheus 텍스트 포맷: 단계별 지연 히스토그램, 누적 카운터, 현재 값(게이지), 유닛·상태별 체류 시간."""
+    text = render_prometheus(pipeline_metrics, state_clocks(), pipeline_counters(), pipeline_gauges())
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/pipeline", tags=["Debug"])
+async def pipeline_stats():
+    """/metrics와 같은 내용을 JSON으로 (단계별 p50/p95/p99, 유닛별 상태 포함)."""
+    clocks = state_clocks()
+    return {
+        "uptime_s": round(time.monotonic() - pipeline_metrics.started, 1),
+        "model": MODEL_STATUS,
+        "inference": inference_stats(),
+        "rates": pipeline_gauges(),
+        "counters": {**pipeline_metrics.counters, **pipeline_counters()},
+        "stages": pipeline_metrics.snapshot(),
+        "units": {unit_id: {"state": units[unit_id].state, "state_seconds": clock.totals(),
+                            "state_entered": dict(clock.entered)}
+                  for unit_id, clock in clocks.items()},
+    }
 
 # =========================
 # WebSocket
 # =========================
-@app.websocket("/ws")
+@unit_router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    unit = units.get(websocket.path_params.get("unit_id", default_unit.id))
+    if unit is None:
+        await websocket.close(code=1008)  # 없는 유닛
+        return
+    ws_hub = unit.ws_hub
     await websocket.accept()
-    clients.append(websocket)
-    print(f"[PID {os.getpid()}] WS connect. clients={len(clients)}")
-    await websocket.send_text(json.dumps({"type": "connected", "ts": time.time()}))
-
-    async def sender():
-        while True:
-            with detections_lock:
-                data = latest_detections_json
-            await websocket.send_text(data)
-            await asyncio.sleep(0.1)
+    ws_hub.register(websocket)  # 최신 스냅샷은 등록 시 바로 전송 대기열에 들어감
+    unit.log("WS", f"[PID {os.getpid()}] WS connect. clients={len(ws_hub)}")
+    ws_hub.send_to(websocket, {"type": "connected", "unit": unit.id, "ts": time.time()})
+    ws_hub.send_to(websocket, dict(MODEL_STATUS))  # 모델 준비 상태 (loading | ready | error)
 
-    async def receiver():
+    try:
         while True:
             msg = await websocket.receive_text()
             t = (msg or "").strip()
             if t == "ping" or t == '{"type":"ping"}':
-                await websocket.send_text(json.dumps({"type":"pong","ts":time.time()}))
-                continue
-
-    try:
-        await asyncio.gather(sender(), receiver())
-    except WebSocketDisconnect:
+                ws_hub.send_to(websocket, {"type": "pong", "ts": time.time()})
+    except (WebSocketDisconnect, RuntimeError):
         pass
     finally:
-        try:
-            clients.remove(websocket)
-        except Exception:
-            pass
-        print(f"[PID {os.getpid()}] WS disconnect. clients={len(clients)}")
+        ws_hub.unregister(websocket)
+        unit.log("WS", f"[PID {os.getpid()}] WS disconnect. clients={len(ws_hub)}")
 
 # =========================
 # MJPEG 스트림
 # =========================
-def generate_annotated_frame():
-    while True:
-        with frame_lock:
-            if latest_annotated_frame is None:
-                time.sleep(0.01) # 프레임이 준비될 때까지 짧게 대기
-                continue
-            frame_bytes = latest_annotated_frame
-        yield (b"--frame\r\n"
-               b"Content-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n")
-        time.sleep(1/30) # 스트리밍 FPS 제어 (약 30fps)
+@unit_router.get("/video_feed")
+async def video_feed(w: int = None, q: int = None, fps: float = None, unit: Unit = Depends(get_unit)):
+    """w(가로 px)/q(JPEG 품질)/fps를 주면 가장 가까운 서버 variant로 스트림 (없으면 full)."""
+    name = pick_variant(STREAM_VARIANTS, w, q, fps) if (w or q or fps) else DEFAULT_STREAM_VARIANT
+    # 스레드풀을 점유하지 않는 비동기 제너레이터: 새 프레임이 publish될 때만 전송
+    return StreamingResponse(mjpeg_stream(unit.stream_hubs[name], STREAM_KEEPALIVE), media_type="multipart/x-mixed-replace; boundary=frame",
+                             headers={"X-Stream-Variant": name})
 
-@app.get("/video_feed")
-def video_feed():
-    return StreamingResponse(generate_annotated_frame(), media_type="multipart/x-mixed-replace; boundary=frame")
+@unit_router.get("/debug/streams", tags=["Debug"])
+async def stream_stats(unit: Unit = Depends(get_unit)):
+    """스트림 variant별 설정, 구독자 수, publish/drop 수."""
+    return {name: {**STREAM_VARIANTS[name]._asdict(), "subscribers": hub.subscribers,
+                   "published": hub.seq, "dropped": hub.dropped,
+                   "keepalives": hub.keepalives}
+            for name, hub in unit.stream_hubs.items()}
+
+app.include_router(unit_router)
+app.include_router(unit_router, prefix="/units/{unit_id}")
 
 # =========================
 # 정적 파일(React)
 # =========================
+# 빌드 결과(dist/)는 시작할 때 메모리로 올려 gzip/brotli 압축본 + ETag로 서빙 (static_assets.py)
+# /assets/*(vite 기본 경로)와 기존 /static/* 모두 dist/assets/ 파일, 나머지 경로는 index.html
 FRONTEND_DIR = os.path.join(os.path.dirname(__file__), "..", "frontend", "dist")
+static_assets = None
 if os.path.exists(FRONTEND_DIR):
-    app.mount("/static", StaticFiles(directory=os.path.join(FRONTEND_DIR, "assets")), name="static")
+    static_assets = AssetTable(FRONTEND_DIR, aliases={"static/": "assets/"}, metrics=pipeline_metrics)
+
+    @app.get("/debug/static", tags=["Debug"])
+    async def static_stats():
+        """메모리 정적 파일 수, 원본/압축 크기, 응답/304 수."""
+        return static_assets.stats()
+
     @app.get("/{full_path:path}")
-    async def serve_spa(full_path: str = ""):
-        index_path = os.path.join(FRONTEND_DIR, "index.html")
-        if os.path.exists(index_path):
-            return FileResponse(index_path)
-        return {"error": "Frontend not found"}
+    async def serve_spa(request: Request, full_path: str = ""):
+        return static_assets.response(full_path, request.headers)
 else:
     @app.get("/")
     def root():
         return {"message": "Backend is running, but frontend build is not found."}
 
 # =========================
-# 시리얼 수신(스레드)
-# =========================
-def serial_reader_loop():
-    global ser, SYSTEM_STATE, TARGET_ACTION
-    while True:
-        if not ensure_serial_open():
-            time.sleep(0.5)
-            continue
-        try:
-            with serial_lock:
-                raw = ser.readline()
-                if not raw:
-                    continue
-            
-            line = raw.decode(errors="ignore").strip()
-            print(f"[SERIAL READ] Raw data: '{line}'")
-
-            if line in 'A':
-                print("[SERIAL READ] 'A' - Arduino requesting alignment")
-                set_yolo_active(True)
-                with state_lock:
-                    SYSTEM_STATE = ALIGNING
-                    
-            elif line in 'F':
-                print("[SERIAL READ] 'F' - Process finished")
-                set_yolo_active(False)
-                with state_lock:
-                    SYSTEM_STATE = STAY
-                    TARGET_ACTION = None
-                button_queue.put_nowait("PROCESS_FINISHED") 
-            
-            elif line in '1':
-                print("[SERIAL READ] Button 1 - Seal process")
-                with state_lock:
-                    TARGET_ACTION = 'S\n'
-                button_queue.put_nowait("SEAL_REDIRECT")
-                
-            elif line in '2':
-                print("[SERIAL READ] Button 2 - Open process")
-                with state_lock:
-                    TARGET_ACTION = 'O\n'
-                button_queue.put_nowait("OPEN_REDIRECT")
-
-        except Exception as e:
-            print(f"시리얼 읽기 오류: {e}")
-            try:
-                with serial_lock:
-                    if ser:
-                        ser.close()
-            except:
-                pass
-            ser = None
-            time.sleep(1)
-
-# =========================
-# 버튼 이벤트 WS 브로드캐스트
+# 시리얼 수신 처리
 # =========================
-async def broadcast_buttons():
-    loop = asyncio.get_running_loop()
-    while True:
-        event = await loop.run_in_executor(None, button_queue.get)
-        if event == "SEAL_REDIRECT":
-            payload = json.dumps({"type": "redirect", "page": "/seal"})
-            print(f"[WS] redirect /seal → {len(clients)} clients")
-        elif event == "OPEN_REDIRECT":
-            payload = json.dumps({"type": "redirect", "page": "/open"})
-            print(f"[WS] redirect /open → {len(clients)} clients")
-        elif event == "PROCESS_FINISHED":                                                                      
-            payload = json.dumps({"type": "process_status", "status": "finished", "ts": time.time()})          
-            print(f"[WS] broadcasting process status=finished → {len(clients)} clients")  
-        else:
-            payload = json.dumps({"type": "button", "value": event, "ts": time.time()})
-            print(f"[WS] broadcasting button={event} → {len(clients)} clients")
+SERIAL_LINE_LOGS = {
+    'A': "'A' - Arduino requesting alignment",
+    'F': "'F' - Process finished",
+    '1': "Button 1 - Seal process",
+    '2': "Button 2 - Open process",
+}
 
-        dead = []
-        for ws in list(clients):
-            try:
-                await ws.send_text(payload)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            try:
-                clients.remove(ws)
-            except:
-                pass
+def handle_serial_line(unit: Unit, line: str):
+    """유닛의 시리얼 리더 스레드에서 수신한 한 줄을 상태 머신 이벤트로 전달."""
+    unit.log("SERIAL READ", f"Raw data: '{line}'")
+    if line in SERIAL_LINE_LOGS:
+        unit.log("SERIAL READ", SERIAL_LINE_LOGS[line])
+        unit.machine.dispatch("serial", line)
 
 # =========================
 # 엔트리포인트
 # =========================
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,242 @@
+"""파이프라인 단계별 지연/카운터 측정.
+
+카메라 → 감지 → 오버레이/인코딩 → /video_feed, WS 전송까지 각 단계에서 observe(stage, ms)를 호출하면
+최근 샘플(p50/p95/p99용)과 누적 히스토그램(Prometheus용)을 단계별로 보관한다.
+bench.py(벤치마크), /metrics(Prometheus 텍스트), /debug/pipeline(JSON)이 함께 쓴다.
+
+단계 이름
+- capture     : cap.read() 소요 시간
+- queue_wait  : 캡처 완료 → detection_loop가 프레임을 꺼낼 때까지
+- preprocess  : 추론 입력 준비 (축소 디코드/ROI 자르기)
+- inference   : 추론 1회 (워커가 측정한 값, 배치 추론이면 그 프레임이 속한 배치 전체 시간)
+- inference_batch : 공유 배치 추론 1회 (여러 유닛의 프레임을 한 번에)
+- overlay     : 스트림용 디코드 + 오버레이 그리기
+- encode      : cv2.imencode
+- stream_send : FrameHub publish → /video_feed 클라이언트로 전송 완료
+- end_to_end  : 캡처 완료 → /video_feed 클라이언트로 전송 완료
+- ws_push     : 스냅샷 발행 → WS 클라이언트로 전송 완료
+- serial_write: 명령 큐 투입 → 시리얼 write 완료
+"""
+import bisect
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    import psutil  # 있으면 자식 프로세스(추론 워커)까지 합산
+except ImportError:
+    psutil = None
+
+
+# 누적 히스토그램 경계 (ms, 마지막은 +Inf)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+class StageStats:
+    """한 단계의 최근 샘플(ms), 누적 히스토그램, 최근 관측 시각(처리율 계산용)."""
+    __slots__ = ("samples", "count", "total_ms", "max_ms", "buckets", "times")
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.times = deque(maxlen=128)
+
+
+class PipelineMetrics:
+    """단계별 지연 + 이벤트 카운터 기록기 (임의 스레드에서 observe/inc 가능)."""
+
+    def __init__(self, window: int = 8192):
+        self.window = window
+        self.stages = {}
+        self.counters = {}
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, ms: float):
+        with self._lock:
+            s = self.stages.get(stage)
+            if s is None:
+                s = self.stages[stage] = StageStats(self.window)
+            s.samples.append(ms)
+            s.count += 1
+            s.total_ms += ms
+            if ms > s.max_ms:
+                s.max_ms = ms
+            s.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+            s.times.append(time.monotonic())
+
+    def inc(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def count(self, stage: str) -> int:
+        s = self.stages.get(stage)
+        return 0 if s is None else s.count
+
+    def rate(self, stage: str, horizon: float = 5.0):
+        """최근 horizon초 동안의 초당 관측 횟수 (예: capture → 캡처 FPS)."""
+        s = self.stages.get(stage)
+        if s is None:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            times = [t for t in s.times if now - t <= horizon]
+        if len(times) < 2:
+            return 0.0
+        return (len(times) - 1) / max(now - times[0], 1e-6)
+
+    def reset(self):
+        """지연 기록만 초기화 (벤치마크 측정 구간 시작용). 카운터는 단조 증가로 유지."""
+        with self._lock:
+            self.stages = {}
+            self.started = time.monotonic()
+
+    def snapshot(self):
+        """{stage: {count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms}}"""
+        with self._lock:
+            stages = {name: (list(s.samples), s.count, s.total_ms, s.max_ms) for name, s in self.stages.items()}
+        out = {}
+        for name, (samples, count, total, max_ms) in stages.items():
+            samples.sort()
+            out[name] = {
+                "count": count,
+                "mean_ms": round(total / count, 3) if count else None,
+                "p50_ms": _percentile(samples, 50),
+                "p95_ms": _percentile(samples, 95),
+                "p99_ms": _percentile(samples, 99),
+                "max_ms": round(max_ms, 3),
+            }
+        return out
+
+
+class StateClock:
+    """SYSTEM_STATE별 누적 체류 시간과 진입 횟수.
+
+    상태를 읽는 곳(detection_loop 매 프레임, 조회 시)에서 update()를 호출하면
+    직전 update 이후의 시간을 이전 상태에 더한다.
+    """
+
+    def __init__(self, state: str):
+        self.state = state
+        self.since = time.monotonic()
+        self.seconds = {state: 0.0}
+        self.entered = {state: 1}
+        self._lock = threading.Lock()
+
+    def update(self, state: str):
+        now = time.monotonic()
+        with self._lock:
+            self.seconds[self.state] = self.seconds.get(self.state, 0.0) + now - self.since
+            self.since = now
+            if state != self.state:
+                self.entered[state] = self.entered.get(state, 0) + 1
+                self.state = state
+
+    def totals(self):
+        with self._lock:
+            out = dict(self.seconds)
+            out[self.state] = out.get(self.state, 0.0) + time.monotonic() - self.since
+        return {k: round(v, 3) for k, v in out.items()}
+
+
+def _samples(name: str, value, fmt=str):
+    """값이 dict면 {unit_id: 값}으로 보고 unit 라벨을 붙인 줄들, 아니면 한 줄."""
+    if isinstance(value, dict):
+        return [f'{name}{{unit="{k}"}} {fmt(v)}' for k, v in sorted(value.items()) if v is not None]
+    return [] if value is None else [f"{name} {fmt(value)}"]
+
+
+def render_prometheus(metrics: PipelineMetrics, state_clock=None,
+                      counters: dict = None, gauges: dict = None, prefix: str = "winequeen"):
+    """Prometheus 텍스트 포맷(0.0.4)으로 변환.
+
+    counters/gauges는 조회 시점에 모은 값 (예: 링 버퍼 drop 수, 연결된 클라이언트 수).
+    값이 {unit_id: 값} dict면 유닛별로, state_clock도 {unit_id: StateClock}이면 unit 라벨을 붙인다.
+    """
+    lines = []
+    with metrics._lock:
+        stages = {name: (list(s.buckets), s.count, s.total_ms) for name, s in metrics.stages.items()}
+        all_counters = dict(metrics.counters)
+    all_counters.update(counters or {})
+
+    name = f"{prefix}_stage_latency_ms"
+    lines += [f"# HELP {name} Pipeline stage latency in milliseconds.", f"# TYPE {name} histogram"]
+    for stage, (buckets, count, total) in sorted(stages.items()):
+        cumulative = 0
+        for le, n in zip(LATENCY_BUCKETS_MS + ("+Inf",), buckets):
+            cumulative += n
+            lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {total:.3f}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+    for key, value in sorted(all_counters.items()):
+        samples = _samples(f"{prefix}_{key}_total", value)
+        if samples:
+            lines += [f"# TYPE {prefix}_{key}_total counter"] + samples
+    for key, value in sorted((gauges or {}).items()):
+        samples = _samples(f"{prefix}_{key}", value, lambda v: f"{float(v):g}")
+        if samples:
+            lines += [f"# TYPE {prefix}_{key} gauge"] + samples
+
+    if state_clock is not None:
+        clocks = state_clock if isinstance(state_clock, dict) else {None: state_clock}
+        seconds, entered = [], []
+        for unit, clock in sorted(clocks.items(), key=lambda kv: kv[0] or ""):
+            unit_label = "" if unit is None else f'unit="{unit}",'
+            seconds += [f'{{{unit_label}state="{k}"}} {v}' for k, v in sorted(clock.totals().items())]
+            with clock._lock:
+                counts = dict(clock.entered)
+            entered += [f'{{{unit_label}state="{k}"}} {v}' for k, v in sorted(counts.items())]
+        name = f"{prefix}_state_seconds_total"
+        lines += [f"# HELP {name} Time spent in each SYSTEM_STATE.", f"# TYPE {name} counter"]
+        lines += [name + sample for sample in seconds]
+        name = f"{prefix}_state_entered_total"
+        lines.append(f"# TYPE {name} counter")
+        lines += [name + sample for sample in entered]
+    return "\n".join(lines) + "\n"
+
+
+def _percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return None
+    k = min(len(sorted_samples) - 1, max(0, int(round(pct / 100 * len(sorted_samples) + 0.5)) - 1))
+    return round(sorted_samples[k], 3)
+
+
+def elapsed_ms(t0: float) -> float:
+    """time.perf_counter() 기준 경과 ms."""
+    return (time.perf_counter() - t0) * 1000
+
+
+def process_usage():
+    """현재 프로세스(+자식)의 누적 CPU 시간(s)과 RSS(MB).
+
+    psutil이 없으면 os.times()와 /proc/self/statm으로 대신함 (자식 프로세스 RSS는 빠짐).
+    """
+    if psutil is not None:
+        procs = [psutil.Process()]
+        try:
+            procs += procs[0].children(recursive=True)
+        except psutil.Error:
+            pass
+        cpu_s, rss = 0.0, 0
+        for p in procs:
+            try:
+                t = p.cpu_times()
+                cpu_s += t.user + t.system
+                rss += p.memory_info().rss
+            except psutil.Error:
+                continue
+        return {"cpu_s": cpu_s, "rss_mb": rss / 2**20}
+    t = os.times()
+    rss_mb = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss_mb = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        pass
+    return {"cpu_s": t.user + t.system + t.children_user + t.children_system, "rss_mb": rss_mb}
@@ -0,0 +1,125 @@
+"""상태 기반 적응형 추론 스케줄러 (고정 5프레임당 1회 대신).
+
+목표 추론 주기(Hz)를 SYSTEM_STATE와 최근 병 위치로 정한다.
+- off     : YOLO가 꺼져 있거나 SEALING/OPENING (추론 안 함)
+- search  : ALIGNING인데 병 위치를 모름 → 빠르게 찾기
+- align   : ALIGNING, 데드존에서 멀리 있음
+- fine    : ALIGNING, 데드존 근처 (정렬 완료 판단용으로 가장 빠르게)
+- monitor : 그 외 상태에서 YOLO가 켜져 있고 병이 움직이는 중
+- stable  : 그 외 상태에서 병이 stable_time 동안 stable_px 이내로 멈춰 있음 → 느리게
+
+측정된 추론 시간(EMA)으로 상한을 둬서(max_busy 비율) 추론이 자기 자신 뒤에 줄 서지 않게 하고,
+추론기가 바쁘면(idle=False) 이번 프레임은 건너뛴다.
+부하 조절기(governor.py)는 noncritical_scale로 monitor/stable 구간만 낮출 수 있다 (ALIGNING 구간은 그대로).
+"""
+import time
+from collections import deque
+
+OFF, SEARCH, ALIGN, FINE, MONITOR, STABLE = "off", "search", "align", "fine", "monitor", "stable"
+
+# stable은 추적기 max_age(1s) 안에 다음 감지가 오도록 1Hz보다 높게 유지
+DEFAULT_RATES_HZ = {OFF: 0.0, SEARCH: 10.0, ALIGN: 8.0, FINE: 15.0, MONITOR: 5.0, STABLE: 2.0}
+
+
+class InferenceScheduler:
+    def __init__(self, rates_hz: dict = None, near_px: float = 12.0, stable_px: float = 4.0,
+                 stable_time: float = 1.0, max_busy: float = 0.7, window: float = 3.0):
+        self.rates_hz = {**DEFAULT_RATES_HZ, **(rates_hz or {})}
+        self.near_px = near_px          # |오차|가 이 값 이하면 fine
+        self.stable_px = stable_px      # stable_time 동안 중심 이동 폭이 이 값 이하면 stable
+        self.stable_time = stable_time
+        self.max_busy = max_busy        # 추론에 쓸 최대 시간 비율 (추론 ms * Hz / 1000)
+        self.window = window            # 달성 Hz 계산 구간(s)
+        self.regime = OFF
+        self.target_hz = 0.0
+        self.infer_ms_ema = None
+        self.busy_skips = 0
+        self._last_submit = 0.0
+        self._submits = deque()
+        self._centers = deque()         # (ts, cx, cy)
+
+    # ---------- 입력 ----------
+    def record_latency(self, infer_ms: float):
+        self.infer_ms_ema = infer_ms if self.infer_ms_ema is None else 0.8 * self.infer_ms_ema + 0.2 * infer_ms
+
+    def _stable(self, now, center):
+        if center is None:
+            self._centers.clear()
+            return False
+        self._centers.append((now, center[0], center[1]))
+        while self._centers and now - self._centers[0][0] > self.stable_time:
+            self._centers.popleft()
+        if now - self._centers[0][0] < self.stable_time * 0.9:
+            return False
+        xs = [c[1] for c in self._centers]
+        ys = [c[2] for c in self._centers]
+        return max(xs) - min(xs) <= self.stable_px and max(ys) - min(ys) <= self.stable_px
+
+    def plan(self, now: float, aligning: bool, active: bool, center=None, error_px: float = None,
+             noncritical_scale: float = 1.0) -> float:
+        """이번 프레임 기준 목표 Hz를 정함.
+
+        aligning : SYSTEM_STATE == ALIGNING
+        active   : 추론을 돌릴 수 있는 상태 (YOLO_ON이고 SEALING/OPENING이 아님)
+        center   : 현재 병 중심 추정값 (x, y) 또는 None
+        error_px : 정렬 오차 (ALIGNING일 때)
+        noncritical_scale : monitor/stable 구간 Hz 배율 (부하 조절용)
+        """
+        stable = self._stable(now, center)
+        if not active:
+            regime = OFF
+        elif aligning:
+            if center is None or error_px is None:
+                regime = SEARCH
+            elif abs(error_px) <= self.near_px:
+                regime = FINE
+            else:
+                regime = ALIGN
+        else:
+            regime = STABLE if stable else MONITOR
+        self.regime = regime
+        rate = self.rates_hz[regime]
+        if regime in (MONITOR, STABLE):
+            rate *= noncritical_scale
+        self.target_hz = min(rate, self.cap_hz)
+        return self.target_hz
+
+    # ---------- 결정 ----------
+    @property
+    def cap_hz(self):
+        """측정된 추론 시간으로 정한 최대 Hz (아직 측정 전이면 제한 없음)."""
+        if not self.infer_ms_ema:
+            return float("inf")
+        return self.max_busy * 1000.0 / self.infer_ms_ema
+
+    def should_run(self, now: float, idle: bool) -> bool:
+        if self.target_hz <= 0 or now - self._last_submit < 1.0 / self.target_hz:
+            return False
+        if not idle:
+            self.busy_skips += 1
+            return False
+        return True
+
+    def submitted(self, now: float):
+        self._last_submit = now
+        self._submits.append(now)
+        while self._submits and now - self._submits[0] > self.window:
+            self._submits.popleft()
+
+    @property
+    def achieved_hz(self):
+        """최근 window초 동안 실제로 추론을 요청한 횟수/초 (다른 스레드에서 읽어도 안전)."""
+        now = time.monotonic()
+        return sum(1 for t in list(self._submits) if now - t <= self.window) / self.window
+
+    def stats(self):
+        cap = self.cap_hz
+        return {
+            "regime": self.regime,
+            "target_hz": round(self.target_hz, 2),
+            "achieved_hz": round(self.achieved_hz, 2),
+            "cap_hz": None if cap == float("inf") else round(cap, 2),
+            "infer_ms_ema": None if self.infer_ms_ema is None else round(self.infer_ms_ema, 1),
+            "busy_skips": self.busy_skips,
+            "rates_hz": self.rates_hz,
+        }
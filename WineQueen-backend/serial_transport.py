@@ -0,0 +1,203 @@
+"""아두이노 시리얼 전송 계층 (읽기/쓰기 분리, 전이중).
+
+- 리더 스레드: 짧은 timeout으로 읽고 줄 단위로 on_line 콜백 호출 (쓰기와 락을 공유하지 않음)
+- 라이터 스레드: 우선순위 큐에서 명령을 꺼내 전송. 'E'(비상정지)는 큐 맨 앞으로 가고
+  대기 중인 이동 명령(L/R/C)은 버림
+- 포트가 끊기면 두 스레드 모두 재연결을 기다렸다가 이어서 동작
+- metrics(PipelineMetrics)를 주면 serial_write 지연을 기록
+  (펌웨어는 명령별 응답을 보내지 않으므로 왕복 시간은 재지 않음: 'A'/'F'는 상태 알림)
+"""
+import itertools
+import threading
+import time
+from queue import Empty, PriorityQueue
+
+import serial
+
+from async_log import print_log
+
+PRIORITY_EMERGENCY = 0
+PRIORITY_CONTROL = 1   # 정렬 명령 (L/R/C)
+PRIORITY_NORMAL = 2
+
+MOTION_COMMANDS = set("LRC")
+
+
+class CommandHandle:
+    """전송 요청 1건. wait()로 전송 완료를 기다릴 수 있음."""
+
+    def __init__(self, command: str, priority: int):
+        self.command = command
+        self.priority = priority
+        self.queued_at = time.monotonic()
+        self.written_at = None
+        self.error = None
+        self._done = threading.Event()
+
+    @property
+    def write_latency_ms(self):
+        return None if self.written_at is None else (self.written_at - self.queued_at) * 1000
+
+    def _finish(self, error=None):
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """완료되면 True (에러 여부는 .error 확인)."""
+        return self._done.wait(timeout)
+
+
+class SerialTransport:
+    def __init__(self, port: str, baud: int, on_line, reset_wait: float = 2.0, read_timeout: float = 0.1,
+                 metrics=None, log=print_log):
+        self.metrics = metrics
+        self.log = log
+        self.port = port
+        self.baud = baud
+        self.on_line = on_line
+        self.reset_wait = reset_wait
+        self.read_timeout = read_timeout
+        self.ser = None
+        self._connected = threading.Event()
+        self._conn_lock = threading.Lock()
+        self._queue = PriorityQueue()
+        self._order = itertools.count()
+        self._stop = threading.Event()
+        self.stats = {"sent": 0, "dropped": 0, "lines": 0, "reconnects": 0,
+                      "write_ms_last": 0.0, "write_ms_max": 0.0}
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    # ---------- 연결 관리 ----------
+    def _open(self):
+        with self._conn_lock:
+            if self._connected.is_set():
+                return True
+            try:
+                self.ser = serial.Serial(self.port, self.baud, timeout=self.read_timeout, write_timeout=1)
+                self.log("SER", f"open OK {self.port} {self.baud}")
+                time.sleep(self.reset_wait)  # 아두이노 리셋 대기
+                self.ser.reset_input_buffer()
+                self._connected.set()
+                return True
+            except Exception as e:
+                self.log("SER", f"open FAIL: {e}", "warning")
+                self.ser = None
+                return False
+
+    def _drop_connection(self, reason):
+        with self._conn_lock:
+            if not self._connected.is_set():
+                return
+            self.log("SER", f"connection lost: {reason}", "warning")
+            self._connected.clear()
+            self.stats["reconnects"] += 1
+            try:
+                self.ser.close()
+            except Exception:
+                pass
+            self.ser = None
+
+    def ensure_open(self):
+        return self.connected or self._open()
+
+    def _wait_connected(self):
+        while not self._stop.is_set():
+            if self.ensure_open():
+                return True
+            time.sleep(0.5)
+        return False
+
+    # ---------- 스레드 ----------
+    def start(self):
+        threading.Thread(target=self._reader_loop, name="serial-reader", daemon=True).start()
+        threading.Thread(target=self._writer_loop, name="serial-writer", daemon=True).start()
+
+    def close(self):
+        self._stop.set()
+        self._queue.put((PRIORITY_EMERGENCY, -1, None))
+        self._drop_connection("closed")
+
+    def _reader_loop(self):
+        buf = b""
+        while self._wait_connected():
+            ser = self.ser
+            try:
+                chunk = ser.read(ser.in_waiting or 1)
+            except Exception as e:
+                self._drop_connection(e)
+                buf = b""
+                continue
+            if not chunk:
+                continue
+            buf += chunk
+            while b"\n" in buf:
+                raw, buf = buf.split(b"\n", 1)
+                line = raw.decode(errors="ignore").strip()
+                if not line:
+                    continue
+                self.stats["lines"] += 1
+                try:
+                    self.on_line(line)
+                except Exception as e:
+                    self.log("SER", f"line handler error: {e}", "error")
+
+    def _writer_loop(self):
+        while not self._stop.is_set():
+            _, _, handle = self._queue.get()
+            if handle is None:
+                continue
+            if not self._wait_connected():
+                handle._finish("closed")
+                return
+            ser = self.ser
+            try:
+                ser.write(handle.command.encode("utf-8"))
+                ser.flush()
+            except Exception as e:
+                handle._finish(str(e))
+                self._drop_connection(e)
+                continue
+            handle.written_at = time.monotonic()
+            self.stats["sent"] += 1
+            self.stats["write_ms_last"] = handle.write_latency_ms
+            self.stats["write_ms_max"] = max(self.stats["write_ms_max"], handle.write_latency_ms)
+            if self.metrics is not None:
+                self.metrics.observe("serial_write", handle.write_latency_ms)
+            handle._finish()
+
+    # ---------- 전송 ----------
+    def send(self, command: str, priority: int = None) -> CommandHandle:
+        """명령을 큐에 넣고 즉시 반환 (블록하지 않음)."""
+        head = command.strip()[:1]
+        if priority is None:
+            if head == "E":
+                priority = PRIORITY_EMERGENCY
+            elif head in MOTION_COMMANDS:
+                priority = PRIORITY_CONTROL
+            else:
+                priority = PRIORITY_NORMAL
+        handle = CommandHandle(command, priority)
+        if priority == PRIORITY_EMERGENCY:
+            self._drop_pending_motion()
+        self._queue.put((priority, next(self._order), handle))
+        return handle
+
+    def _drop_pending_motion(self):
+        """비상정지 시 아직 보내지 않은 이동 명령은 버림."""
+        kept = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                break
+            handle = item[2]
+            if handle is not None and handle.command.strip()[:1] in MOTION_COMMANDS:
+                handle._finish("dropped by emergency stop")
+                self.stats["dropped"] += 1
+            else:
+                kept.append(item)
+        for item in kept:
+            self._queue.put(item)
@@ -0,0 +1,219 @@
+"""밀봉/개봉 세션 기록 (SQLite).
+
+SessionTracker가 유닛의 상태 변화(STAY → ALIGNING → SEALING/OPENING → STAY)를 보고 세션 1건을 만들고,
+SessionStore는 끝난 세션을 큐에 받아 별도 writer 스레드가 batch_size건 또는 flush_interval초마다
+한 트랜잭션으로 쓴다. 제어 경로에서는 put_nowait만 하므로 디스크가 느려도 막히지 않는다.
+조회는 WAL 모드의 별도 읽기 연결로 하므로 쓰기와 서로 기다리지 않는다.
+
+    sessions(id, unit, action, result, started, ended, duration_s,
+             align_s, align_result, align_commands, align_steps, overshoots,
+             serial_commands, transitions(JSON: [[state, ts], ...]))
+"""
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from queue import Empty, Full, Queue
+
+from async_log import print_log
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    unit TEXT NOT NULL,
+    action TEXT,
+    result TEXT,
+    started REAL NOT NULL,
+    ended REAL,
+    duration_s REAL,
+    align_s REAL,
+    align_result TEXT,
+    align_commands INTEGER,
+    align_steps INTEGER,
+    overshoots INTEGER,
+    serial_commands INTEGER,
+    transitions TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_unit_started ON sessions (unit, started);
+"""
+
+COLUMNS = ("unit", "action", "result", "started", "ended", "duration_s", "align_s", "align_result",
+           "align_commands", "align_steps", "overshoots", "serial_commands", "transitions")
+
+ACTIONS = {'S\n': "seal", 'O\n': "open"}
+
+
+class SessionTracker:
+    """유닛 1개의 상태 전이를 받아 세션 경계를 찾는다 (STAY를 벗어나면 시작, STAY로 돌아오면 끝).
+
+    상태 머신 observer(on_transition)가 전이/알림마다 호출한다.
+    """
+
+    def __init__(self, unit_id: str, idle_state: str = "STAY", process_states=("SEALING", "OPENING")):
+        self.unit_id = unit_id
+        self.idle_state = idle_state
+        self.process_states = process_states
+        self.state = idle_state
+        self.current = None
+
+    def observe(self, state: str, target_action, serial_commands: int):
+        """상태가 바뀌었을 때만 기록. 세션이 끝나면 그 세션 dict를 반환 (그 외에는 None)."""
+        if state == self.state:
+            if self.current is not None and self.current["action"] is None:
+                self.current["action"] = ACTIONS.get(target_action)
+            return None
+        now, self.state = time.time(), state
+        if self.current is None:
+            if state == self.idle_state:
+                return None
+            self.current = {"unit": self.unit_id, "action": ACTIONS.get(target_action), "started": now,
+                            "started_mono": time.monotonic(), "commands0": serial_commands,
+                            "transitions": [[state, round(now, 3)]]}
+            return None
+        session = self.current
+        session["transitions"].append([state, round(now, 3)])
+        if session["action"] is None:
+            session["action"] = ACTIONS.get(target_action)
+        if state != self.idle_state:
+            return None
+        self.current = None
+        visited = {s for s, _ in session["transitions"]}
+        session.update(ended=now, duration_s=round(now - session["started"], 3),
+                       result="completed" if visited & set(self.process_states) else "aborted",
+                       serial_commands=serial_commands - session.pop("commands0"))
+        return session
+
+
+class SessionStore:
+    def __init__(self, path: str, batch_size: int = 32, flush_interval: float = 2.0, maxsize: int = 1024,
+                 metrics=None, log=print_log):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.metrics = metrics
+        self.log = log
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self._queue = Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)  # 조회가 writer보다 먼저 와도 테이블이 있도록
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="session-store", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: float = 2.0):
+        """남은 세션을 쓰고 writer를 멈춤."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def record(self, session: dict) -> bool:
+        """끝난 세션을 쓰기 대기열에 넣음 (가득 차면 버림)."""
+        try:
+            self._queue.put_nowait(session)
+            return True
+        except Full:
+            self.dropped += 1
+            if self.metrics is not None:
+                self.metrics.inc("session_store_dropped")
+            return False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _flush(self, conn, batch):
+        rows = []
+        for s in batch:
+            row = dict(s, transitions=json.dumps(s.get("transitions", [])))
+            rows.append(tuple(row.get(c) for c in COLUMNS))
+        try:
+            with conn:
+                conn.executemany(f"INSERT INTO sessions ({', '.join(COLUMNS)}) "
+                                 f"VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+            self.written += len(rows)
+        except sqlite3.Error as e:
+            self.errors += 1
+            self.log("SESSION", f"write failed ({len(rows)} rows): {e}", "error")
+
+    def _loop(self):
+        conn = self._connect()
+        batch, deadline = [], None
+        try:
+            while True:
+                timeout = self.flush_interval if deadline is None else max(0.0, deadline - time.monotonic())
+                timeout = min(timeout, 0.5)  # 종료 요청을 늦지 않게 확인
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+                except Empty:
+                    pass
+                stopping = self._stop.is_set() and self._queue.empty()
+                if batch and (len(batch) >= self.batch_size or stopping or time.monotonic() >= deadline):
+                    self._flush(conn, batch)
+                    batch, deadline = [], None
+                if stopping:
+                    return
+        finally:
+            conn.close()
+
+    # ---------- 조회 (요청 스레드, 별도 연결) ----------
+    def query(self, unit: str = None, action: str = None, since: float = None, limit: int = 50):
+        """최근 세션부터 limit건."""
+        where, args = [], []
+        for column, value in (("unit", unit), ("action", action)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                args.append(value)
+        if since is not None:
+            where.append("started >= ?")
+            args.append(since)
+        sql = "SELECT id, " + ", ".join(COLUMNS) + " FROM sessions"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY started DESC LIMIT ?"
+        with self._reader() as conn:
+            rows = conn.execute(sql, (*args, limit)).fetchall()
+        out = []
+        for row in rows:
+            item = dict(zip(("id",) + COLUMNS, row))
+            item["transitions"] = json.loads(item["transitions"] or "[]")
+            out.append(item)
+        return out
+
+    def summary(self, since: float = None):
+        """유닛/동작별 세션 수, 완료 수, 평균·최대 정렬 시간, 평균 명령 수."""
+        sql = ("SELECT unit, action, COUNT(*), SUM(result = 'completed'), AVG(align_s), MAX(align_s), "
+               "AVG(align_commands) FROM sessions")
+        args = ()
+        if since is not None:
+            sql += " WHERE started >= ?"
+            args = (since,)
+        sql += " GROUP BY unit, action ORDER BY unit, action"
+        with self._reader() as conn:
+            rows = conn.execute(sql, args).fetchall()
+        return [{"unit": u, "action": a, "sessions": n, "completed": done or 0,
+                 "align_s_mean": None if mean is None else round(mean, 3),
+                 "align_s_max": None if worst is None else round(worst, 3),
+                 "align_commands_mean": None if cmds is None else round(cmds, 1)}
+                for u, a, n, done, mean, worst, cmds in rows]
+
+    def _reader(self):
+        return closing(sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=1.0))
+
+    def stats(self):
+        return {"path": self.path, "queued": self._queue.qsize(), "written": self.written,
+                "dropped": self.dropped, "errors": self.errors}
+
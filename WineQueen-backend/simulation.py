@@ -0,0 +1,424 @@
+"""하드웨어 없이 백엔드를 돌리기 위한 시뮬레이션 도구.
+
+- 프레임 소스 (cv2.VideoCapture와 같은 read/isOpened/set/release 인터페이스)
+    video:PATH   녹화 영상 파일 (끝나면 처음부터 반복)
+    images:DIR   이미지 폴더
+    synthetic    SimWorld의 병 위치로 합성한 프레임
+- VirtualArduino : pty 기반 아두이노 에뮬레이터. L/R/C/S/O/H/E를 받아 병을 움직이고 A/F/1/2를 출력
+- SimDetector    : 합성 프레임의 병(적색 영역)을 찾는 가짜 감지기 (모델 가중치 없이 동작)
+
+모든 지연은 speed 배율로 나눠지므로 speed > 1이면 실제보다 빠르게 돈다.
+
+엔드투엔드 실행:
+    python simulation.py run --cycles 3 --speed 10
+"""
+import argparse
+import glob
+import heapq
+import os
+import random
+import select
+import sys
+import threading
+import time
+import tty
+
+import cv2
+import numpy as np
+
+from async_log import print_log
+from detector import Box
+
+BOTTLE_BGR = (40, 30, 170)          # 합성 병 색 (와인색)
+BOTTLE_SIZE = (110, 150)            # (w, h) px
+BACKGROUND = 200
+
+
+# =========================
+# 시뮬레이션 세계 (병 위치)
+# =========================
+class SimWorld:
+    """카메라 화면 기준 병 중심 y좌표와 X축 스테퍼 이동을 모델링.
+
+    'L'은 오차(병 중심 - 화면 중심)를 줄이는 방향(-y), 'R'은 반대(+y)로 px_per_step씩 이동.
+    """
+
+    def __init__(self, width=640, height=480, px_per_step=6.0, step_time=0.12,
+                 max_offset=80, speed=1.0, seed=None):
+        self.width = width
+        self.height = height
+        self.px_per_step = px_per_step
+        self.step_time = step_time
+        self.max_offset = max_offset
+        self.speed = speed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.y = self.target = height / 2
+        self._ts = time.monotonic()
+        self.reset_offset()
+
+    def _advance(self):
+        now = time.monotonic()
+        dt, self._ts = now - self._ts, now
+        v = self.px_per_step / self.step_time * self.speed
+        delta = self.target - self.y
+        step = max(-v * dt, min(v * dt, delta))
+        self.y += step
+
+    def position(self):
+        with self._lock:
+            self._advance()
+            return self.width / 2, self.y
+
+    def move_steps(self, steps: int):
+        with self._lock:
+            self._advance()
+            self.target += steps * self.px_per_step
+
+    def reset_offset(self):
+        """병을 화면 중심에서 임의로 벗어난 위치에 다시 놓음 (다음 정렬용)."""
+        with self._lock:
+            offset = self._rng.uniform(0.3, 1.0) * self.max_offset * self._rng.choice((-1, 1))
+            self.y = self.target = self.height / 2 + offset
+            self._ts = time.monotonic()
+
+    @property
+    def error(self):
+        return self.position()[1] - self.height / 2
+
+
+# =========================
+# 프레임 소스
+# =========================
+class _PacedSource:
+    """fps * speed 속도로 프레임을 내보내는 공통 부분 (speed <= 0이면 최대 속도)."""
+
+    def __init__(self, fps: float, speed: float):
+        self.fps = fps
+        self.speed = speed
+        self._next = time.monotonic()
+        self._opened = True
+
+    def _pace(self):
+        if self.speed <= 0:
+            return
+        period = 1.0 / (self.fps * self.speed)
+        self._next += period
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self._next = time.monotonic()
+
+    def isOpened(self):
+        return self._opened
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        return 0.0
+
+    def grab(self):
+        return self.isOpened()
+
+    def release(self):
+        self._opened = False
+
+
+class SyntheticBottleSource(_PacedSource):
+    def __init__(self, world: SimWorld, fps=30.0, speed=1.0):
+        super().__init__(fps, speed)
+        self.world = world
+        self._background = np.full((world.height, world.width, 3), BACKGROUND, dtype=np.uint8)
+        # 약한 세로 그라데이션 (완전히 평평한 화면 방지)
+        self._background[:, :, 1] = np.linspace(180, 220, world.height, dtype=np.uint8)[:, None]
+
+    def read(self, image=None):
+        self._pace()
+        shape = self._background.shape
+        frame = image if image is not None and image.shape == shape else np.empty(shape, dtype=np.uint8)
+        np.copyto(frame, self._background)
+        cx, cy = self.world.position()
+        bw, bh = BOTTLE_SIZE
+        cv2.rectangle(frame, (int(cx - bw / 2), int(cy - bh / 2)), (int(cx + bw / 2), int(cy + bh / 2)),
+                      BOTTLE_BGR, -1)
+        cv2.circle(frame, (int(cx), int(cy)), bw // 4, (20, 20, 90), -1)  # 병 입구
+        return True, frame
+
+
+class VideoFileSource(_PacedSource):
+    def __init__(self, path: str, width=640, height=480, speed=1.0, loop=True):
+        self._cap = cv2.VideoCapture(path)
+        super().__init__(self._cap.get(cv2.CAP_PROP_FPS) or 30.0, speed)
+        self.size = (width, height)
+        self.loop = loop
+        self.path = path
+
+    def isOpened(self):
+        return self._opened and self._cap.isOpened()
+
+    def read(self, image=None):
+        self._pace()
+        ret, frame = self._cap.read()
+        if not ret and self.loop:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self._cap.read()
+        if not ret:
+            return False, None
+        return True, _fit(frame, self.size, image)
+
+    def release(self):
+        super().release()
+        self._cap.release()
+
+
+class ImageDirSource(_PacedSource):
+    def __init__(self, directory: str, width=640, height=480, fps=30.0, speed=1.0, loop=True):
+        super().__init__(fps, speed)
+        self.paths = sorted(p for ext in ("jpg", "jpeg", "png")
+                            for p in glob.glob(os.path.join(directory, f"*.{ext}")))
+        self.size = (width, height)
+        self.loop = loop
+        self._i = 0
+        self._opened = bool(self.paths)
+
+    def read(self, image=None):
+        self._pace()
+        if self._i >= len(self.paths):
+            if not self.loop:
+                return False, None
+            self._i = 0
+        frame = cv2.imread(self.paths[self._i])
+        self._i += 1
+        if frame is None:
+            return False, None
+        return True, _fit(frame, self.size, image)
+
+
+def _fit(frame, size, image=None):
+    """프레임을 카메라 해상도로 맞추고, 가능하면 주어진 버퍼에 씀."""
+    if (frame.shape[1], frame.shape[0]) != size:
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    if image is not None and image.shape == frame.shape:
+        np.copyto(image, frame)
+        return image
+    return frame
+
+
+def open_frame_source(spec: str, width=640, height=480, world: SimWorld = None, speed=1.0):
+    """'video:PATH' | 'images:DIR' | 'synthetic' 문자열로 프레임 소스 생성."""
+    kind, _, arg = spec.partition(":")
+    if kind == "video":
+        return VideoFileSource(arg, width, height, speed=speed)
+    if kind == "images":
+        return ImageDirSource(arg, width, height, speed=speed)
+    if kind == "synthetic":
+        return SyntheticBottleSource(world or SimWorld(width, height, speed=speed), speed=speed)
+    raise ValueError(f"unknown camera source '{spec}' (video:PATH | images:DIR | synthetic)")
+
+
+# =========================
+# 가짜 감지기
+# =========================
+class SimDetector:
+    """합성 병(적색 영역)의 외접 사각형을 반환. ROI/축소 입력에서도 그대로 동작."""
+    backend = "sim"
+
+    def __init__(self, imgsz=128, conf=0.5, max_det=1, latency_ms=0.0, **_):
+        self.path = "sim"
+        self.imgsz = imgsz
+        self.latency_ms = latency_ms
+        self.names = {0: "wine"}
+
+    def predict(self, frame, imgsz=None):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        mask = cv2.inRange(frame, (0, 0, 120), (90, 90, 255))
+        if cv2.countNonZero(mask) < 20:
+            return []
+        x, y, w, h = cv2.boundingRect(mask)
+        return [Box(float(x), float(y), float(x + w), float(y + h), 0.99, 0)]
+
+    def predict_batch(self, frames, imgsz=None):
+        return [self.predict(frame, imgsz) for frame in frames]
+
+    def warmup(self, shape=(480, 640, 3), imgsz=None):
+        pass
+
+
+# =========================
+# 가상 아두이노 (pty)
+# =========================
+class VirtualArduino:
+    """WINEQUEEN_HW.ino의 시리얼 동작을 흉내내는 에뮬레이터.
+
+    버튼(1/2) 또는 S/O 수신 → (align_delay) → 'A' → L/R로 병 이동 → 'C' → (process_time) → 'F'
+    H: 홈 복귀, E: 즉시 정지. 정렬 중 align_timeout 동안 C가 없으면 'F'.
+    """
+    IDLE, PREP, ALIGNING, PROCESS = "IDLE", "PREP", "ALIGNING", "PROCESS"
+
+    def __init__(self, world: SimWorld, speed=1.0, align_delay=2.0, process_time=15.0, align_timeout=60.0,
+                 log=print_log):
+        self.world = world
+        self.log = log
+        self.speed = speed
+        self.align_delay = align_delay
+        self.process_time = process_time
+        self.align_timeout = align_timeout
+        self.state = self.IDLE
+        self.received = []     # 수신한 명령 문자 기록
+        self.emitted = []      # 출력한 줄 기록
+        self._timers = []      # (due, seq, fn)
+        self._timer_seq = 0
+        self._lock = threading.Lock()
+        self._master = self._slave = None
+        self.port = None
+
+    def start(self):
+        """pty를 만들고 에뮬레이터 스레드를 시작. 백엔드가 열 포트 경로를 반환."""
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        threading.Thread(target=self._loop, name="virtual-arduino", daemon=True).start()
+        self.log("SIM", f"virtual arduino on {self.port} (speed x{self.speed})")
+        return self.port
+
+    # ---------- 외부 조작 ----------
+    def press_button(self, n: int):
+        with self._lock:
+            if self.state != self.IDLE:
+                return False
+            self._emit(str(n))
+            self._begin_cycle()
+            return True
+
+    # ---------- 내부 ----------
+    def _after(self, seconds, fn):
+        self._timer_seq += 1
+        heapq.heappush(self._timers, (time.monotonic() + seconds / self.speed, self._timer_seq, fn))
+
+    def _cancel_timers(self):
+        self._timers.clear()
+
+    def _emit(self, line):
+        self.emitted.append(line)
+        os.write(self._master, (line + "\r\n").encode())
+
+    def _begin_cycle(self):
+        self.state = self.PREP
+        self._after(self.align_delay, self._start_align)
+
+    def _start_align(self):
+        self.state = self.ALIGNING
+        self._emit("A")
+        self._after(self.align_timeout, self._align_timeout)
+
+    def _align_timeout(self):
+        if self.state == self.ALIGNING:
+            self._finish()
+
+    def _finish(self):
+        self._cancel_timers()
+        self._emit("F")
+        self.state = self.IDLE
+        self.world.reset_offset()
+
+    def _handle(self, ch):
+        self.received.append(ch)
+        if ch in "LR" and self.state == self.ALIGNING:
+            self.world.move_steps(-1 if ch == "L" else 1)
+        elif ch == "C" and self.state == self.ALIGNING:
+            self._cancel_timers()
+            self.state = self.PROCESS
+            self._after(self.process_time, self._finish)
+        elif ch in "SO" and self.state == self.IDLE:
+            self._begin_cycle()
+        elif ch == "H":
+            self._cancel_timers()
+            self.state = self.IDLE
+            self.world.reset_offset()
+        elif ch == "E":
+            self._cancel_timers()
+            self.state = self.IDLE
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                timeout = max(0.0, self._timers[0][0] - time.monotonic()) if self._timers else 0.5
+            readable, _, _ = select.select([self._master], [], [], timeout)
+            with self._lock:
+                if readable:
+                    for ch in os.read(self._master, 256).decode(errors="ignore"):
+                        self._handle(ch)
+                while self._timers and self._timers[0][0] <= time.monotonic():
+                    _, _, fn = heapq.heappop(self._timers)
+                    fn()
+
+
+# =========================
+# 엔드투엔드 실행기
+# =========================
+def start_backend(port: int = 8765):
+    """환경 변수(WINEQUEEN_*)를 설정한 뒤 호출. main을 import해 uvicorn을 스레드로 띄우고
+    모델 로드와 (모든 유닛의) 가상 아두이노 연결까지 기다린 뒤 (main 모듈, uvicorn.Server)를 반환."""
+    import uvicorn
+    import main
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started or main.MODEL_STATUS["status"] == "loading":
+        time.sleep(0.05)
+    if main.MODEL_STATUS["status"] != "ready":
+        raise RuntimeError(f"model load failed: {main.MODEL_STATUS['error']}")
+    for unit in main.units.values():
+        if unit.config.sim_serial:
+            while unit.virtual_arduino is None or not unit.serial_transport.connected:
+                time.sleep(0.05)
+    return main, server
+
+
+def run_cycles(cycles: int, speed: float, port: int = 8765, timeout: float = 120.0):
+    """시뮬레이션 환경으로 백엔드를 띄우고 밀봉/개봉 사이클을 반복 실행."""
+    os.environ.setdefault("WINEQUEEN_CAMERA", "synthetic")
+    os.environ.setdefault("WINEQUEEN_SERIAL", "sim")
+    os.environ.setdefault("WINEQUEEN_INFER_BACKEND", "sim")
+    os.environ["WINEQUEEN_SIM_SPEED"] = str(speed)
+    main, server = start_backend(port)
+    unit = main.default_unit
+
+    results = []
+    for i in range(cycles):
+        button = 1 if i % 2 == 0 else 2
+        t0 = time.monotonic()
+        unit.virtual_arduino.press_button(button)
+        while unit.virtual_arduino.state == VirtualArduino.IDLE and time.monotonic() - t0 < timeout:
+            time.sleep(0.01)
+        while unit.virtual_arduino.state != VirtualArduino.IDLE and time.monotonic() - t0 < timeout:
+            time.sleep(0.01)
+        elapsed = time.monotonic() - t0
+        session = unit.aligner.sessions[-1].to_dict() if unit.aligner.sessions else None
+        ok = bool(session) and session["result"] == "aligned"
+        results.append({"cycle": i + 1, "button": button, "ok": ok, "elapsed_s": round(elapsed, 2),
+                        "alignment": session})
+        print(f"[SIM] cycle {i + 1}: {'OK' if ok else 'FAIL'} {elapsed:.2f}s {session}")
+    server.should_exit = True
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WineQueen 하드웨어 없는 시뮬레이션")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    run = sub.add_parser("run", help="가상 카메라/아두이노로 밀봉·개봉 사이클 실행")
+    run.add_argument("--cycles", type=int, default=2)
+    run.add_argument("--speed", type=float, default=10.0, help="시뮬레이션 시간 배율")
+    run.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+    results = run_cycles(args.cycles, args.speed, args.port)
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""이벤트 기반 밀봉/개봉 상태 머신.
+
+SYSTEM_STATE / TARGET_ACTION / YOLO_ON을 여러 스레드가 state_lock 아래에서 직접 바꾸던 것을
+유닛마다 StationMachine 1개로 모은다. 모든 입력은 이벤트로 들어온다.
+
+    serial  : 아두이노 한 줄 ('A' 정렬 요청, 'F' 완료, '1'/'2' 버튼)
+    command : HTTP/내부 명령 (seal, open, home, stop, yolo_on, yolo_off)
+    aligned : detection_loop의 정렬 완료 판정
+    timer   : 머신이 예약한 타이머 (예: 'C' 후 confirm_delay 뒤 목표 동작 전송)
+
+전이 중 시리얼 전송은 send(command)로, 지연이 필요한 동작은 블록하지 않는 타이머로 처리한다
+(detection_loop에서 time.sleep(0.2) 하던 부분). 상태/목표/YOLO가 바뀌거나 알림(버튼 등)이 생기면
+구독한 observer(WS 발행, 세션 기록, 상태 시간 측정, 로그)에 Transition을 바로 전달한다.
+observer는 머신 락 안에서 순서대로 호출되므로 블록하지 않아야 한다 (큐에 넣기 등).
+
+외부 이벤트는 events에 기록되고, replay()가 가상 시계로 같은 순서/간격을 다시 실행해
+같은 전이와 전송 명령을 재현한다 (이벤트 처리 지연 측정용):
+
+    python state_machine.py replay events.json --runs 5
+"""
+import argparse
+import heapq
+import itertools
+import json
+import sys
+import threading
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+
+STAY = "STAY"
+ALIGNING = "ALIGNING"
+SEALING = "SEALING"
+OPENING = "OPENING"
+
+TARGET_STATES = {'S\n': SEALING, 'O\n': OPENING}
+
+# 알림 (observer가 WS 이벤트로 바꿈)
+SEAL_REDIRECT = "SEAL_REDIRECT"
+OPEN_REDIRECT = "OPEN_REDIRECT"
+PROCESS_FINISHED = "PROCESS_FINISHED"
+
+
+class Event(NamedTuple):
+    kind: str
+    value: Optional[str] = None
+    ts: float = 0.0
+
+
+class Transition(NamedTuple):
+    event: Event
+    old: str
+    new: str
+    target_action: Optional[str]
+    yolo_on: bool
+    yolo_changed: bool
+    notices: tuple
+
+
+class Outcome(NamedTuple):
+    accepted: bool
+    reason: str = ""
+    sent: tuple = ()  # ((command, ok, message), ...)
+
+
+class StationMachine:
+    def __init__(self, send, clock=time.monotonic, confirm_delay: float = 0.2, timers=None, history: int = 2048):
+        self.send = send                    # send(command) -> (ok, message), 블록하지 않아야 함
+        self.clock = clock
+        self.confirm_delay = confirm_delay  # 'C' 전송 후 목표 동작(S/O)을 보낼 때까지
+        self.state = STAY
+        self.target_action = None           # 'S\n' or 'O\n'
+        self.yolo_on = False
+        self.events = deque(maxlen=history)  # 외부 입력 이벤트 (timer 제외, 리플레이용)
+        self.transitions = 0
+        self.rejected = 0
+        self._timers = []                   # (due, seq, name)
+        self._timer_seq = itertools.count()
+        self._observers = []
+        self._lock = threading.RLock()
+        self._timer_service = timers
+        if timers is not None:
+            timers.register(self)
+
+    def subscribe(self, observer):
+        """observer(transition)를 전이/알림마다 호출."""
+        self._observers.append(observer)
+
+    def snapshot(self):
+        with self._lock:
+            return self.state, self.target_action, self.yolo_on
+
+    # ---------- 입력 ----------
+    def dispatch(self, kind: str, value: str = None) -> Outcome:
+        """이벤트 1개를 처리하고 결과를 반환 (임의 스레드에서 호출 가능)."""
+        with self._lock:
+            event = Event(kind, value, self.clock())
+            if kind != "timer":
+                self.events.append(event)
+            old_state, old_target, old_yolo = self.state, self.target_action, self.yolo_on
+            sends, notices = [], []
+            accepted, reason = self._handle(event, sends, notices)
+            if not accepted:
+                self.rejected += 1
+            sent = tuple((command, *self.send(command)) for command in sends)
+            if (self.state, self.target_action, self.yolo_on) != (old_state, old_target, old_yolo) or notices:
+                self.transitions += 1
+                transition = Transition(event, old_state, self.state, self.target_action, self.yolo_on,
+                                        self.yolo_on != old_yolo, tuple(notices))
+                for observer in self._observers:
+                    observer(transition)
+            return Outcome(accepted, reason, sent)
+
+    def _handle(self, event: Event, sends: list, notices: list):
+        """전이 규칙. (accepted, reason)을 반환하고 전송할 명령/알림은 sends/notices에 넣음."""
+        kind, value = event.kind, event.value
+        if kind == "serial":
+            if value == 'A':
+                self.yolo_on = True
+                self.state = ALIGNING
+            elif value == 'F':
+                self._cancel_timers()
+                self.yolo_on = False
+                self.state = STAY
+                self.target_action = None
+                notices.append(PROCESS_FINISHED)
+            elif value == '1':
+                self.target_action = 'S\n'
+                notices.append(SEAL_REDIRECT)
+            elif value == '2':
+                self.target_action = 'O\n'
+                notices.append(OPEN_REDIRECT)
+            else:
+                return False, f"unknown serial line '{value}'"
+        elif kind == "command":
+            if value in ("seal", "open"):
+                if self.state != STAY:
+                    return False, f"System is busy with '{self.state}'"
+                self.state = ALIGNING
+                self.target_action = 'S\n' if value == "seal" else 'O\n'
+            elif value == "home":
+                sends.append('H\n')
+            elif value == "stop":
+                self._cancel_timers()
+                self.state = STAY
+                self.target_action = None
+                self.yolo_on = False
+                sends.append('E\n')
+            elif value in ("yolo_on", "yolo_off"):
+                self.yolo_on = value == "yolo_on"
+            else:
+                return False, f"unknown command '{value}'"
+        elif kind == "aligned":
+            if self.state != ALIGNING:
+                return False, f"not aligning (state={self.state})"
+            sends.append('C\n')
+            self.yolo_on = False
+            if not self.target_action:
+                self.state = STAY
+                return False, "No target action set!"
+            # 목표 동작은 confirm_delay 뒤 타이머로 (감지 스레드를 재우지 않음)
+            self.state = TARGET_STATES[self.target_action]
+            self._schedule("send_target", self.confirm_delay)
+        elif kind == "timer":
+            if value == "send_target" and self.state in (SEALING, OPENING) and self.target_action:
+                sends.append(self.target_action)
+        else:
+            return False, f"unknown event '{kind}'"
+        return True, ""
+
+    # ---------- 타이머 ----------
+    def _schedule(self, name: str, delay: float):
+        heapq.heappush(self._timers, (self.clock() + delay, next(self._timer_seq), name))
+        if self._timer_service is not None:
+            self._timer_service.wake()
+
+    def _cancel_timers(self):
+        self._timers.clear()
+
+    def next_due(self):
+        with self._lock:
+            return self._timers[0][0] if self._timers else None
+
+    def fire_due(self, now: float):
+        """now까지 기한이 된 타이머를 순서대로 timer 이벤트로 처리."""
+        while True:
+            with self._lock:
+                if not self._timers or self._timers[0][0] > now:
+                    return
+                _, _, name = heapq.heappop(self._timers)
+                self.dispatch("timer", name)
+
+    # ---------- 기록 ----------
+    def recorded(self):
+        """리플레이용 외부 이벤트 목록 [{kind, value, t}] (t는 첫 이벤트 기준 초)."""
+        with self._lock:
+            events = list(self.events)
+        t0 = events[0].ts if events else 0.0
+        return [{"kind": e.kind, "value": e.value, "t": round(e.ts - t0, 6)} for e in events]
+
+    def stats(self):
+        state, target, yolo = self.snapshot()
+        return {"state": state, "target_action": target, "yolo_on": yolo, "transitions": self.transitions,
+                "rejected": self.rejected, "recorded_events": len(self.events),
+                "pending_timers": len(self._timers)}
+
+
+class TimerService:
+    """여러 StationMachine의 타이머를 스레드 1개로 처리 (가장 가까운 기한까지만 대기)."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._machines = []
+        self._cond = threading.Condition()
+        self._woken = False   # 대기 전에 wake()가 왔는지 (놓친 notify 방지)
+        self._thread = None
+
+    def register(self, machine: StationMachine):
+        self._machines.append(machine)
+
+    def wake(self):
+        with self._cond:
+            self._woken = True
+            self._cond.notify()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="state-timers", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            # 기한 계산 전에 플래그를 내림: 계산 도중 예약된 타이머는 _woken으로 남아 대기를 건너뜀
+            # (next_due는 머신 락을 잡으므로 _cond 안에서 부르지 않음 — dispatch → wake와 락 순서가 반대)
+            with self._cond:
+                self._woken = False
+            now = self.clock()
+            for machine in self._machines:
+                machine.fire_due(now)
+            dues = [d for d in (m.next_due() for m in self._machines) if d is not None]
+            with self._cond:
+                if not self._woken:
+                    self._cond.wait(None if not dues else max(0.0, min(dues) - self.clock()))
+
+
+# =========================
+# 리플레이
+# =========================
+class _VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def replay(events, confirm_delay: float = 0.2, tail: float = 5.0):
+    """기록된 외부 이벤트를 가상 시계로 다시 실행.
+
+    타이머는 기한 시각에 맞춰 이벤트 사이에 처리되므로 같은 입력이면 항상 같은 출력이 나온다.
+    (출력 [(t, kind, ...)], 이벤트별 처리 시간 us 목록)을 반환.
+    """
+    clock = _VirtualClock()
+    output = []
+
+    def send(command):
+        output.append((round(clock.now, 6), "send", command.strip()))
+        return True, "replay"
+
+    machine = StationMachine(send, clock=clock, confirm_delay=confirm_delay)
+    machine.subscribe(lambda tr: output.append(
+        (round(clock.now, 6), "transition", tr.event.kind, tr.event.value, tr.old, tr.new,
+         (tr.target_action or "").strip(), tr.yolo_on, list(tr.notices))))
+
+    def run_timers(until):
+        due = machine.next_due()
+        while due is not None and due <= until:
+            clock.now = due
+            machine.fire_due(due)
+            due = machine.next_due()
+
+    latencies_us = []
+    for event in events:
+        run_timers(event["t"])
+        clock.now = event["t"]
+        t0 = time.perf_counter()
+        machine.dispatch(event["kind"], event.get("value"))
+        latencies_us.append((time.perf_counter() - t0) * 1e6)
+    run_timers(clock.now + tail)
+    return output, latencies_us
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="상태 머신 이벤트 기록 리플레이")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    rep = sub.add_parser("replay", help="GET /debug/events 결과(JSON)를 다시 실행")
+    rep.add_argument("events")
+    rep.add_argument("--runs", type=int, default=3, help="반복 횟수 (결과가 매번 같은지 확인)")
+    rep.add_argument("--confirm-delay", type=float, default=0.2)
+    rep.add_argument("--quiet", action="store_true", help="전이/전송 목록 출력 생략")
+    args = parser.parse_args(argv)
+
+    with open(args.events) as f:
+        events = json.load(f)
+    if isinstance(events, dict):
+        events = events["events"]
+    outputs, latencies = [], []
+    for _ in range(max(1, args.runs)):
+        output, lat = replay(events, args.confirm_delay)
+        outputs.append(output)
+        latencies += lat
+    if not args.quiet:
+        for item in outputs[0]:
+            print(f"[REPLAY] {item[0]:>10.3f}s " + " ".join(str(v) for v in item[1:]))
+    latencies.sort()
+    pick = lambda p: latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] if latencies else 0.0
+    deterministic = all(o == outputs[0] for o in outputs)
+    print(f"[REPLAY] events={len(events)} runs={len(outputs)} outputs={len(outputs[0])} "
+          f"deterministic={deterministic}")
+    print(f"[REPLAY] dispatch latency us: p50={pick(50):.1f} p99={pick(99):.1f} max={latencies[-1] if latencies else 0:.1f}")
+    return 0 if deterministic else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
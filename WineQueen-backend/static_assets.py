@@ -0,0 +1,172 @@
+"""빌드된 프론트엔드(SPA) 정적 파일을 메모리에서 서빙.
+
+시작할 때 dist/ 아래 파일을 한 번 읽어 경로 → Asset 표를 만들고, 압축 가능한 파일은 gzip/brotli로
+미리 압축해 둔다 (압축은 백그라운드 스레드, 끝나기 전 요청은 원본으로 응답). 요청마다 디스크를 보거나
+다시 압축하지 않으므로 키오스크 새로고침/원격 브라우저가 영상 스트림과 CPU·대역폭을 다투지 않는다.
+
+- ETag: 내용 해시 기반 strong ETag (인코딩별로 -gz / -br 접미사), If-None-Match가 맞으면 304
+- Cache-Control: 파일명에 해시가 있는 vite 산출물(assets/index-B1x2y3z4.js)은 1년 immutable,
+  index.html 등 나머지는 no-cache (매번 ETag로 재검증 → 바뀌지 않았으면 304)
+- Accept-Encoding에 따라 br > gzip > 원본 (brotli 패키지가 없으면 gzip까지만)
+- 확장자가 없는 경로(/seal, /open 등 SPA 라우트)는 index.html, 없는 파일(.js 등)은 404
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from typing import NamedTuple, Optional
+
+from starlette.responses import Response
+
+try:
+    import brotli  # 선택 사항 (없으면 gzip만)
+except ImportError:
+    brotli = None
+
+HASHED_DIR = "assets/"
+HASHED_NAME = re.compile(r"-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")  # vite: assets/name-<8자 해시>.ext
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE = ("application/javascript", "text/javascript", "application/json", "image/svg+xml",
+                "application/manifest+json", "application/wasm", "application/xml")
+MIN_COMPRESS_SIZE = 256
+
+
+class Asset(NamedTuple):
+    body: bytes
+    content_type: str
+    etag: str                    # '"<hash>"'
+    cache_control: str
+    gzip: Optional[bytes] = None
+    br: Optional[bytes] = None
+
+
+def _compressible(content_type: str) -> bool:
+    return content_type.startswith("text/") or content_type in COMPRESSIBLE
+
+
+def _tag_hash(tag: str) -> str:
+    """'W/"abc-gz"' → 'abc' (If-None-Match는 약한 비교, 인코딩 접미사 무시)."""
+    return tag.strip().removeprefix("W/").strip('"').split("-")[0]
+
+
+def _accepts(header: str, coding: str) -> bool:
+    """Accept-Encoding에 coding이 q>0으로 있는지."""
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() != coding:
+            continue
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                return float(q[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+class AssetTable:
+    def __init__(self, root: str, aliases=None, index: str = "index.html", metrics=None):
+        self.root = root
+        self.aliases = aliases or {}   # URL 접두사 → dist 안의 폴더 (예: static/ → assets/)
+        self.index = index
+        self.metrics = metrics
+        self.assets = {}               # "assets/index-abc.js" → Asset
+        self.compressed = False
+        self.served = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.bytes_raw = 0
+
+    # ---------- 로드 ----------
+    def load(self, compress_async: bool = True):
+        """파일을 모두 메모리에 올리고 압축본을 만든다 (compress_async면 압축은 백그라운드)."""
+        for folder, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(folder, name)
+                rel = os.path.relpath(path, self.root).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    body = f.read()
+                content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+                cache = IMMUTABLE if rel.startswith(HASHED_DIR) and HASHED_NAME.search(name) else REVALIDATE
+                self.assets[rel] = Asset(body, content_type, etag, cache)
+        if compress_async:
+            threading.Thread(target=self._compress_all, name="static-compress", daemon=True).start()
+        else:
+            self._compress_all()
+        return self
+
+    def _compress_all(self):
+        for rel, asset in list(self.assets.items()):
+            if not _compressible(asset.content_type) or len(asset.body) < MIN_COMPRESS_SIZE:
+                continue
+            gz = gzip.compress(asset.body, compresslevel=9, mtime=0)
+            br = brotli.compress(asset.body, quality=11) if brotli is not None else None
+            limit = len(asset.body) * 0.9  # 10% 이상 줄지 않으면 원본만
+            self.assets[rel] = asset._replace(gzip=gz if len(gz) < limit else None,
+                                              br=br if br is not None and len(br) < limit else None)
+        self.compressed = True
+
+    # ---------- 조회 ----------
+    def lookup(self, path: str):
+        """URL 경로 → (키, Asset). SPA 라우트는 index.html, 없는 파일은 (None, None)."""
+        rel = path.lstrip("/")
+        for prefix, target in self.aliases.items():
+            if rel.startswith(prefix):
+                rel = target + rel[len(prefix):]
+                break
+        asset = self.assets.get(rel)
+        if asset is not None:
+            return rel, asset
+        if "." in rel.rsplit("/", 1)[-1]:
+            return None, None
+        return self.index, self.assets.get(self.index)
+
+    def response(self, path: str, headers) -> Response:
+        _, asset = self.lookup(path)
+        if asset is None:
+            return Response(status_code=404)
+        accept = headers.get("accept-encoding", "")
+        if asset.br is not None and _accepts(accept, "br"):
+            body, encoding, etag = asset.br, "br", asset.etag[:-1] + '-br"'
+        elif asset.gzip is not None and _accepts(accept, "gzip"):
+            body, encoding, etag = asset.gzip, "gzip", asset.etag[:-1] + '-gz"'
+        else:
+            body, encoding, etag = asset.body, None, asset.etag
+        out = {"ETag": etag, "Cache-Control": asset.cache_control}
+        if asset.gzip is not None or asset.br is not None:
+            out["Vary"] = "Accept-Encoding"
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match:
+            # 같은 내용이면 다른 인코딩의 ETag로 물어도 304
+            tags = {_tag_hash(t) for t in if_none_match.split(",")}
+            if "*" in tags or _tag_hash(asset.etag) in tags:
+                self.not_modified += 1
+                if self.metrics is not None:
+                    self.metrics.inc("static_not_modified")
+                return Response(status_code=304, headers=out)
+
+        if encoding:
+            out["Content-Encoding"] = encoding
+        self.served += 1
+        self.bytes_sent += len(body)
+        self.bytes_raw += len(asset.body)
+        if self.metrics is not None:
+            self.metrics.inc("static_served")
+        return Response(body, media_type=asset.content_type, headers=out)
+
+    def stats(self):
+        return {
+            "root": os.path.abspath(self.root), "files": len(self.assets), "compressed": self.compressed,
+            "brotli": brotli is not None,
+            "bytes": sum(len(a.body) for a in self.assets.values()),
+            "gzip_bytes": sum(len(a.gzip or a.body) for a in self.assets.values()),
+            "br_bytes": sum(len(a.br or a.gzip or a.body) for a in self.assets.values()),
+            "served": self.served, "not_modified": self.not_modified,
+            "bytes_sent": self.bytes_sent, "bytes_raw": self.bytes_raw,
+        }
@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class BoxTracker:
+    """YOLO 감지 사이를 메우는 박스 중심 추적기 (등속 칼만 필터).
+
+    - update(): 감지 결과(원본 프레임 좌표)로 보정
+    - estimate(): 임의 시각의 중심 추정값 (추적 상실 시 None)
+    - roi(): 다음 YOLO 실행에 쓸 관심 영역 (추적 상실 시 None → 전체 프레임)
+    """
+
+    def __init__(self, max_age: float = 1.0, max_misses: int = 2, roi_scale: float = 2.0,
+                 roi_min: int = 96, process_noise: float = 200.0, measure_noise: float = 4.0):
+        self.max_age = max_age          # 마지막 감지 후 이 시간(s)이 지나면 추적 상실
+        self.max_misses = max_misses    # 연속 미감지 허용 횟수
+        self.roi_scale = roi_scale      # ROI 크기 = 박스 크기 * roi_scale
+        self.roi_min = roi_min          # ROI 최소 한 변 길이(px)
+        self.q = process_noise
+        self.r = measure_noise
+        self.reset()
+
+    def reset(self):
+        self.x = None        # [cx, cy, vx, vy]
+        self.P = None
+        self.size = None     # 마지막 박스 (w, h)
+        self.ts = 0.0        # 마지막 감지 시각
+        self.misses = 0
+
+    @property
+    def lost(self):
+        return self.x is None or self.misses >= self.max_misses
+
+    def _predict_to(self, ts):
+        dt = max(ts - self.ts, 0.0)
+        F = np.array([[1, 0, dt, 0], [0, 1, 0, dt], [0, 0, 1, 0], [0, 0, 0, 1]], dtype=np.float64)
+        self.x = F @ self.x
+        self.P = F @ self.P @ F.T + np.eye(4) * self.q * max(dt, 1e-3)
+
+    def update(self, box, ts: float):
+        """box: 원본 프레임 좌표 (x1, y1, x2, y2)."""
+        x1, y1, x2, y2 = box
+        z = np.array([(x1 + x2) / 2, (y1 + y2) / 2], dtype=np.float64)
+        self.size = (x2 - x1, y2 - y1)
+        self.misses = 0
+        if self.x is None:
+            self.x = np.array([z[0], z[1], 0.0, 0.0])
+            self.P = np.diag([self.r, self.r, 1e3, 1e3])
+            self.ts = ts
+            return
+        self._predict_to(ts)
+        H = np.array([[1, 0, 0, 0], [0, 1, 0, 0]], dtype=np.float64)
+        S = H @ self.P @ H.T + np.eye(2) * self.r
+        K = self.P @ H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (z - H @ self.x)
+        self.P = (np.eye(4) - K @ H) @ self.P
+        self.ts = ts
+
+    def miss(self):
+        """YOLO를 돌렸는데 박스가 없었음."""
+        self.misses += 1
+        if self.lost:
+            self.reset()
+
+    def estimate(self, ts: float):
+        """ts 시각의 중심 (cx, cy) 추정값. 추적 상실이면 None."""
+        if self.lost:
+            return None
+        if ts - self.ts > self.max_age:
+            self.reset()
+            return None
+        dt = max(ts - self.ts, 0.0)
+        return float(self.x[0] + self.x[2] * dt), float(self.x[1] + self.x[3] * dt)
+
+    def roi(self, ts: float, frame_w: int, frame_h: int):
+        """다음 추론에 쓸 잘라낼 영역 (x1, y1, x2, y2). 추적 상실이면 None."""
+        center = self.estimate(ts)
+        if center is None:
+            return None
+        cx, cy = center
+        rw = min(max(self.size[0] * self.roi_scale, self.roi_min), frame_w)
+        rh = min(max(self.size[1] * self.roi_scale, self.roi_min), frame_h)
+        x1 = int(min(max(cx - rw / 2, 0), frame_w - rw))
+        y1 = int(min(max(cy - rh / 2, 0), frame_h - rh))
+        return x1, y1, int(x1 + rw), int(y1 + rh)
@@ -0,0 +1,60 @@
+"""스테이션(유닛) 등록부 설정.
+
+한 백엔드 프로세스가 여러 WineQueen 스테이션을 함께 운영한다. 유닛마다 카메라/시리얼/상태 머신/
+WS·스트림 네임스페이스(/units/{id}/...)를 따로 갖고, YOLO 모델은 1개를 공유한다 (main.py의 Unit).
+
+WINEQUEEN_UNITS 환경 변수로 지정 (없으면 기존 단일 장치 설정으로 유닛 1개):
+    - JSON 파일 경로 또는 JSON 문자열
+    - [{"id": "a", "camera": "/dev/winecam0", "serial": "/dev/arduino0"},
+       {"id": "b", "camera": "synthetic", "serial": "sim"}]
+
+camera : V4L2 장치 경로 또는 시뮬레이션 소스(video:PATH | images:DIR | synthetic)
+serial : 아두이노 포트 경로 또는 sim (pty 가상 아두이노)
+"""
+import json
+import os
+import re
+from typing import List, NamedTuple
+
+SIM_CAMERA_KINDS = ("video", "images", "synthetic")
+_UNIT_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class UnitConfig(NamedTuple):
+    id: str
+    camera: str
+    serial: str
+
+    @property
+    def sim_camera(self) -> bool:
+        return self.camera.partition(":")[0] in SIM_CAMERA_KINDS
+
+    @property
+    def sim_serial(self) -> bool:
+        return self.serial == "sim"
+
+
+def load_unit_configs(spec: str, default: UnitConfig) -> List[UnitConfig]:
+    """WINEQUEEN_UNITS 값(JSON 파일 경로 또는 JSON 문자열)을 읽어 유닛 목록을 만든다."""
+    if not spec:
+        return [default]
+    if os.path.exists(spec):
+        with open(spec) as f:
+            entries = json.load(f)
+    else:
+        entries = json.loads(spec)
+    configs = []
+    for entry in entries:
+        config = UnitConfig(str(entry["id"]), entry.get("camera", default.camera),
+                            entry.get("serial", default.serial))
+        if not _UNIT_ID.match(config.id):
+            raise ValueError(f"invalid unit id '{config.id}' (영문/숫자/-/_ 만 사용)")
+        configs.append(config)
+    ids = [c.id for c in configs]
+    if not configs or len(set(ids)) != len(ids):
+        raise ValueError(f"WINEQUEEN_UNITS must list unique unit ids: {ids}")
+    ports = [c.serial for c in configs if not c.sim_serial]
+    cameras = [c.camera for c in configs if not c.sim_camera]
+    if len(set(ports)) != len(ports) or len(set(cameras)) != len(cameras):
+        raise ValueError("units must not share a camera device or serial port")
+    return configs
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import threading
+import time
+
+from async_log import print_log
+
+
+class WSClient:
+    """WS 클라이언트 1개의 송신 상태.
+
+    - snapshot: 아직 보내지 못한 최신 감지/상태 스냅샷 1개 (새 것이 오면 덮어씀)
+    - events  : 버튼/리다이렉트 등 버리면 안 되는 메시지 (크기 제한, 넘치면 클라이언트 퇴출)
+    """
+
+    def __init__(self, ws, max_events: int):
+        self.ws = ws
+        self.snapshot = None
+        self.snapshot_ts = None  # 스냅샷 발행 시각 (time.monotonic)
+        self.events = []
+        self.max_events = max_events
+        self.wakeup = asyncio.Event()
+        self.coalesced = 0
+        self.task = None
+
+
+class WSBroadcaster:
+    """변경이 있을 때만 push하는 단일 WebSocket 브로드캐스터.
+
+    - publish_snapshot(): 감지/상태 스냅샷이 바뀌었을 때 호출 (임의 스레드). seq를 붙여 한 번만 직렬화
+    - publish_event()   : 버튼/리다이렉트 등 이벤트 (임의 스레드)
+    - 클라이언트마다 전용 송신 태스크가 동시에 전송하고, send_timeout을 넘기거나 이벤트 큐가
+      넘치는 느린 클라이언트는 연결을 끊음 (한 클라이언트가 전체를 막지 않음)
+    - metrics(PipelineMetrics)를 주면 스냅샷 발행→전송 완료 지연(ws_push)을 기록
+    """
+
+    def __init__(self, max_events: int = 16, send_timeout: float = 2.0, metrics=None, log=print_log):
+        self.metrics = metrics
+        self.log = log
+        self.max_events = max_events
+        self.send_timeout = send_timeout
+        self.clients = {}
+        self.seq = 0
+        self.last_snapshot = None
+        self.last_snapshot_ts = 0.0
+        self.evicted = 0
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def __len__(self):
+        return len(self.clients)
+
+    # ---------- 발행 (스레드 안전) ----------
+    def publish_snapshot(self, snapshot: dict) -> int:
+        with self._lock:
+            self.seq += 1
+            seq = self.seq
+            payload = json.dumps({**snapshot, "seq": seq})
+            self.last_snapshot = payload
+            self.last_snapshot_ts = time.monotonic()
+        self._call(self._fanout_snapshot, payload)
+        return seq
+
+    def publish_event(self, event: dict):
+        self._call(self._fanout_event, json.dumps(event))
+
+    def _call(self, fn, payload):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        if _running_loop() is loop:
+            fn(payload)
+        else:
+            loop.call_soon_threadsafe(fn, payload)
+
+    def _fanout_snapshot(self, payload):
+        for client in self.clients.values():
+            if client.snapshot is not None:
+                client.coalesced += 1
+            client.snapshot = payload
+            client.snapshot_ts = self.last_snapshot_ts
+            client.wakeup.set()
+
+    def _fanout_event(self, payload):
+        for client in list(self.clients.values()):
+            self._enqueue(client, payload)
+
+    def _enqueue(self, client, payload) -> bool:
+        """이벤트 큐에 추가. max_events가 넘치면 클라이언트를 퇴출하고 False."""
+        if len(client.events) >= client.max_events:
+            self._evict(client, "event queue full")
+            return False
+        client.events.append(payload)
+        client.wakeup.set()
+        return True
+
+    # ---------- 클라이언트 관리 ----------
+    def register(self, ws) -> WSClient:
+        client = WSClient(ws, self.max_events)
+        client.snapshot = self.last_snapshot  # 접속 직후 초기 상태 (지연 측정에서는 제외)
+        if client.snapshot is not None:
+            client.wakeup.set()
+        self.clients[id(ws)] = client
+        client.task = asyncio.create_task(self._sender(client))
+        return client
+
+    def unregister(self, ws):
+        client = self.clients.pop(id(ws), None)
+        if client is not None and client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    def send_to(self, ws, payload: dict) -> bool:
+        """특정 클라이언트에게만 보낼 메시지 (pong 등). 송신 태스크를 통해 순서 보장.
+
+        이벤트와 같은 큐/한도를 쓰므로 ping만 보내고 읽지 않는 클라이언트도 퇴출된다.
+        """
+        client = self.clients.get(id(ws))
+        if client is None:
+            return False
+        return self._enqueue(client, json.dumps(payload))
+
+    def _evict(self, client, reason):
+        self.log("WS", f"evicting slow client: {reason}", "warning")
+        self.evicted += 1
+        self.unregister(client.ws)
+        asyncio.create_task(_close_quietly(client.ws))
+
+    async def _sender(self, client: WSClient):
+        try:
+            while True:
+                await client.wakeup.wait()
+                client.wakeup.clear()
+                while client.events or client.snapshot is not None:
+                    published = None
+                    if client.events:
+                        payload = client.events.pop(0)
+                    else:
+                        payload, client.snapshot = client.snapshot, None
+                        published = client.snapshot_ts
+                    await asyncio.wait_for(client.ws.send_text(payload), self.send_timeout)
+                    if published is not None and self.metrics is not None:
+                        self.metrics.observe("ws_push", (time.monotonic() - published) * 1000)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self._evict(client, f"send timeout > {self.send_timeout}s")
+        except Exception:
+            self.unregister(client.ws)
+
+    def stats(self):
+        return {"clients": len(self.clients), "seq": self.seq, "evicted": self.evicted,
+                "coalesced": sum(c.coalesced for c in self.clients.values())}
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+async def _close_quietly(ws):
+    try:
+        await ws.close()
+    except Exception:
+        pass
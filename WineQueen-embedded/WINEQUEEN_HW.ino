@@ -201,8 +201,9 @@ bool camera_Align() {
     if (Serial.available() > 0) {
       char command = Serial.read();
       switch (command) {
-        case 'R': stepperX.move(3*16); break;
-        case 'L': stepperX.move(-3*16); break;
+        // 목표 위치에 누적: "LLL"처럼 연속 수신하면 3스텝 이동 (비례 정렬 제어)
+        case 'R': stepperX.moveTo(stepperX.targetPosition() + 3*16); break;
+        case 'L': stepperX.moveTo(stepperX.targetPosition() - 3*16); break;
         case 'C':
           stepperX.stop();
           return true;